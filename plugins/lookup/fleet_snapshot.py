@@ -0,0 +1,95 @@
+# (c) 2022, NetApp, Inc
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''
+fleet_snapshot lookup
+'''
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = '''
+name: fleet_snapshot
+short_description: Query a fleet snapshot written by na_cloudmanager_info
+version_added: 21.25.0
+author: NetApp Ansible Team (@carchi8py) <ng-ansibleteam@netapp.com>
+description:
+  - Answer questions about working environments, aggregates and volumes from the file written by the fleet_snapshot option of
+    na_cloudmanager_info, without calling Cloud Manager.
+  - The file is mapped in memory, and only the matching records are decoded.
+  - Lookups run on the controller, the file must be on the controller.
+options:
+  _terms:
+    description:
+      - Queries to run, results are concatenated.
+      - C(volume) returns the volumes named I(name), in I(svm_name) if set, with the working environment owning them.
+      - C(aggregates_over) returns the aggregates whose used size is above I(threshold) percent of their total size, most used first.
+    required: true
+    type: list
+    elements: str
+  path:
+    description:
+      - Path to the fleet snapshot file.
+    required: true
+    type: path
+  name:
+    description:
+      - Volume name, for the volume query.
+    type: str
+  svm_name:
+    description:
+      - SVM name, for the volume query.
+    type: str
+  threshold:
+    description:
+      - Utilization in percent, for the aggregates_over query.
+    type: float
+    default: 80
+'''
+
+EXAMPLES = '''
+- name: Find the working environment owning a volume
+  ansible.builtin.debug:
+    msg: "{{ lookup('netapp.cloudmanager.fleet_snapshot', 'volume', name='vol1', path='/var/tmp/cloudmanager_fleet.snapshot') }}"
+
+- name: List the aggregates over 90% full
+  ansible.builtin.debug:
+    msg: "{{ query('netapp.cloudmanager.fleet_snapshot', 'aggregates_over', threshold=90, path='/var/tmp/cloudmanager_fleet.snapshot') }}"
+'''
+
+RETURN = '''
+_raw:
+  description:
+    - one dictionary per matching volume or aggregate.
+    - the record keys, and working_environment_id, working_environment_name and working_environment_provider.
+    - sizes are in bytes, and null when unknown, aggregates_over adds the utilization in percent.
+  type: list
+  elements: dict
+'''
+
+from ansible.errors import AnsibleLookupError
+from ansible.plugins.lookup import LookupBase
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_columnar import FleetSnapshotReader
+
+
+class LookupModule(LookupBase):
+
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        path = self.get_option('path')
+        try:
+            reader = FleetSnapshotReader(path)
+        except (OSError, IOError, ValueError) as exc:
+            raise AnsibleLookupError('Error: reading fleet snapshot %s: %s' % (path, str(exc)))
+        results = []
+        with reader:
+            for term in terms:
+                if term == 'volume':
+                    if not self.get_option('name'):
+                        raise AnsibleLookupError('Error: name is required for the volume query')
+                    results.extend(reader.find_volumes(self.get_option('name'), self.get_option('svm_name')))
+                elif term == 'aggregates_over':
+                    results.extend(reader.find_aggregates_over(self.get_option('threshold')))
+                else:
+                    raise AnsibleLookupError('Error: unknown fleet_snapshot query %s, expecting volume or aggregates_over' % term)
+        return results
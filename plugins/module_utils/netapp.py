@@ -33,9 +33,15 @@ netapp.py: wrapper around send_requests and other utilities
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
-import logging
+import hashlib
+import threading
 import time
 from ansible.module_utils.basic import missing_required_lib
+from ansible.module_utils.six.moves.urllib.parse import urlparse
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import WorkingEnvironmentSnapshot
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cassette import Cassette
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_ratelimit import RateLimiter
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_trace import get_trace_sink
 
 try:
     from ansible.module_utils.ansible_release import __version__ as ansible_version
@@ -88,8 +94,9 @@ POW2_BYTE_MAP = dict(
 )
 
 
-LOG = logging.getLogger(__name__)
 LOG_FILE = '/tmp/cloudmanager_apis.log'
+# get a new token when the current one expires within this number of seconds
+TOKEN_REFRESH_MARGIN = 300
 
 
 def cloudmanager_host_argument_spec():
@@ -115,10 +122,21 @@ def get_feature(module, feature_name):
         otherwise, use our default
     '''
     default_flags = dict(
-        trace_apis=False,                       # if True, append REST requests/responses to /tmp/cloudmanager_apis.log
-        trace_headers=False,                    # if True, and if trace_apis is True, include <large> headers in trace
+        trace_apis=False,                       # if True, append REST requests/responses as JSON lines to trace_file
+        trace_headers=False,                    # if True, and if trace_apis is True, include <large> headers in trace, secrets are redacted
+        trace_file=LOG_FILE,
+        trace_max_bytes=10 * 1024 ** 2,         # the trace file is rotated when it reaches this size, 0 to never rotate it
+        trace_backup_count=3,                   # number of rotated trace files to keep
+        trace_body_limit=4096,                  # request and response bodies are truncated to this number of characters, 0 for no limit
+        trace_sample_rate=1.0,                  # ratio of successful requests to trace, errors are always traced
+        cassette_mode=None,                     # 'record' to append responses to cassette_file, 'replay' to use them instead of sending requests
+        cassette_file=None,
+        cassette_time_scale=1.0,                # in replay mode, wait for the recorded time multiplied by this factor, 0 for no wait
         show_modified=True,
         simulator=False,                        # if True, it is running on simulator
+        rate_limits=None,                       # dict of <host key>: <requests per second>, shared by all processes on the controller
+        account_cache_ttl=None,                 # if set, accounts for the current user are cached on the controller for this number of seconds
+        working_environments_cache_ttl=None,    # if set, working environment lists and details are cached on the controller for this number of seconds
     )
 
     if module.params['feature_flags'] is not None and feature_name in module.params['feature_flags']:
@@ -144,16 +162,85 @@ class CloudManagerRestAPI(object):
         self.url = 'https://'
         self.api_root_path = None
         self.check_required_library()
-        if has_feature(module, 'trace_apis'):
-            logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG, format='%(asctime)s %(levelname)-8s %(message)s')
-        self.log_headers = has_feature(module, 'trace_headers')     # requires trace_apis to do anything
+        self.trace_sink = self.get_trace_sink()
+        self.cassette = self.get_cassette()
+        self.we_snapshot = self.get_we_snapshot()
         self.simulator = has_feature(module, 'simulator')
+        self.rate_limiter = self.get_rate_limiter()
+        # set by get_token, if the token response includes expires_in
+        self.token_expires_at = None
+        self.token_lock = threading.RLock()
+        # tokens replaced by renew_token, as '<type> <token>'
+        self.expired_tokens = set()
         self.token_type, self.token = self.get_token()
 
     def check_required_library(self):
         if not HAS_REQUESTS:
             self.module.fail_json(msg=missing_required_lib('requests'))
 
+    def get_rate_limiter(self):
+        rate_limits = get_feature(self.module, 'rate_limits')
+        if not rate_limits:
+            return None
+        if not isinstance(rate_limits, dict) or\
+                not all(isinstance(rate, (int, float)) and not isinstance(rate, bool) and rate > 0 for rate in rate_limits.values()):
+            self.module.fail_json(msg="Error: expected a dict of positive numbers for feature flag: rate_limits, found %s" % repr(rate_limits))
+        return RateLimiter(rate_limits)
+
+    def get_trace_sink(self):
+        if not has_feature(self.module, 'trace_apis'):
+            return None
+        options = dict(include_headers=has_feature(self.module, 'trace_headers'))
+        for option, flag, minimum in (('max_bytes', 'trace_max_bytes', 0), ('backup_count', 'trace_backup_count', 0), ('body_limit', 'trace_body_limit', 0)):
+            value = get_feature(self.module, flag)
+            if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+                self.module.fail_json(msg="Error: expected a positive or null integer for feature flag: %s, found %s" % (flag, repr(value)))
+            options[option] = value
+        sample_rate = get_feature(self.module, 'trace_sample_rate')
+        if not isinstance(sample_rate, (int, float)) or isinstance(sample_rate, bool) or not 0 <= sample_rate <= 1:
+            self.module.fail_json(msg="Error: expected a number between 0 and 1 for feature flag: trace_sample_rate, found %s" % repr(sample_rate))
+        options['sample_rate'] = sample_rate
+        trace_file = get_feature(self.module, 'trace_file')
+        try:
+            return get_trace_sink(trace_file, **options)
+        except (OSError, IOError) as exc:
+            self.module.fail_json(msg="Error: cannot trace to %s: %s" % (trace_file, exc))
+
+    def get_cassette(self):
+        mode = get_feature(self.module, 'cassette_mode')
+        if mode is None:
+            return None
+        if mode not in ('record', 'replay'):
+            self.module.fail_json(msg="Error: expected record or replay for feature flag: cassette_mode, found %s" % repr(mode))
+        path = get_feature(self.module, 'cassette_file')
+        if not path:
+            self.module.fail_json(msg="Error: feature flag cassette_file is required with cassette_mode")
+        time_scale = get_feature(self.module, 'cassette_time_scale')
+        if not isinstance(time_scale, (int, float)) or isinstance(time_scale, bool) or time_scale < 0:
+            self.module.fail_json(msg="Error: expected a positive number for feature flag: cassette_time_scale, found %s" % repr(time_scale))
+        try:
+            return Cassette(path, mode, time_scale)
+        except (IOError, OSError, ValueError, KeyError) as exc:
+            self.module.fail_json(msg="Error: cannot read cassette %s: %s" % (path, repr(exc)))
+
+    def get_user_key(self):
+        ''' the tokens change from run to run, the credentials used to get them identify the user '''
+        credentials = self.sa_client_id or self.refresh_token or ''
+        return '%s:%s' % (self.environment, hashlib.sha256(credentials.encode('utf-8')).hexdigest())
+
+    def get_we_snapshot(self):
+        ttl = get_feature(self.module, 'working_environments_cache_ttl')
+        if not ttl:
+            return None
+        if not isinstance(ttl, int) or isinstance(ttl, bool) or ttl < 0:
+            self.module.fail_json(msg="Error: expected a positive integer for feature flag: working_environments_cache_ttl, found %s" % repr(ttl))
+        return WorkingEnvironmentSnapshot(self.get_user_key(), ttl)
+
+    def invalidate_working_environments(self):
+        ''' to be called when a working environment is created, modified, or deleted '''
+        if self.we_snapshot is not None:
+            self.we_snapshot.invalidate()
+
     def format_client_id(self, client_id):
         return client_id if client_id.endswith('clients') else client_id + 'clients'
 
@@ -165,27 +252,75 @@ class CloudManagerRestAPI(object):
         prefix = self.environment_data['CLOUD_MANAGER_HOST'] if self.environment_data['CLOUD_MANAGER_HOST'] not in self.url and api.startswith('/') else ''
         return self.url + prefix + api
 
-    def send_request(self, method, api, params, json=None, data=None, header=None, authorized=True):
-        ''' send http request and process response, including error conditions '''
+    def send_request(self, method, api, params, json=None, data=None, header=None, authorized=True, timeout=None):
+        ''' send http request and process response, including error conditions
+            timeout, in seconds, overrides the default timeout for this request
+        '''
         url = self.build_url(api)
         headers = {
             'Content-type': "application/json",
             'Referer': "Ansible_NetApp",
         }
+        token = None
         if authorized:
-            headers['Authorization'] = self.token_type + " " + self.token
+            token = self.token_type + " " + self.token
+            if self.is_token_expiring():
+                token, error = self.renew_token(token)
+                if error is not None:
+                    return None, error, None
+            headers['Authorization'] = token
         if header is not None:
             headers.update(header)
+            # the caller may have copied a token that was just renewed
+            self.update_token_in_headers(headers, token)
+        token_renewed = False
         for __ in range(3):
-            json_dict, error_details, on_cloud_request_id = self._send_request(method, url, params, json, data, headers)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(urlparse(url).netloc)
+            json_dict, error_details, on_cloud_request_id = self._send_request(method, url, params, json, data, headers, timeout)
             # we observe this error with DELETE on agents-mgmt/agent (and sometimes on GET)
             if error_details is not None and 'Max retries exceeded with url:' in error_details:
                 time.sleep(5)
+            # the rate limiter delays the next attempt
+            elif error_details == '429' and self.rate_limiter is not None:
+                continue
+            # the token may have expired or been revoked, retry once with a new token
+            elif error_details == '401' and not token_renewed and token is not None and token in headers.values():
+                token_renewed = True
+                token, error = self.renew_token(token)
+                if error is not None:
+                    return json_dict, error, on_cloud_request_id
+                self.update_token_in_headers(headers, token)
             else:
                 break
         return json_dict, error_details, on_cloud_request_id
 
-    def _send_request(self, method, url, params, json, data, headers):
+    def is_token_expiring(self):
+        return self.token_expires_at is not None and time.time() > self.token_expires_at - TOKEN_REFRESH_MARGIN
+
+    def renew_token(self, expired_token):
+        '''
+        Get a new token, unless another thread already replaced expired_token
+        Return the current token, as used in the Authorization header, and an error if a new token cannot be acquired
+        '''
+        with self.token_lock:
+            if self.token_type + " " + self.token == expired_token:
+                token_type, token, error = self.request_token()
+                if error is not None:
+                    return None, error
+                self.expired_tokens.add(expired_token)
+                self.token_type, self.token = token_type, token
+            return self.token_type + " " + self.token, None
+
+    def update_token_in_headers(self, headers, token):
+        ''' Authorization and X-User-Token are replaced if they carry an older Cloud Manager token, other tokens are preserved '''
+        if token is None:
+            return
+        for name in ('Authorization', 'X-User-Token'):
+            if headers.get(name) in self.expired_tokens:
+                headers[name] = token
+
+    def _send_request(self, method, url, params, json, data, headers, timeout=None):
         json_dict = None
         json_error = None
         error_details = None
@@ -203,40 +338,38 @@ class CloudManagerRestAPI(object):
             success_code = [200, 201, 202]
             if response.status_code not in success_code:
                 error = json.get('message')
-                self.log_error(response.status_code, 'HTTP error: %s' % error)
             return json, error
 
-        self.log_request(method=method, url=url, params=params, json=json, data=data, headers=headers)
+        start = time.time()
         try:
-            response = requests.request(method, url, headers=headers, timeout=self.timeout, params=params, json=json, data=data)
+            if self.cassette is not None and self.cassette.replaying:
+                response = self.cassette.replay(method, url, params)
+            else:
+                response = requests.request(method, url, headers=headers, timeout=timeout or self.timeout, params=params, json=json, data=data)
             status_code = response.status_code
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(urlparse(url).netloc, status_code, response.headers.get('Retry-After'))
             if status_code >= 300 or status_code < 200:
-                self.log_error(status_code, 'HTTP status code error: %s' % response.content)
-                return response.content, str(status_code), on_cloud_request_id
-            # If the response was successful, no Exception will be raised
-            json_dict, json_error = get_json(response)
-            if response.headers.get('OnCloud-Request-Id', '') != '':
-                on_cloud_request_id = response.headers.get('OnCloud-Request-Id')
-        except requests.exceptions.HTTPError as err:
-            self.log_error(status_code, 'HTTP error: %s' % err)
-            error_details = str(err)
-        except requests.exceptions.ConnectionError as err:
-            self.log_error(status_code, 'Connection error: %s' % err)
-            error_details = str(err)
+                json_dict, error_details = response.content, str(status_code)
+            else:
+                # If the response was successful, no Exception will be raised
+                json_dict, json_error = get_json(response)
+                if response.headers.get('OnCloud-Request-Id', '') != '':
+                    on_cloud_request_id = response.headers.get('OnCloud-Request-Id')
         except Exception as err:
-            self.log_error(status_code, 'Other error: %s' % err)
             error_details = str(err)
         if json_error is not None:
-            self.log_error(status_code, 'Endpoint error: %d: %s' % (status_code, json_error))
             error_details = json_error
-        if response:
-            self.log_debug(status_code, response.content)
+        if self.cassette is not None and not self.cassette.replaying:
+            self.cassette.record(method, url, params, json, data, response, error_details, time.time() - start)
+        if self.trace_sink is not None:
+            self.trace_sink.trace(method, url, params, json, data, headers, response, status_code, error_details, time.time() - start, on_cloud_request_id)
         return json_dict, error_details, on_cloud_request_id
 
     # If an error was reported in the json payload, it is handled below
-    def get(self, api, params=None, header=None):
+    def get(self, api, params=None, header=None, timeout=None):
         method = 'GET'
-        return self.send_request(method=method, api=api, params=params, json=None, header=header)
+        return self.send_request(method=method, api=api, params=params, json=None, header=header, timeout=timeout)
 
     def post(self, api, data, params=None, header=None, gcp_type=False, authorized=True):
         method = 'POST'
@@ -258,6 +391,16 @@ class CloudManagerRestAPI(object):
         return self.send_request(method=method, api=api, params=params, json=data, header=header)
 
     def get_token(self):
+        token_type, token, error = self.request_token()
+        if error is not None:
+            self.module.fail_json(msg=error)
+        return token_type, token
+
+    def request_token(self):
+        '''
+        Return token_type, token, and error
+        Does not call fail_json, as it may run in a worker thread when the token is renewed
+        '''
         if self.sa_client_id is not None and self.sa_client_id != "" and self.sa_secret_key is not None and self.sa_secret_key != "":
             response, error, ocr_id = self.post(self.environment_data['SA_AUTH_HOST'],
                                                 data={"grant_type": "client_credentials", "client_secret": self.sa_secret_key,
@@ -270,14 +413,16 @@ class CloudManagerRestAPI(object):
                                                       "audience": "https://api.cloud.netapp.com"},
                                                 authorized=False)
         else:
-            self.module.fail_json(msg='Missing refresh_token or sa_client_id and sa_secret_key')
+            return None, None, 'Missing refresh_token or sa_client_id and sa_secret_key'
 
         if error:
-            self.module.fail_json(msg='Error acquiring token: %s, %s' % (str(error), str(response)))
+            return None, None, 'Error acquiring token: %s, %s' % (str(error), str(response))
         token = response['access_token']
         token_type = response['token_type']
+        expires_in = response.get('expires_in')
+        self.token_expires_at = time.time() + int(expires_in) if expires_in else None
 
-        return token_type, token
+        return token_type, token, None
 
     def wait_on_completion(self, api_url, action_name, task, retries, wait_interval):
         while True:
@@ -311,22 +456,3 @@ class CloudManagerRestAPI(object):
                 response = result
                 break
         return response['status'], response['error'], None
-
-    def log_error(self, status_code, message):
-        LOG.error("%s: %s", status_code, message)
-
-    def log_debug(self, status_code, content):
-        LOG.debug("%s: %s", status_code, content)
-
-    def log_request(self, method, params, url, json, data, headers):
-        contents = {
-            'method': method,
-            'url': url,
-            'json': json,
-            'data': data
-        }
-        if params:
-            contents['params'] = params
-        if self.log_headers:
-            contents['headers'] = headers
-        self.log_debug('sending', repr(contents))
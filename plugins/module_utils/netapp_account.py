@@ -0,0 +1,188 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_account.py: accounts and agents for the current user, fetched once per run
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import threading
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_FUTURES = True
+except ImportError:
+    # python 2.7 without the futures backport, accounts are fetched sequentially
+    HAS_FUTURES = False
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache
+
+
+class AccountContext(object):
+    ''' accounts and agents, fetched once per run using the helpers in NetAppModule
+        accounts are also persisted across runs with FileCache when cache_ttl is set, for the current user and environment
+        agents are only kept for the current run, as connectors are created and deleted
+    '''
+    def __init__(self, rest_api, helper, cache_ttl=None, cache_dir=None):
+        self.rest_api = rest_api
+        self.helper = helper
+        self.cache_ttl = cache_ttl
+        self.store = FileCache('accounts', cache_dir) if cache_ttl else None
+        self.lock = threading.Lock()
+        self.accounts = None
+        self.account_id = None
+        self.agents = {}
+        self.agents_locks = {}
+
+    def get_cache_key(self):
+        return self.rest_api.get_user_key()
+
+    def load(self):
+        if self.accounts is None and self.account_id is None and self.store is not None:
+            cached = self.store.get(self.get_cache_key())
+            if isinstance(cached, dict):
+                self.accounts = cached.get('accounts')
+                self.account_id = cached.get('account_id')
+
+    def save(self):
+        if self.store is not None:
+            self.store.set(self.get_cache_key(), dict(accounts=self.accounts, account_id=self.account_id), self.cache_ttl)
+
+    def get_account_info(self, rest_api=None, headers=None):
+        ''' same as NetAppModule.get_account_info, the arguments are ignored and only kept for compatibility '''
+        with self.lock:
+            self.load()
+            if self.accounts is None:
+                accounts, error = self.helper.get_account_info(self.rest_api)
+                if error is not None:
+                    return None, error
+                self.accounts = accounts
+                self.save()
+            return self.accounts, None
+
+    def get_account_id(self):
+        ''' same as NetAppModule.get_account_id '''
+        accounts, error = self.get_account_info()
+        if error:
+            return None, error
+        if not accounts:
+            return None, 'Error: no account found - check credentials or provide account_id.'
+        return accounts[0]['accountPublicId'], None
+
+    def get_or_create_account(self):
+        ''' same as NetAppModule.get_or_create_account '''
+        with self.lock:
+            self.load()
+            if self.accounts:
+                return self.accounts[0]['accountPublicId'], None
+            if self.account_id is None:
+                account_id, error = self.helper.get_or_create_account(self.rest_api)
+                if error is not None:
+                    return account_id, error
+                self.account_id = account_id
+                self.save()
+            return self.account_id, None
+
+    def get_account_ids(self, all_accounts=False):
+        ''' the first account, or all the accounts for the user '''
+        if not all_accounts:
+            account_id, error = self.get_account_id()
+            return (None, error) if error else ([account_id], None)
+        accounts, error = self.get_account_info()
+        if error:
+            return None, error
+        if not accounts:
+            return None, 'Error: no account found - check credentials or provide account_id.'
+        return [account['accountPublicId'] for account in accounts], None
+
+    def get_agents(self, account_id):
+        ''' agents for an account, as returned by /agents-mgmt/agent, only errors are not remembered
+            concurrent callers for the same account wait for a single request
+        '''
+        with self.lock:
+            agents_lock = self.agents_locks.setdefault(account_id, threading.Lock())
+        with agents_lock:
+            if account_id in self.agents:
+                return self.agents[account_id], None
+            agents, error = self.helper.get_occm_agents_by_account(self.rest_api, account_id)
+            if error is None:
+                self.agents[account_id] = agents
+        return agents, error
+
+    def get_agents_for_accounts(self, account_ids, max_workers=4):
+        ''' agents for several accounts, fetched concurrently, merged in a single list
+            each agent is copied with the id of its account in accountId, as the records do not report it
+            return a list of agents, and the first error if any
+        '''
+        if HAS_FUTURES:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(account_ids))) as executor:
+                results = list(executor.map(self.get_agents, account_ids))
+        else:
+            results = [self.get_agents(account_id) for account_id in account_ids]
+        merged = []
+        for account_id, (agents, error) in zip(account_ids, results):
+            if error is not None:
+                return agents, error
+            if isinstance(agents, dict) and 'agents' in agents:
+                # the agents are shared with other subsets, and are not modified
+                merged.extend(dict(agent, accountId=account_id) for agent in agents['agents'])
+        return merged, None
+
+    def get_agents_info(self, all_accounts=False):
+        ''' same as NetAppModule.get_agents_info, for the first account or for all accounts
+            with all_accounts, each agent reports the id of its account in accountId
+        '''
+        account_ids, error = self.get_account_ids(all_accounts)
+        if error:
+            return None, error
+        if not all_accounts:
+            return self.get_agents(account_ids[0])
+        agents, error = self.get_agents_for_accounts(account_ids)
+        if error is not None:
+            return agents, error
+        return {'agents': agents}, None
+
+    def get_active_agents_info(self, all_accounts=False):
+        ''' same as NetAppModule.get_active_agents_info, for the first account or for all accounts
+            with all_accounts, each agent reports the id of its account in account_id
+        '''
+        agents, error = self.get_agents_info(all_accounts)
+        if error and agents is None:
+            return None, error
+        clients = []
+        if isinstance(agents, dict) and 'agents' in agents:
+            for agent in agents['agents']:
+                if agent['status'] != 'active':
+                    continue
+                client = {'name': agent['name'], 'client_id': agent['agentId'], 'provider': agent['provider']}
+                if all_accounts:
+                    client['account_id'] = agent['accountId']
+                clients.append(client)
+        return clients, error
@@ -0,0 +1,197 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_cache.py: a small JSON file cache shared across tasks and forks
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from contextlib import contextmanager
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+# per user, the cache holds tokens and account data
+CACHE_DIR = os.path.expanduser('~/.ansible/tmp/cloudmanager_cache')
+
+
+class FileCache(object):
+    ''' key/value store persisted as a JSON file, with a TTL on each entry
+        a lock file serializes read-modify-write cycles across processes
+        errors reading or writing the cache are ignored, the cache is only an optimization
+    '''
+    def __init__(self, name, cache_dir=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.path = os.path.join(self.cache_dir, name + '.json')
+        self.lock_path = self.path + '.lock'
+        self._lock_fd = None
+        self._lock_depth = 0
+        # flock does not exclude threads sharing this object
+        self._thread_lock = threading.RLock()
+
+    def _make_dir(self):
+        ''' create the cache directory if needed, and refuse a directory that is not private to the current user '''
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, 0o700)
+        self._check_dir()
+
+    def _check_dir(self):
+        ''' raise OSError unless the cache directory is a real directory owned by the current user, with mode 0700 '''
+        dir_stat = os.lstat(self.cache_dir)
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            raise OSError('cache directory %s is not a directory' % self.cache_dir)
+        if hasattr(os, 'getuid') and dir_stat.st_uid != os.getuid():
+            raise OSError('cache directory %s is not owned by the current user' % self.cache_dir)
+        if stat.S_IMODE(dir_stat.st_mode) != 0o700:
+            raise OSError('cache directory %s mode is %o, expecting 700' % (self.cache_dir, stat.S_IMODE(dir_stat.st_mode)))
+
+    @contextmanager
+    def lock(self):
+        ''' exclusive lock on the cache file, across processes if fcntl is available, and across threads
+            the lock is reentrant, so that a caller can hold it across get and set
+        '''
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                try:
+                    self._make_dir()
+                    self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+                    if HAS_FCNTL:
+                        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+                except (OSError, IOError):
+                    self._lock_fd = None
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_fd is not None:
+                    if HAS_FCNTL:
+                        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+
+    def load(self):
+        ''' return all entries, or an empty dict if the file is missing or corrupted '''
+        try:
+            self._check_dir()
+            with open(self.path) as fh:
+                entries = json.load(fh)
+        except (OSError, IOError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def save(self, entries):
+        ''' write all entries, using a rename so that readers never see a partial file '''
+        tmp_path = None
+        try:
+            self._make_dir()
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp_')
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(entries, fh)
+            os.rename(tmp_path, self.path)
+        except (OSError, IOError, TypeError, ValueError):
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+
+    @staticmethod
+    def is_fresh(entry, now=None):
+        if not isinstance(entry, dict) or 'value' not in entry:
+            return False
+        expires = entry.get('expires')
+        return expires is None or expires > (now or time.time())
+
+    def get(self, key):
+        ''' return the cached value for key, or None if absent or expired '''
+        entry = self.load().get(key)
+        if self.is_fresh(entry):
+            return entry['value']
+        return None
+
+    def set(self, key, value, ttl=None):
+        ''' store value for key, ttl is in seconds, None means the entry never expires '''
+        now = time.time()
+        with self.lock():
+            entries = self.load()
+            # drop expired entries while we are here
+            entries = dict((k, v) for k, v in entries.items() if self.is_fresh(v, now))
+            entries[key] = dict(value=value, timestamp=now, expires=None if ttl is None else now + ttl)
+            return self.save(entries)
+
+    def delete(self, key=None):
+        ''' remove an entry, or all entries if key is None '''
+        with self.lock():
+            if key is None:
+                return self.save({})
+            entries = self.load()
+            if key in entries:
+                del entries[key]
+                return self.save(entries)
+        return True
+
+
+class WorkingEnvironmentSnapshot(object):
+    ''' working environment lists and details, cached on the controller for a short time, so that repeated tasks look them up locally
+        entries are keyed by user, connector (X-Agent-Id header), and item, for instance 'list' or 'details:<id>'
+        modules that create, modify, or delete a working environment call invalidate
+    '''
+    def __init__(self, user_key, ttl, cache_dir=None):
+        self.user_key = user_key
+        self.ttl = ttl
+        self.store = FileCache('working_environments', cache_dir)
+
+    def get_key(self, headers, item):
+        return '%s:%s:%s' % (self.user_key, (headers or {}).get('X-Agent-Id', ''), item)
+
+    def get(self, headers, item):
+        return self.store.get(self.get_key(headers, item))
+
+    def set(self, headers, item, value):
+        return self.store.set(self.get_key(headers, item), value, self.ttl)
+
+    def invalidate(self):
+        ''' remove all entries for the user, for all connectors '''
+        prefix = self.user_key + ':'
+        with self.store.lock():
+            entries = self.store.load()
+            kept = dict((key, value) for key, value in entries.items() if not key.startswith(prefix))
+            if len(kept) < len(entries):
+                return self.store.save(kept)
+        return True
@@ -0,0 +1,219 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+netapp_capacity.py: capacity rollups over aggregates and volumes, stored as typed columns
+NumPy is used when available, with the same results computed with the array module otherwise
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from array import array
+import heapq
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_replication import to_bytes
+
+PERCENTILES = (50, 90, 95, 99, 100)
+
+
+class StringTable(object):
+    ''' intern strings as small integers, in order of first appearance '''
+    def __init__(self):
+        self.strings = []
+        self.indexes = {}
+
+    def index(self, value):
+        if value not in self.indexes:
+            self.indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return self.indexes[value]
+
+
+def aggregate_capacity(aggregate):
+    ''' total and used sizes of an aggregate, the used size is derived from the available size when not reported '''
+    total = to_bytes(aggregate.get('totalCapacity'))
+    used = to_bytes(aggregate.get('usedCapacity'))
+    available = to_bytes(aggregate.get('availableCapacity'))
+    if used is None and total is not None and available is not None:
+        used = total - available
+    return total, used
+
+
+def group_sums(keys, values, count, use_numpy):
+    ''' sum values by key, keys are indexes between 0 and count - 1 '''
+    if use_numpy:
+        if not keys:
+            return [0.0] * count
+        return numpy.bincount(numpy.frombuffer(keys, dtype=keys.typecode), weights=numpy.frombuffer(values, dtype=values.typecode),
+                              minlength=count).tolist()
+    sums = [0.0] * count
+    for key, value in zip(keys, values):
+        sums[key] += value
+    return sums
+
+
+def percentiles(values, use_numpy):
+    ''' linear interpolation between closest ranks, as numpy.percentile does by default '''
+    if not values:
+        return dict(('p%d' % percentile, None) for percentile in PERCENTILES)
+    if use_numpy:
+        results = numpy.percentile(numpy.frombuffer(values, dtype=values.typecode), PERCENTILES).tolist()
+    else:
+        ordered = sorted(values)
+        results = []
+        for percentile in PERCENTILES:
+            rank = (len(ordered) - 1) * percentile / 100.0
+            lower = int(rank)
+            upper = min(lower + 1, len(ordered) - 1)
+            results.append(ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower))
+    return dict(('p%d' % percentile, round(result, 2)) for percentile, result in zip(PERCENTILES, results))
+
+
+def top_indexes(values, count, use_numpy):
+    ''' indexes of the count largest values, ties are kept in row order '''
+    if use_numpy:
+        return numpy.argsort(-numpy.frombuffer(values, dtype=values.typecode), kind='stable')[:count].tolist()
+    return heapq.nlargest(count, range(len(values)), key=values.__getitem__)
+
+
+class CapacityTable(object):
+    ''' one row per aggregate or volume, with a total and a used size in bytes, and interned working environment, provider and tier keys
+        rows without a known total are ignored
+    '''
+    GROUPS = ('working_environment', 'provider', 'tier')
+
+    def __init__(self, use_numpy=None):
+        self.use_numpy = HAS_NUMPY if use_numpy is None else use_numpy
+        self.total = array('d')
+        self.used = array('d')
+        self.keys = dict((group, array('l')) for group in self.GROUPS)
+        self.strings = dict((group, StringTable()) for group in self.GROUPS)
+        # only read for the top consumers
+        self.labels = []
+
+    def __len__(self):
+        return len(self.total)
+
+    def add(self, total, used, label, **keys):
+        total = to_bytes(total)
+        if total is None:
+            return False
+        used = to_bytes(used)
+        self.total.append(total)
+        self.used.append(used or 0)
+        for group in self.GROUPS:
+            self.keys[group].append(self.strings[group].index(keys.get(group)))
+        self.labels.append(label)
+        return True
+
+    def utilization(self):
+        ''' used as a percentage of total, for rows with a non zero total '''
+        if self.use_numpy:
+            total = numpy.frombuffer(self.total, dtype='d')
+            used = numpy.frombuffer(self.used, dtype='d')
+            mask = total > 0
+            return array('d', (used[mask] * 100.0 / total[mask]).tobytes())
+        return array('d', [used * 100.0 / total for total, used in zip(self.total, self.used) if total > 0])
+
+    def groups(self, group):
+        ''' totals for each key of a group '''
+        strings = self.strings[group].strings
+        counts = group_sums(self.keys[group], array('d', [1.0]) * len(self), len(strings), self.use_numpy)
+        totals = group_sums(self.keys[group], self.total, len(strings), self.use_numpy)
+        used = group_sums(self.keys[group], self.used, len(strings), self.use_numpy)
+        return dict(('unknown' if key is None else str(key),
+                     dict(count=int(counts[index]), total_bytes=int(totals[index]), used_bytes=int(used[index]),
+                          available_bytes=int(totals[index] - used[index])))
+                    for index, key in enumerate(strings))
+
+    def top(self, count, by_utilization):
+        ''' the rows with the highest utilization, or the highest used size '''
+        if by_utilization and self.use_numpy:
+            total = numpy.frombuffer(self.total, dtype='d')
+            ratios = numpy.full(len(self), -1.0)
+            numpy.divide(numpy.frombuffer(self.used, dtype='d'), total, out=ratios, where=total > 0)
+            values = array('d', ratios.tobytes())
+        elif by_utilization:
+            # rows with a zero total sort last
+            values = array('d', [used / total if total > 0 else -1.0 for total, used in zip(self.total, self.used)])
+        else:
+            values = self.used
+        return [dict(self.labels[index], total_bytes=int(self.total[index]), used_bytes=int(self.used[index]),
+                     utilization=round(self.used[index] * 100.0 / self.total[index], 2) if self.total[index] > 0 else None)
+                for index in top_indexes(values, count, self.use_numpy)]
+
+    def summary(self, top_count, by_utilization=True):
+        total = sum(self.total)
+        used = sum(self.used)
+        return dict(
+            count=len(self),
+            total_bytes=int(total),
+            used_bytes=int(used),
+            available_bytes=int(total - used),
+            utilization_percentiles=percentiles(self.utilization(), self.use_numpy),
+            by_working_environment=self.groups('working_environment'),
+            by_provider=self.groups('provider'),
+            by_tier=self.groups('tier'),
+            top=self.top(top_count, by_utilization),
+        )
+
+
+class CapacitySummary(object):
+    ''' capacity of aggregates and volumes, added one working environment at a time '''
+    def __init__(self, use_numpy=None):
+        self.aggregates = CapacityTable(use_numpy)
+        self.volumes = CapacityTable(use_numpy)
+
+    def add_aggregates(self, working_environment_id, provider, aggregates):
+        for aggregate in aggregates or []:
+            total, used = aggregate_capacity(aggregate)
+            provider_volumes = aggregate.get('providerVolumes') or [{}]
+            self.aggregates.add(total, used, dict(working_environment_id=working_environment_id, name=aggregate.get('name')),
+                                working_environment=working_environment_id, provider=provider, tier=provider_volumes[0].get('diskType'))
+
+    def add_volumes(self, working_environment_id, provider, volumes):
+        for volume in volumes or []:
+            self.volumes.add(volume.get('size'), volume.get('usedSize'),
+                             dict(working_environment_id=working_environment_id, svm_name=volume.get('svmName'), name=volume.get('name')),
+                             working_environment=working_environment_id, provider=provider, tier=volume.get('providerVolumeType'))
+
+    def summary(self, top_count):
+        ''' aggregates are ranked by utilization, volumes by used size '''
+        return dict(
+            backend='numpy' if self.aggregates.use_numpy else 'array',
+            aggregates=self.aggregates.summary(top_count),
+            volumes=self.volumes.summary(top_count, by_utilization=False),
+        )
@@ -0,0 +1,127 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_cassette.py: record REST responses to a file, and replay them offline
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from collections import deque
+import json
+import threading
+import time
+
+from ansible.module_utils.six import string_types
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_trace import format_body, redact
+
+# response headers used by the modules, other headers are not recorded
+RECORDED_HEADERS = ('Content-Type', 'Location', 'OnCloud-Request-Id', 'Retry-After')
+
+
+class CassetteError(Exception):
+    ''' a request has no recorded response, or the recorded request failed '''
+
+
+class CassetteResponse(object):
+    ''' the subset of a requests response used by CloudManagerRestAPI '''
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class Cassette(object):
+    ''' in record mode, append a JSON line to path for each request: request, response, elapsed time or error
+        in replay mode, return the recorded responses, without sending the requests
+        requests are matched on method, url, and params, in recorded order, the last response is repeated when the records are exhausted
+        the replay waits for the recorded elapsed time multiplied by time_scale, 0 to replay without waiting
+        secrets are redacted in the records, tokens are replayed as a placeholder value
+    '''
+    def __init__(self, path, mode, time_scale=1.0):
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.lock = threading.Lock()
+        self.responses = {}
+        if mode == 'replay':
+            self.load()
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    @staticmethod
+    def get_key(method, url, params):
+        return '%s %s %s' % (method, url, json.dumps(params or {}, sort_keys=True, default=str))
+
+    def load(self):
+        ''' raise IOError or ValueError if the file cannot be read '''
+        with open(self.path) as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = self.get_key(record['method'], record['url'], record.get('params'))
+                self.responses.setdefault(key, deque()).append(record)
+
+    def record(self, method, url, params, json_body, data, response, error, elapsed):
+        record = dict(method=method, url=url, elapsed=round(elapsed, 3))
+        if params:
+            record['params'] = redact(params)
+        if json_body is not None or data is not None:
+            record['request_body'] = redact(json_body) if json_body is not None else format_body(data, 0)
+        if response is None:
+            record['error'] = error
+        else:
+            record['status_code'] = response.status_code
+            record['headers'] = dict((name, response.headers[name]) for name in RECORDED_HEADERS if name in response.headers)
+            content = format_body(response.content, 0)
+            record['json' if not isinstance(content, string_types) else 'content'] = content
+        line = json.dumps(record, default=str, sort_keys=True) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as fh:
+                fh.write(line)
+
+    def replay(self, method, url, params):
+        ''' return a CassetteResponse, or raise CassetteError '''
+        with self.lock:
+            records = self.responses.get(self.get_key(method, url, params))
+            if not records:
+                raise CassetteError('no recorded response for %s %s' % (method, url))
+            record = records.popleft() if len(records) > 1 else records[0]
+        if self.time_scale:
+            time.sleep(record.get('elapsed', 0) * self.time_scale)
+        if 'error' in record:
+            raise CassetteError(record['error'])
+        content = json.dumps(record['json']) if 'json' in record else record.get('content') or ''
+        return CassetteResponse(record['status_code'], record.get('headers', {}), content.encode('utf-8'))
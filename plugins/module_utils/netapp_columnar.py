@@ -0,0 +1,339 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+netapp_columnar.py: a compact snapshot of working environments, aggregates and volumes, in fixed width columns
+
+The file is an 8 byte magic, a little endian 4 byte header length followed by 4 bytes of padding, a JSON header, and sections aligned on 8 bytes.
+The header only describes the sections: string table, and for each table its number of rows and the offset, length and type of each column.
+Strings are interned in a sorted table, string columns hold indexes in the table, -1 for a missing value.
+Numeric columns are arrays of doubles or 32 bit integers, in the byte order recorded in the header, and can be mapped in memory without copy.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from array import array
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_capacity import StringTable, aggregate_capacity
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_replication import to_bytes
+
+MAGIC = b'NACMFLT1'
+VERSION = 1
+ALIGNMENT = 8
+NAN = float('nan')
+# memoryview.cast requires python 3.3 or later, columns are copied into arrays otherwise
+HAS_MEMORYVIEW_CAST = hasattr(memoryview, 'cast')
+
+# column name and type: s for an interned string, i for a 32 bit integer, d for a double
+TABLES = (
+    ('working_environments', (('id', 's'), ('name', 's'), ('type', 's'), ('provider', 's'), ('status', 's'), ('is_ha', 'i'))),
+    # working_environment is a row in working_environments
+    ('aggregates', (('working_environment', 'i'), ('name', 's'), ('tier', 's'), ('total_bytes', 'd'), ('used_bytes', 'd'))),
+    ('volumes', (('working_environment', 'i'), ('svm_name', 's'), ('name', 's'), ('aggregate_name', 's'), ('tier', 's'),
+                 ('size_bytes', 'd'), ('used_bytes', 'd'))),
+)
+
+
+def array_to_bytes(column):
+    ''' array.tobytes, or array.tostring on python 2 '''
+    return column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+
+
+def array_from_bytes(kind, data):
+    ''' a new array of kind, from bytes '''
+    column = array(kind)
+    if hasattr(column, 'frombytes'):
+        column.frombytes(data)
+    else:
+        column.fromstring(data)
+    return column
+
+
+def padding(offset):
+    return -offset % ALIGNMENT
+
+
+class FleetSnapshotWriter(object):
+    ''' collect rows one working environment at a time, and write them as columns '''
+    def __init__(self):
+        self.strings = StringTable()
+        self.columns = dict((table, dict((name, array('d' if kind == 'd' else 'i')) for name, kind in columns)) for table, columns in TABLES)
+        self.kinds = dict((table, dict(columns)) for table, columns in TABLES)
+        self.we_rows = {}
+
+    def count(self, table):
+        # all the columns of a table have the same length
+        return len(next(iter(self.columns[table].values())))
+
+    def counts(self):
+        ''' number of rows in each table '''
+        return dict((table, self.count(table)) for table, dummy in TABLES)
+
+    def append(self, table, **values):
+        for name, column in self.columns[table].items():
+            value = values.get(name)
+            kind = self.kinds[table][name]
+            if kind == 's':
+                column.append(-1 if value is None else self.strings.index(str(value)))
+            elif kind == 'd':
+                column.append(NAN if value is None else float(value))
+            else:
+                column.append(int(value or 0))
+
+    def add_working_environment(self, working_env_type, working_environment_id, we, provider=None):
+        ''' provider is used when the record does not have a cloudProviderName, as for AWS FSx '''
+        if working_environment_id in self.we_rows:
+            return self.we_rows[working_environment_id]
+        status = we.get('status')
+        self.we_rows[working_environment_id] = self.count('working_environments')
+        self.append('working_environments', id=working_environment_id, name=we.get('name'), type=working_env_type,
+                    provider=we.get('cloudProviderName') or provider, status=status.get('status') if isinstance(status, dict) else status,
+                    is_ha=bool(we.get('isHA')))
+        return self.we_rows[working_environment_id]
+
+    def add_aggregates(self, working_environment_id, aggregates):
+        for aggregate in aggregates or []:
+            total, used = aggregate_capacity(aggregate)
+            self.append('aggregates', working_environment=self.we_rows[working_environment_id], name=aggregate.get('name'),
+                        tier=(aggregate.get('providerVolumes') or [{}])[0].get('diskType'), total_bytes=total, used_bytes=used)
+
+    def add_volumes(self, working_environment_id, volumes):
+        for volume in volumes or []:
+            self.append('volumes', working_environment=self.we_rows[working_environment_id], svm_name=volume.get('svmName'), name=volume.get('name'),
+                        aggregate_name=volume.get('aggregateName'), tier=volume.get('providerVolumeType'),
+                        size_bytes=to_bytes(volume.get('size')), used_bytes=to_bytes(volume.get('usedSize')))
+
+    def get_sections(self):
+        ''' the string table and the columns, with string indexes remapped to the sorted order '''
+        encoded = [value.encode('utf-8') for value in self.strings.strings]
+        order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        remap = array('i', [0]) * len(order)
+        for rank, index in enumerate(order):
+            remap[index] = rank
+        offsets = array('i', [0])
+        for index in order:
+            offsets.append(offsets[-1] + len(encoded[index]))
+        sections = [('strings', 'offsets', offsets), ('strings', 'data', b''.join(encoded[index] for index in order))]
+        for table, columns in TABLES:
+            for name, kind in columns:
+                column = self.columns[table][name]
+                if kind == 's':
+                    column = array('i', [-1 if index < 0 else remap[index] for index in column])
+                sections.append((table, name, column))
+        return sections
+
+    def write(self, path):
+        ''' write to a temporary file, and rename it, so that readers never see a partial file
+            :return: number of rows in each table
+        '''
+        header = dict(version=VERSION, created=time.time(), byteorder=sys.byteorder, strings=dict(count=len(self.strings.strings)),
+                      tables=dict((table, dict(rows=self.count(table), columns={})) for table, dummy in TABLES))
+        sections = self.get_sections()
+        # the header size depends on the offsets, which depend on the header size: reserve space for the largest offsets
+        blobs = [section[2] if isinstance(section[2], bytes) else array_to_bytes(section[2]) for section in sections]
+        for (table, name, column), blob in zip(sections, blobs):
+            entry = dict(offset=0, length=len(blob), type='b' if isinstance(column, bytes) else column.typecode,
+                         itemsize=1 if isinstance(column, bytes) else column.itemsize)
+            if table == 'strings':
+                header['strings'][name] = entry
+            else:
+                header['tables'][table]['columns'][name] = entry
+        reserved = len(json.dumps(header)) + 20 * len(sections)
+        offset = len(MAGIC) + 8 + reserved + padding(len(MAGIC) + 8 + reserved)
+        for (table, name, dummy), blob in zip(sections, blobs):
+            entry = header['strings'][name] if table == 'strings' else header['tables'][table]['columns'][name]
+            entry['offset'] = offset
+            offset += len(blob) + padding(len(blob))
+        encoded_header = json.dumps(header).encode('utf-8')
+        encoded_header += b' ' * (reserved - len(encoded_header))
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(MAGIC + struct.pack('<II', reserved, 0) + encoded_header)
+                fh.write(b'\0' * padding(len(MAGIC) + 8 + reserved))
+                for blob in blobs:
+                    fh.write(blob + b'\0' * padding(len(blob)))
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self.counts()
+
+
+class FleetSnapshotReader(object):
+    ''' map a snapshot in memory, columns are memoryviews on the mapping when the byte order matches, and copies otherwise, or on python 2
+        a truncated or corrupted file raises ValueError
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.views = []
+        with open(path, 'rb') as fh:
+            self.buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.load()
+        except (KeyError, TypeError, IndexError, AttributeError, struct.error) as exc:
+            self.close()
+            raise ValueError('corrupted fleet snapshot: %s: %s' % (path, repr(exc)))
+        except Exception:
+            self.close()
+            raise
+
+    def load(self):
+        ''' parse the header, and map the string table and the columns '''
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a fleet snapshot: %s' % self.path)
+        start = len(MAGIC) + 8
+        if len(self.buffer) < start:
+            raise ValueError('truncated fleet snapshot: %s' % self.path)
+        length = struct.unpack('<I', self.buffer[len(MAGIC):len(MAGIC) + 4])[0]
+        if len(self.buffer) < start + length:
+            raise ValueError('truncated fleet snapshot: %s' % self.path)
+        self.header = json.loads(self.buffer[start:start + length].decode('utf-8'))
+        if self.header.get('version') != VERSION:
+            raise ValueError('unsupported fleet snapshot version %s: %s' % (self.header.get('version'), self.path))
+        self.offsets = self.get_column(self.header['strings']['offsets'])
+        self.data = self.get_column(self.header['strings']['data'])
+        if len(self.offsets) != self.header['strings']['count'] + 1:
+            raise ValueError('corrupted fleet snapshot: %s: string table' % self.path)
+        self.columns = dict((table, dict((name, self.get_column(entry)) for name, entry in meta['columns'].items()))
+                            for table, meta in self.header['tables'].items())
+        for table, columns in TABLES:
+            for name, dummy in columns:
+                if len(self.columns[table][name]) != self.rows(table):
+                    raise ValueError('corrupted fleet snapshot: %s: column %s.%s' % (self.path, table, name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for view in reversed(self.views):
+            # memoryview.release requires python 3.2 or later
+            if hasattr(view, 'release'):
+                view.release()
+        self.views = []
+        self.buffer.close()
+
+    def get_column(self, entry):
+        if entry['offset'] < 0 or entry['length'] < 0 or entry['offset'] + entry['length'] > len(self.buffer):
+            raise ValueError('truncated fleet snapshot: %s' % self.path)
+        view = memoryview(self.buffer)[entry['offset']:entry['offset'] + entry['length']]
+        self.views.append(view)
+        if entry['type'] == 'b':
+            return view
+        if array(entry['type']).itemsize != entry['itemsize']:
+            raise ValueError('unsupported item size %d for type %s' % (entry['itemsize'], entry['type']))
+        if self.header['byteorder'] == sys.byteorder and HAS_MEMORYVIEW_CAST:
+            view = view.cast(entry['type'])
+            self.views.append(view)
+            return view
+        column = array_from_bytes(entry['type'], view.tobytes())
+        if self.header['byteorder'] != sys.byteorder:
+            column.byteswap()
+        return column
+
+    def rows(self, table):
+        return self.header['tables'][table]['rows']
+
+    def string(self, index):
+        if index < 0:
+            return None
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    def find_string(self, value):
+        ''' index of value in the sorted string table, or -1, without decoding the table '''
+        encoded = value.encode('utf-8')
+        low, high = 0, self.header['strings']['count']
+        while low < high:
+            middle = (low + high) // 2
+            if self.data[self.offsets[middle]:self.offsets[middle + 1]].tobytes() < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.header['strings']['count'] and self.data[self.offsets[low]:self.offsets[low + 1]].tobytes() == encoded:
+            return low
+        return -1
+
+    def record(self, table, row):
+        ''' a row as a dictionary, with strings decoded, and sizes as integers or None '''
+        record = {}
+        for name, kind in dict(TABLES)[table]:
+            value = self.columns[table][name][row]
+            if kind == 's':
+                value = self.string(value)
+            elif kind == 'd':
+                # sizes are a number of bytes, NaN when unknown
+                value = None if value != value else int(value)
+            record[name] = value
+        if table == 'working_environments':
+            record['is_ha'] = bool(record['is_ha'])
+        else:
+            we_row = record.pop('working_environment')
+            for name in ('id', 'name', 'provider'):
+                record['working_environment_' + name] = self.string(self.columns['working_environments'][name][we_row])
+        return record
+
+    def find_volumes(self, name, svm_name=None):
+        ''' volumes with this name, and this svm if set, with the working environment owning them '''
+        name_index = self.find_string(name)
+        svm_index = None if svm_name is None else self.find_string(svm_name)
+        if name_index < 0 or svm_index == -1:
+            return []
+        names = self.columns['volumes']['name']
+        svms = self.columns['volumes']['svm_name']
+        return [self.record('volumes', row) for row in range(len(names))
+                if names[row] == name_index and (svm_index is None or svms[row] == svm_index)]
+
+    def find_aggregates_over(self, threshold):
+        ''' aggregates whose used size is above threshold percent of their total size, most used first '''
+        totals = self.columns['aggregates']['total_bytes']
+        used = self.columns['aggregates']['used_bytes']
+        matches = []
+        for row in range(len(totals)):
+            # unknown sizes are NaN, and never compare greater
+            if totals[row] > 0 and used[row] * 100.0 / totals[row] > threshold:
+                matches.append((used[row] * 100.0 / totals[row], row))
+        matches.sort(key=lambda match: -match[0])
+        records = []
+        for utilization, row in matches:
+            record = self.record('aggregates', row)
+            record['utilization'] = round(utilization, 2)
+            records.append(record)
+        return records
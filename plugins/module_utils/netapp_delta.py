@@ -0,0 +1,143 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_delta.py: compare results with the previous run, using fingerprints persisted to a file
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+SNAPSHOT_VERSION = 1
+
+
+def fingerprint(value):
+    ''' a stable digest of a JSON compatible value '''
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class DeltaSnapshot(object):
+    ''' per object fingerprints of the previous run, and of the current run, grouped by subset
+        only fingerprints are persisted, so the file stays small even for large tenants
+        markers are fingerprints of a parent object, for instance a working environment,
+        so that objects fetched for it can be reported as unchanged without fetching them
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.previous = self.load()
+        self.baseline = self.previous is None
+        if self.previous is None:
+            self.previous = dict(objects={}, markers={})
+        self.current = dict(objects={}, markers={})
+        self.counts = {}
+
+    def load(self):
+        ''' return the previous snapshot, or None if it is missing, corrupted, or from another version '''
+        try:
+            with open(self.path) as fh:
+                snapshot = json.load(fh)
+        except (OSError, IOError, ValueError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        return dict(objects=snapshot.get('objects') or {}, markers=snapshot.get('markers') or {})
+
+    def save(self):
+        ''' write the current snapshot, using a rename so that a failed run keeps the previous one '''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(dict(version=SNAPSHOT_VERSION, objects=self.current['objects'], markers=self.current['markers']), fh)
+            os.rename(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def unchanged(self, subset, object_id, parent):
+        ''' return True if parent is identical to the previous run, and the object was reported then
+            the object is then carried over as unchanged, and does not need to be fetched
+        '''
+        marker = fingerprint(parent)
+        with self.lock:
+            self.current['markers'].setdefault(subset, {})[object_id] = marker
+            previous_objects = self.previous['objects'].get(subset, {})
+            if self.previous['markers'].get(subset, {}).get(object_id) != marker or object_id not in previous_objects:
+                return False
+            self.current['objects'].setdefault(subset, {})[object_id] = previous_objects[object_id]
+            self.count(subset, 'unchanged')
+        return True
+
+    def keep(self, subset, object_id):
+        ''' carry the fingerprint of the previous run over, for an object that could not be fetched
+            so that it is neither reported as removed now, nor as added on the next run
+            the marker is dropped, so that the object is fetched again on the next run
+        '''
+        with self.lock:
+            self.current['markers'].get(subset, {}).pop(object_id, None)
+            previous = self.previous['objects'].get(subset, {})
+            if object_id in previous:
+                self.current['objects'].setdefault(subset, {})[object_id] = previous[object_id]
+                self.count(subset, 'kept')
+
+    def count(self, subset, change):
+        counts = self.counts.setdefault(subset, dict(added=0, changed=0, removed=0, unchanged=0, kept=0))
+        counts[change] += 1
+
+    def diff(self, subset, objects):
+        ''' compare objects, a dict of records keyed by id, with the previous run
+            return a dict with the added and changed records, and the ids of removed objects
+        '''
+        result = dict(added={}, changed={}, removed=[])
+        with self.lock:
+            current = self.current['objects'].setdefault(subset, {})
+            previous = self.previous['objects'].get(subset, {})
+            for object_id, record in objects.items():
+                current[object_id] = fingerprint(record)
+                if object_id not in previous:
+                    change = 'added'
+                elif previous[object_id] != current[object_id]:
+                    change = 'changed'
+                else:
+                    self.count(subset, 'unchanged')
+                    continue
+                result[change][object_id] = record
+                self.count(subset, change)
+            for object_id in previous:
+                if object_id not in current:
+                    result['removed'].append(object_id)
+                    self.count(subset, 'removed')
+            self.counts.setdefault(subset, dict(added=0, changed=0, removed=0, unchanged=0, kept=0))
+        return result
@@ -0,0 +1,91 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_fetch.py: named fetches run once per run, and shared by their consumers
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import threading
+
+try:
+    from concurrent.futures import Future, ThreadPoolExecutor
+    HAS_FUTURES = True
+except ImportError:
+    # python 2.7 without the futures backport, fetches run sequentially
+    HAS_FUTURES = False
+
+
+class FetchGraph(object):
+    ''' a set of named fetches, each called at most once, even when requested from several threads
+        a fetch can get other fetches, its inputs, so that an input shared by several consumers is only fetched once
+        the first thread to request a fetch calls it, other threads wait for its result
+        as a fetch never waits for a fetch that is queued behind it, a bounded pool cannot deadlock
+    '''
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.funcs = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, func):
+        ''' register func, called without arguments, as name '''
+        self.funcs[name] = func
+
+    def get(self, name):
+        ''' return the result of the fetch, calling it if no other thread did '''
+        if not HAS_FUTURES:
+            if name not in self.futures:
+                self.futures[name] = self.funcs[name]()
+            return self.futures[name]
+        with self.lock:
+            future = self.futures.get(name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.futures[name] = future
+        if owner:
+            try:
+                future.set_result(self.funcs[name]())
+            except BaseException as exc:
+                # including SystemExit from fail_json, so that waiting threads do not hang
+                future.set_exception(exc)
+        return future.result()
+
+    def run(self, names):
+        ''' get all names, concurrently, and return a dict of results, in the order of names '''
+        if self.max_workers <= 1 or len(names) <= 1 or not HAS_FUTURES:
+            return dict((name, self.get(name)) for name in names)
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(names)))
+        try:
+            futures = [(name, executor.submit(self.get, name)) for name in names]
+        finally:
+            executor.shutdown(wait=True)
+        return dict((name, future.result()) for name, future in futures)
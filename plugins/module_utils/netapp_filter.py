@@ -0,0 +1,95 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+netapp_filter.py: select working environments on a few attributes, before any request is sent for them
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+
+
+class WorkingEnvironmentFilter(object):
+    ''' match working environment records against filters, all filters must match
+        provider: list of cloudProviderName values, case insensitive
+        status: list of status values, for instance ON or OFF, case insensitive
+        is_ha: isHA value
+        name_regex: regular expression searched in the name
+        tags: dictionary of tags that must all be present, with the same value, an empty or null value only requires the key
+    '''
+    def __init__(self, filters=None):
+        filters = filters or {}
+        self.providers = self.lower(filters.get('provider'))
+        self.statuses = self.lower(filters.get('status'))
+        self.is_ha = filters.get('is_ha')
+        # re.error is reported to the caller
+        self.name_regex = re.compile(filters['name_regex']) if filters.get('name_regex') else None
+        self.tags = filters.get('tags') or {}
+
+    @staticmethod
+    def lower(values):
+        return None if not values else [value.lower() for value in values]
+
+    @staticmethod
+    def get_status(record):
+        ''' working environment lists report a dictionary, with a status key '''
+        status = record.get('status')
+        if isinstance(status, dict):
+            status = status.get('status')
+        return status
+
+    @staticmethod
+    def get_tags(record):
+        ''' userTags for Cloud Volumes ONTAP, or a list of key and value dictionaries for AWS FSx '''
+        tags = record.get('userTags')
+        if isinstance(tags, dict):
+            return tags
+        tags = record.get('tags')
+        if isinstance(tags, list):
+            return dict((tag.get('key'), tag.get('value')) for tag in tags if isinstance(tag, dict))
+        return tags if isinstance(tags, dict) else {}
+
+    def match(self, record, provider=None):
+        ''' provider is used when the record does not have a cloudProviderName, as for AWS FSx '''
+        if self.providers is not None and (record.get('cloudProviderName') or provider or '').lower() not in self.providers:
+            return False
+        if self.statuses is not None and (self.get_status(record) or '').lower() not in self.statuses:
+            return False
+        if self.is_ha is not None and bool(record.get('isHA')) != self.is_ha:
+            return False
+        if self.name_regex is not None and not self.name_regex.search(record.get('name') or ''):
+            return False
+        if self.tags:
+            tags = self.get_tags(record)
+            for key, value in self.tags.items():
+                if key not in tags or (value not in (None, '') and str(tags[key]) != str(value)):
+                    return False
+        return True
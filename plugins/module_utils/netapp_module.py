@@ -32,11 +32,26 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 from copy import deepcopy
+import fnmatch
 import json
 import re
 import base64
 import time
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_FUTURES = True
+except ImportError:
+    # python 2.7 without the futures backport, agents are deleted sequentially
+    HAS_FUTURES = False
+
+# keys read from a working environment record when looking it up by name or id
+# set_api_root_path uses cloudProviderName, isHA and publicId
+WORKING_ENVIRONMENT_LOOKUP_FIELDS = ['name', 'publicId', 'cloudProviderName', 'isHA', 'svmName', 'workingEnvironmentType']
+
+# agent statuses deleted by stale_agents_pattern, agents in any other status, like pending or deploying, are kept
+STALE_OCCM_AGENT_STATUSES = ('failed', 'inactive')
+
 
 def cmp(a, b):
     '''
@@ -116,16 +131,46 @@ class NetAppModule(object):
 
         return updated_values, is_changed
 
-    def get_working_environments_info(self, rest_api, headers):
+    @staticmethod
+    def project_fields(records, fields):
+        '''
+        Keep only the keys listed in fields, for a record or a list of records
+        The list endpoints do not support a field selector, so responses are pruned right after parsing.
+        If fields is None, records are returned as is.
+        '''
+        if fields is None or records is None:
+            return records
+        if isinstance(records, list):
+            return [NetAppModule.project_fields(record, fields) for record in records]
+        if isinstance(records, dict):
+            return dict((key, value) for key, value in records.items() if key in fields)
+        return records
+
+    def project_working_environments(self, working_environments, fields):
+        '''
+        Apply project_fields to each list of working environments, keyed by working environment type
+        '''
+        if fields is None or not isinstance(working_environments, dict):
+            return working_environments
+        return dict((working_env_type, self.project_fields(values, fields))
+                    for working_env_type, values in working_environments.items())
+
+    def get_working_environments_info(self, rest_api, headers, fields=None):
         '''
         Get all working environments info
+        If fields is set, only these keys are kept for each working environment
+        The list is read from the working environment snapshot, if enabled and fresh
         '''
-        api = "/occm/api/working-environments"
-        response, error, dummy = rest_api.get(api, None, header=headers)
-        if error is not None:
-            return response, error
-        else:
-            return response, None
+        snapshot = getattr(rest_api, 'we_snapshot', None)
+        response = None if snapshot is None else snapshot.get(headers, 'list')
+        if response is None:
+            api = "/occm/api/working-environments"
+            response, error, dummy = rest_api.get(api, None, header=headers)
+            if error is not None:
+                return response, error
+            if snapshot is not None:
+                snapshot.set(headers, 'list', response)
+        return self.project_working_environments(response, fields), None
 
     def look_up_working_environment_by_name_in_list(self, we_list, name):
         '''
@@ -136,7 +181,7 @@ class NetAppModule(object):
                 return we, None
         return None, "look_up_working_environment_by_name_in_list: Working environment not found"
 
-    def get_working_environment_details_by_name(self, rest_api, headers, name, provider=None):
+    def get_working_environment_details_by_name(self, rest_api, headers, name, provider=None, fields=None):
         '''
         Use working environment name to get working environment details including:
         name: working environment name,
@@ -144,16 +189,18 @@ class NetAppModule(object):
         cloudProviderName,
         isHA,
         svmName
+        If fields is set, only these keys are kept, for instance WORKING_ENVIRONMENT_LOOKUP_FIELDS
         '''
-        # check the working environment exist or not
-        api = "/occm/api/working-environments/exists/" + name
-        response, error, dummy = rest_api.get(api, None, header=headers)
-        if error is not None:
-            return None, error
+        # check the working environment exist or not, a fresh snapshot is used as is
+        snapshot = getattr(rest_api, 'we_snapshot', None)
+        if snapshot is None or snapshot.get(headers, 'list') is None:
+            api = "/occm/api/working-environments/exists/" + name
+            response, error, dummy = rest_api.get(api, None, header=headers)
+            if error is not None:
+                return None, error
 
         # get working environment lists
-        api = "/occm/api/working-environments"
-        response, error, dummy = rest_api.get(api, None, header=headers)
+        response, error = self.get_working_environments_info(rest_api, headers, fields)
         if error is not None:
             return None, error
         # look up the working environment in the working environment lists
@@ -187,26 +234,46 @@ class NetAppModule(object):
         userTags,
         workingEnvironmentType,
         '''
+        snapshot = getattr(rest_api, 'we_snapshot', None)
+        item = 'details:' + self.parameters['working_environment_id']
+        response = None if snapshot is None else snapshot.get(headers, item)
+        if response is not None:
+            return response, None
         api = "/occm/api/working-environments/"
         api += self.parameters['working_environment_id']
         response, error, dummy = rest_api.get(api, None, header=headers)
         if error:
             return None, "Error: get_working_environment_details %s" % error
+        if snapshot is not None:
+            snapshot.set(headers, item, response)
         return response, None
 
+    def get_aws_fsx_working_environments(self, rest_api, header=None):
+        '''
+        Get the AWS FSx working environments for tenant_id, from the working environment snapshot if enabled and fresh
+        '''
+        snapshot = getattr(rest_api, 'we_snapshot', None)
+        item = 'fsx:' + self.parameters['tenant_id']
+        response = None if snapshot is None else snapshot.get(header, item)
+        if response is not None:
+            return response, None
+        api = "/fsx-ontap/working-environments/%s" % self.parameters['tenant_id']
+        response, error, dummy = rest_api.get(api, None, header=header)
+        if not error and snapshot is not None:
+            snapshot.set(header, item, response)
+        return response, error
+
     def get_aws_fsx_details(self, rest_api, header=None, name=None):
         '''
         Use working environment id and tenantID to get working environment details including:
         name: working environment name,
         publicID: working environment ID
         '''
-        api = "/fsx-ontap/working-environments/"
-        api += self.parameters['tenant_id']
         count = 0
         fsx_details = None
         if name is None:
             name = self.parameters['name']
-        response, error, dummy = rest_api.get(api, None, header=header)
+        response, error = self.get_aws_fsx_working_environments(rest_api, header)
         if error:
             return response, "Error: get_aws_fsx_details %s" % error
         for each in response:
@@ -228,8 +295,7 @@ class NetAppModule(object):
         Use working environment id and tenantID to get working environment details including:
         publicID: working environment ID
         '''
-        api = "/fsx-ontap/working-environments/%s" % self.parameters['tenant_id']
-        response, error, dummy = rest_api.get(api, None, header=header)
+        response, error = self.get_aws_fsx_working_environments(rest_api, header)
         if error:
             return response, "Error: get_aws_fsx_details %s" % error
         for each in response:
@@ -242,10 +308,9 @@ class NetAppModule(object):
         Use working environment name and tenantID to get working environment details including:
         name: working environment name,
         '''
-        api = "/fsx-ontap/working-environments/%s" % self.parameters['tenant_id']
         count = 0
         fsx_details = None
-        response, error, dummy = rest_api.get(api, None, header=header)
+        response, error = self.get_aws_fsx_working_environments(rest_api, header)
         if error:
             return response, "Error: get_aws_fsx_details_by_name %s" % error
         for each in response:
@@ -271,12 +336,11 @@ class NetAppModule(object):
             return None, "Error: no SVM found for %s" % id
         return response[0]['name'], None
 
-    def get_working_environment_detail_for_snapmirror(self, rest_api, headers):
+    def get_working_environment_detail_for_snapmirror(self, rest_api, headers, fields=None):
 
         source_working_env_detail, dest_working_env_detail = {}, {}
         if self.parameters.get('source_working_environment_id'):
-            api = '/occm/api/working-environments'
-            working_env_details, error, dummy = rest_api.get(api, None, header=headers)
+            working_env_details, error = self.get_working_environments_info(rest_api, headers, fields)
             if error:
                 return None, None, "Error getting WE info: %s: %s" % (error, working_env_details)
             for dummy, values in working_env_details.items():
@@ -286,7 +350,8 @@ class NetAppModule(object):
                         break
         elif self.parameters.get('source_working_environment_name'):
             source_working_env_detail, error = self.get_working_environment_details_by_name(rest_api, headers,
-                                                                                            self.parameters['source_working_environment_name'])
+                                                                                            self.parameters['source_working_environment_name'],
+                                                                                            fields=fields)
             if error:
                 return None, None, error
         else:
@@ -306,8 +371,7 @@ class NetAppModule(object):
                 else:
                     return None, None, "Cannot find FSx WE by destination WE %s, missing tenant_id" % self.parameters['destination_working_environment_id']
             else:
-                api = '/occm/api/working-environments'
-                working_env_details, error, dummy = rest_api.get(api, None, header=headers)
+                working_env_details, error = self.get_working_environments_info(rest_api, headers, fields)
                 if error:
                     return None, None, "Error getting WE info: %s: %s" % (error, working_env_details)
                 for dummy, values in working_env_details.items():
@@ -327,7 +391,8 @@ class NetAppModule(object):
                 dest_working_env_detail['svmName'] = svm_name
             else:
                 dest_working_env_detail, error = self.get_working_environment_details_by_name(rest_api, headers,
-                                                                                              self.parameters['destination_working_environment_name'])
+                                                                                              self.parameters['destination_working_environment_name'],
+                                                                                              fields=fields)
                 if error:
                     return None, None, error
         else:
@@ -404,9 +469,17 @@ class NetAppModule(object):
         '''
         set API url root path based on the working environment provider
         '''
+        rest_api.api_root_path = self.get_api_root_path(working_environment_details)
+
+    def get_api_root_path(self, working_environment_details):
+        '''
+        return API url root path based on the working environment provider, without changing rest_api, so that it can be shared by threads
+        '''
         provider = working_environment_details['cloudProviderName'] if working_environment_details.get('cloudProviderName') else None
+        # the info module reports all working environments, and does not set working_environment_id
+        working_environment_id = self.parameters.get('working_environment_id') or working_environment_details.get('publicId', '')
         api_root_path = None
-        if self.parameters['working_environment_id'].startswith('fs-'):
+        if working_environment_id.startswith('fs-'):
             api_root_path = "/occm/api/fsx"
         elif provider == "Amazon":
             api_root_path = "/occm/api/aws/ha" if working_environment_details['isHA'] else "/occm/api/vsa"
@@ -414,7 +487,7 @@ class NetAppModule(object):
             api_root_path = "/occm/api/" + provider.lower() + "/ha"
         else:
             api_root_path = "/occm/api/" + provider.lower() + "/vsa"
-        rest_api.api_root_path = api_root_path
+        return api_root_path
 
     def have_required_parameters(self, action):
         '''
@@ -698,19 +771,78 @@ class NetAppModule(object):
         occm_status, error, dummy = rest_api.delete(api, None, header=headers)
         return occm_status, error
 
-    def delete_occm_agents(self, rest_api, agents):
+    def delete_occm_agents(self, rest_api, agents, max_workers=8):
         '''
-        delete a list of occm
+        delete a list of occm, concurrently
+        :return: list of (status, error) for the agents that could not be deleted
         '''
-        results = []
-        for agent in agents:
+        return [(occm_status, error) for dummy, occm_status, error in self.delete_occm_agents_concurrently(rest_api, agents, max_workers) if error]
+
+    def delete_occm_agents_concurrently(self, rest_api, agents, max_workers=8):
+        '''
+        delete a list of occm, with at most max_workers requests in flight
+        :return: list of (agent, status, error), in the order of agents
+        '''
+        def delete(agent):
             if 'agentId' in agent:
                 occm_status, error = self.delete_occm(rest_api, agent['agentId'])
             else:
                 occm_status, error = None, 'unexpected agent contents: %s' % repr(agent)
-            if error:
-                results.append((occm_status, error))
-        return results
+            return agent, occm_status, error
+
+        if len(agents) < 2 or max_workers < 2 or not HAS_FUTURES:
+            return [delete(agent) for agent in agents]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(agents))) as executor:
+            return list(executor.map(delete, agents))
+
+    def get_stale_occm_agents(self, rest_api, account_id, name_pattern, provider):
+        '''
+        Collect the agents for account_id and provider that failed or are inactive, and whose name matches a shell-style pattern.
+        :return: list of agents, error
+        '''
+        agents, error = self.get_occm_agents_by_account(rest_api, account_id)
+        if error:
+            return agents, error
+        if not isinstance(agents, dict) or 'agents' not in agents:
+            return None, 'unexpected response for agents: %s' % repr(agents)
+        return [agent for agent in agents['agents']
+                if agent.get('provider') == provider and agent.get('status') in STALE_OCCM_AGENT_STATUSES
+                and fnmatch.fnmatchcase(agent.get('name', ''), name_pattern)], None
+
+    def delete_stale_occm_agents(self, rest_api, account_id, name_pattern, provider, check_mode=False):
+        '''
+        Delete the agents for account_id and provider that failed or are inactive, and whose name matches a shell-style pattern.
+        :return: list of agent ids, dict of errors per agent id, error
+        '''
+        agents, error = self.get_stale_occm_agents(rest_api, account_id, name_pattern, provider)
+        if error:
+            return None, None, error
+        errors = {}
+        if not check_mode:
+            for agent, occm_status, error in self.delete_occm_agents_concurrently(rest_api, agents):
+                if error:
+                    errors[agent.get('agentId')] = '%s: %s' % (error, occm_status) if occm_status else error
+        return [agent.get('agentId') for agent in agents], errors, None
+
+    def cleanup_stale_agents(self, rest_api, accounts, provider, check_mode=False):
+        '''
+        Delete the agents for provider that failed or are inactive, and whose name matches the stale_agents_pattern parameter.
+        When account_id is not set, the account is looked up with accounts, an AccountContext, it is never created.
+        :return: dict of results for exit_json or fail_json, error
+        '''
+        account_id = self.parameters.get('account_id')
+        if account_id is None:
+            account_id, error = accounts.get_account_id()
+            if error is not None:
+                return {}, "Error: failed to get account: %s." % str(error)
+        stale_agents, errors, error = self.delete_stale_occm_agents(rest_api, account_id, self.parameters['stale_agents_pattern'], provider, check_mode)
+        if error:
+            return {}, "Error: getting OCCM agents: %s" % str(error)
+        results = dict(changed=len(errors) < len(stale_agents), stale_agents=stale_agents)
+        if errors:
+            return results, "Error: deleting %d of %d stale OCCM agent(s): %s" % (
+                len(errors), len(stale_agents), ', '.join('%s: %s' % item for item in sorted(errors.items())))
+        return results, None
 
     @staticmethod
     def call_parameters():
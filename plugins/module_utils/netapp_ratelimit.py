@@ -0,0 +1,113 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_ratelimit.py: a token bucket per host, shared by all the processes on a controller
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import time
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache
+
+# after a 429, the rate is divided by this factor, down to MIN_RATE_RATIO * limit
+BACKOFF_FACTOR = 2.0
+MIN_RATE_RATIO = 0.1
+# after a success, the rate is increased by this ratio of the limit, up to the limit
+RECOVERY_RATIO = 0.05
+
+
+class RateLimiter(object):
+    ''' requests per second for each host, using a token bucket stored with FileCache
+        rates is a dict of <host key>: <requests per second>, a host key matches any host name that contains it
+        for instance: {'cloudmanager': 10, 'auth0': 2, 'googleapis': 10}
+        each request reserves a token, and waits until the token is available, so waiting processes are served in order
+        when a 429 is seen, the rate is reduced for all processes, and the bucket is blocked for Retry-After seconds
+    '''
+    def __init__(self, rates, cache_dir=None):
+        self.rates = rates
+        self.store = FileCache('rate_limits', cache_dir)
+
+    def get_key(self, host):
+        ''' the longest configured key contained in host, or None if the host is not rate limited '''
+        keys = [key for key in self.rates if key in host]
+        return max(keys, key=len) if keys else None
+
+    def load_state(self, key, now):
+        limit = float(self.rates[key])
+        state = self.store.get(key)
+        if state is None or state.get('limit') != limit:
+            # allow a burst of one second worth of requests
+            state = dict(limit=limit, rate=limit, tokens=max(limit, 1.0), updated=now, blocked_until=0)
+        return state
+
+    def acquire(self, host):
+        ''' reserve a token for host, and sleep until it is available
+            return the time spent waiting
+        '''
+        key = self.get_key(host)
+        if key is None:
+            return 0
+        with self.store.lock():
+            now = time.time()
+            state = self.load_state(key, now)
+            state['tokens'] = min(max(state['limit'], 1.0), state['tokens'] + (now - state['updated']) * state['rate'])
+            state['updated'] = now
+            state['tokens'] -= 1
+            delay = max(0, state['blocked_until'] - now)
+            if state['tokens'] < 0:
+                delay = max(delay, -state['tokens'] / state['rate'])
+            self.store.set(key, state)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def feedback(self, host, status_code, retry_after=None):
+        ''' slow down on 429 for all processes, and slowly recover the configured rate on success '''
+        key = self.get_key(host)
+        if key is None:
+            return
+        throttled = status_code == 429
+        with self.store.lock():
+            now = time.time()
+            state = self.load_state(key, now)
+            if throttled:
+                state['rate'] = max(state['limit'] * MIN_RATE_RATIO, state['rate'] / BACKOFF_FACTOR)
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = 1 / state['rate']
+                state['blocked_until'] = max(state['blocked_until'], now + delay)
+            elif state['rate'] < state['limit']:
+                state['rate'] = min(state['limit'], state['rate'] + state['limit'] * RECOVERY_RATIO)
+            else:
+                # nothing to update, avoid a write for each successful request
+                return
+            self.store.set(key, state)
@@ -0,0 +1,164 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_replication.py: compact snapmirror records and fleet statistics, computed in a single pass
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import POW2_BYTE_MAP
+
+SECONDS = dict(ms=0.001, millisecond=0.001, milliseconds=0.001, s=1, sec=1, second=1, seconds=1, m=60, min=60, minute=60, minutes=60,
+               h=3600, hour=3600, hours=3600, d=86400, day=86400, days=86400)
+ISO_DURATION = re.compile(r'^P(?:(\d+(?:\.\d+)?)D)?(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?$')
+# mirror states of a relationship that is replicating
+HEALTHY_STATES = ('snapmirrored',)
+
+
+def to_seconds(value):
+    ''' a duration as a number of seconds, a {size|length|value, unit} dictionary, or an ISO 8601 duration like PT1H30M
+        return None if the duration is missing or not recognized
+    '''
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, dict):
+        size = next((value[key] for key in ('size', 'length', 'value') if value.get(key) is not None), None)
+        factor = SECONDS.get(str(value.get('unit', 'seconds')).lower())
+        if isinstance(size, (int, float)) and not isinstance(size, bool) and factor is not None:
+            return size * factor
+        return None
+    match = ISO_DURATION.match(str(value))
+    if match is None or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = [float(group or 0) for group in match.groups()]
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def to_bytes(value):
+    ''' a size as a number of bytes or a {size, unit} dictionary, return None if not recognized '''
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, dict):
+        unit = str(value.get('unit', 'bytes')).lower()
+        if isinstance(value.get('size'), (int, float)) and unit in POW2_BYTE_MAP:
+            return value['size'] * POW2_BYTE_MAP[unit]
+    return None
+
+
+def normalize_relationship(record):
+    ''' a compact, flat record for a replication status entry '''
+    source = record.get('source') or {}
+    destination = record.get('destination') or {}
+    last_transfer = record.get('lastTransferInfo') or {}
+    compact = dict(
+        source_working_environment_id=source.get('workingEnvironmentId'),
+        source_svm_name=source.get('svmName'),
+        source_volume_name=source.get('volumeName'),
+        destination_working_environment_id=destination.get('workingEnvironmentId'),
+        destination_svm_name=destination.get('svmName'),
+        destination_volume_name=destination.get('volumeName'),
+        mirror_state=record.get('mirrorState'),
+        status=record.get('status'),
+        policy=record.get('policy') or record.get('policyName'),
+        schedule=record.get('schedule'),
+        lag_seconds=to_seconds(record.get('lagTime')),
+        last_transfer_bytes=to_bytes(last_transfer.get('transferSize')),
+        last_transfer_seconds=to_seconds(last_transfer.get('transferDuration')),
+        last_transfer_error=last_transfer.get('transferError') or None,
+    )
+    healthy = record.get('healthy')
+    if healthy is None:
+        healthy = compact['mirror_state'] in HEALTHY_STATES
+    compact['healthy'] = bool(healthy)
+    compact['unhealthy_reason'] = record.get('unhealthyReason') or None
+    return compact
+
+
+class ReplicationSummary(object):
+    ''' fleet statistics, updated one relationship at a time, so that the relationships do not need to be kept '''
+    def __init__(self, lag_threshold=None):
+        self.lag_threshold = lag_threshold
+        self.total = 0
+        self.unhealthy = 0
+        self.lagging = 0
+        self.unknown_lag = 0
+        self.max_lag = None
+        self.lag_total = 0
+        self.lag_count = 0
+        self.transferred_bytes = 0
+        self.mirror_states = {}
+        self.policies = {}
+
+    def add(self, relationship):
+        self.total += 1
+        lag = relationship['lag_seconds']
+        policy = self.policies.setdefault(relationship['policy'] or 'unknown', dict(count=0, unhealthy=0, lagging=0, max_lag_seconds=None))
+        policy['count'] += 1
+        state = relationship['mirror_state'] or 'unknown'
+        self.mirror_states[state] = self.mirror_states.get(state, 0) + 1
+        if not relationship['healthy']:
+            self.unhealthy += 1
+            policy['unhealthy'] += 1
+        if relationship['last_transfer_bytes']:
+            self.transferred_bytes += relationship['last_transfer_bytes']
+        if lag is None:
+            self.unknown_lag += 1
+            return
+        self.lag_total += lag
+        self.lag_count += 1
+        if self.lag_threshold is not None and lag > self.lag_threshold:
+            self.lagging += 1
+            policy['lagging'] += 1
+        if policy['max_lag_seconds'] is None or lag > policy['max_lag_seconds']:
+            policy['max_lag_seconds'] = lag
+        if self.max_lag is None or lag > self.max_lag[0]:
+            self.max_lag = (lag, relationship)
+
+    def summary(self):
+        max_lag_seconds, max_lag_relationship = self.max_lag or (None, None)
+        return dict(
+            total=self.total,
+            unhealthy=self.unhealthy,
+            lagging=self.lagging,
+            lag_threshold_seconds=self.lag_threshold,
+            unknown_lag=self.unknown_lag,
+            max_lag_seconds=max_lag_seconds,
+            max_lag_relationship=max_lag_relationship,
+            mean_lag_seconds=self.lag_total / self.lag_count if self.lag_count else None,
+            last_transfer_bytes=self.transferred_bytes,
+            mirror_states=self.mirror_states,
+            policies=self.policies,
+        )
@@ -0,0 +1,123 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_scheduler.py: run operations concurrently, with mutual exclusion per key
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from collections import deque
+import threading
+
+try:
+    from concurrent.futures import Future, ThreadPoolExecutor
+    HAS_FUTURES = True
+except ImportError:
+    # python 2.7 without the futures backport, modules using KeyedScheduler report a missing library
+    HAS_FUTURES = False
+
+
+class KeyedScheduler(object):
+    ''' run submitted operations in a thread pool
+        operations sharing a key, for instance a working environment id, run at most max_per_key at a time, in submission order
+        operations waiting for their key are queued here rather than in the pool, so they do not hold a thread
+        the pool size is the global concurrency limit
+    '''
+    def __init__(self, max_workers=8, max_per_key=1):
+        self.max_per_key = max_per_key
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        # notified when no operation is running or queued
+        self.idle = threading.Condition(self.lock)
+        self.running = {}
+        self.queues = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def submit(self, key, func, *args, **kwargs):
+        ''' schedule func(*args, **kwargs), and return a Future
+            key None means the operation is only bound by the global limit
+        '''
+        future = Future()
+        operation = (future, func, args, kwargs)
+        if key is not None:
+            with self.lock:
+                if self.running.get(key, 0) >= self.max_per_key:
+                    self.queues.setdefault(key, deque()).append(operation)
+                    return future
+                self.running[key] = self.running.get(key, 0) + 1
+        self._start(key, operation)
+        return future
+
+    def _start(self, key, operation):
+        self.executor.submit(self._run, key, operation)
+
+    def _run(self, key, operation):
+        future, func, args, kwargs = operation
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as exc:
+                    # including SystemExit from fail_json, so that the caller does not wait forever
+                    future.set_exception(exc)
+        finally:
+            if key is not None:
+                self._release(key)
+
+    def _release(self, key):
+        ''' start the next operation for key, if any '''
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                operation = queue.popleft()
+                if not queue:
+                    del self.queues[key]
+            else:
+                operation = None
+                self.running[key] -= 1
+                if self.running[key] == 0:
+                    del self.running[key]
+                    if not self.running:
+                        self.idle.notify_all()
+        if operation is not None:
+            self._start(key, operation)
+
+    def shutdown(self):
+        ''' wait for all operations to complete, including queued ones, and release the threads '''
+        # a running operation starts the next one for its key, so the pool is only shut down when all keys are idle
+        with self.idle:
+            while self.running:
+                self.idle.wait()
+        self.executor.shutdown(wait=True)
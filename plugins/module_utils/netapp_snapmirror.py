@@ -0,0 +1,133 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_snapmirror.py: helpers shared by na_cloudmanager_snapmirror and na_cloudmanager_snapmirror_bulk
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache
+
+
+def index_replication_status(snapmirror_info):
+    ''' index the relationships by (destination working environment id, SVM name, volume name)
+        the working environment id or SVM name is None when the relationship does not report it, the first relationship is kept for a key
+    '''
+    index = {}
+    for sm in snapmirror_info or []:
+        destination = sm['destination']
+        index.setdefault((destination.get('workingEnvironmentId') or None, destination.get('svmName') or None, destination['volumeName']), sm)
+    return index
+
+
+def find_snapmirror(index, dest_we_id, dest_svm_name, dest_volume_name):
+    ''' look up a relationship by (destination working environment, SVM, volume)
+        the working environment and SVM are only compared when they are known on both sides
+    '''
+    dest_we_id = dest_we_id or None
+    dest_svm_name = dest_svm_name or None
+    # a relationship that does not report its working environment or SVM matches any
+    for we_id in (dest_we_id, None):
+        for svm_name in (dest_svm_name, None):
+            sm = index.get((we_id, svm_name, dest_volume_name))
+            if sm is not None:
+                return sm
+    if dest_we_id is None or dest_svm_name is None:
+        # the caller does not know the working environment or SVM, any relationship for the volume name matches
+        for (we_id, svm_name, volume_name), sm in index.items():
+            if volume_name == dest_volume_name and dest_we_id in (None, we_id) and dest_svm_name in (None, svm_name):
+                return sm
+    return None
+
+
+def build_quote_request(source_we_info, dest_we_info, source_volume, aggregate, dest_volume_name, dest_svm_name, capacity_tier=None,
+                        provider_volume_type=None):
+    ''' quote request for a destination volume with the same properties as source_volume
+        aggregate is the source aggregate, all the volumes in one aggregate have the same physical properties
+    '''
+    quote = dict()
+    quote['size'] = {'size': source_volume['size']['size'], 'unit': source_volume['size']['unit']}
+    quote['name'] = dest_volume_name
+    quote['snapshotPolicyName'] = source_volume['snapshotPolicy']
+    quote['enableDeduplication'] = source_volume['deduplication']
+    quote['enableThinProvisioning'] = source_volume['thinProvisioning']
+    quote['enableCompression'] = source_volume['compression']
+    quote['verifyNameUniqueness'] = True
+    quote['replicationFlow'] = True
+    if source_we_info['workingEnvironmentType'] != 'ON_PREM':
+        disk_type = aggregate['providerVolumes'][0]['diskType']
+        if disk_type in ('gp3', 'io1', 'io2'):
+            quote['iops'] = aggregate['providerVolumes'][0]['iops']
+        if disk_type == 'gp3':
+            quote['throughput'] = aggregate['providerVolumes'][0]['throughput']
+        quote['workingEnvironmentId'] = dest_we_info['publicId']
+        quote['svmName'] = dest_svm_name
+    if capacity_tier is not None:
+        quote['capacityTier'] = capacity_tier
+    quote['providerVolumeType'] = provider_volume_type or source_volume['providerVolumeType']
+    return quote
+
+
+class InterclusterLifs(object):
+    ''' intercluster LIFs for pairs of working environments, cached across runs as they rarely change
+        entries are keyed by user and connector, so that LIFs are only reused for the credentials that fetched them
+        a ttl of 0 or less disables the cache
+    '''
+    def __init__(self, rest_api, headers, ttl):
+        self.rest_api = rest_api
+        self.headers = headers
+        self.ttl = ttl
+
+    def get_cache(self, source_we_id, dest_we_id):
+        ''' return the cache and the key for a pair of working environments, or None, None if the cache is disabled '''
+        if self.ttl <= 0:
+            return None, None
+        return FileCache('intercluster_lifs'), '%s:%s:%s:%s' % (self.rest_api.get_user_key(), self.headers.get('X-Agent-Id'), source_we_id, dest_we_id)
+
+    def get(self, source_we_id, dest_we_id):
+        ''' return the LIFs and None, or None and an error message '''
+        cache, cache_key = self.get_cache(source_we_id, dest_we_id)
+        if cache is not None:
+            response = cache.get(cache_key)
+            if response is not None:
+                return response, None
+        api_get = '/occm/api/replication/intercluster-lifs?peerWorkingEnvironmentId=%s&workingEnvironmentId=%s' % (dest_we_id, source_we_id)
+        response, err, dummy = self.rest_api.send_request("GET", api_get, None, header=self.headers)
+        if err is not None:
+            return None, 'Error getting interclusterlifs %s: %s.' % (err, response)
+        if cache is not None:
+            cache.set(cache_key, response, self.ttl)
+        return response, None
+
+    def delete(self, source_we_id, dest_we_id):
+        ''' drop a cached entry, when a relationship could not be created with it, as the LIFs may be stale '''
+        cache, cache_key = self.get_cache(source_we_id, dest_we_id)
+        if cache is not None:
+            cache.delete(cache_key)
@@ -0,0 +1,248 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+netapp_trace.py: JSON lines trace of REST requests, written to a rotating file by a background thread
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import random
+import threading
+import time
+
+from ansible.module_utils.six import binary_type, string_types
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    # without flock, several processes writing the same trace file may rotate it concurrently
+    HAS_FCNTL = False
+
+# QueueHandler and QueueListener require python 3.2 or later, records are written synchronously otherwise
+HAS_QUEUE_HANDLER = hasattr(logging.handlers, 'QueueHandler')
+
+REDACTED = '********'
+# a header, or a key in a body, is redacted if its lowercase name contains one of these
+SECRET_KEYWORDS = ('authorization', 'token', 'secret', 'password', 'passphrase', 'credential', 'accesskey', 'access_key', 'apikey', 'api_key')
+# unless it is one of these
+NOT_SECRET = ('token_type',)
+
+_SINKS = {}
+_SINKS_LOCK = threading.Lock()
+
+
+def is_secret(name):
+    name = str(name).lower()
+    return name not in NOT_SECRET and any(keyword in name for keyword in SECRET_KEYWORDS)
+
+
+def redact(value):
+    ''' return a copy of value, where secret keys are masked at any depth '''
+    if isinstance(value, dict):
+        return dict((key, REDACTED if is_secret(key) and item is not None else redact(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def format_body(body, limit):
+    ''' decode and redact a JSON body, and truncate it to limit characters if limit is set '''
+    if body is None:
+        return None
+    if isinstance(body, binary_type):
+        body = body.decode('utf-8', 'replace')
+    if isinstance(body, string_types):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            pass
+    if not isinstance(body, string_types):
+        body = redact(body)
+        if not limit:
+            return body
+        text = json.dumps(body, default=str)
+        if len(text) <= limit:
+            return body
+        body = text
+    if limit and len(body) > limit:
+        return '%s...<truncated %d characters>' % (body[:limit], len(body) - limit)
+    return body
+
+
+class JsonLinesFormatter(logging.Formatter):
+    ''' one JSON document per line, built from the trace attribute of a record '''
+    def __init__(self, body_limit=None):
+        super(JsonLinesFormatter, self).__init__()
+        self.body_limit = body_limit
+
+    def format(self, record):
+        entry = dict(time='%s.%03dZ' % (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)), record.msecs),
+                     level=record.levelname, pid=record.process, thread=record.threadName)
+        trace = getattr(record, 'trace', None)
+        if isinstance(trace, dict):
+            entry.update(trace)
+            for key in ('request_body', 'response_body'):
+                if key in entry:
+                    entry[key] = format_body(entry[key], self.body_limit)
+        else:
+            entry['message'] = record.getMessage()
+        return json.dumps(entry, default=str, sort_keys=True)
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    ''' a RotatingFileHandler that can be shared by several processes, for instance the forks of a play writing the same trace file
+        each record is written, and the file rotated, while holding an exclusive flock on path.lock
+        the file is reopened when another process rotated it
+    '''
+    def __init__(self, filename, maxBytes=0, backupCount=0):
+        super(SharedRotatingFileHandler, self).__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+        self.lock_path = self.baseFilename + '.lock'
+        self.lock_file = None
+        self.lock_pid = None
+
+    def emit(self, record):
+        if not HAS_FCNTL:
+            super(SharedRotatingFileHandler, self).emit(record)
+            return
+        # flock is shared by a forked child, which opens its own lock file
+        if self.lock_file is None or self.lock_pid != os.getpid():
+            self.lock_file = open(self.lock_path, 'a')
+            self.lock_pid = os.getpid()
+        fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            self.reopen_if_rotated()
+            super(SharedRotatingFileHandler, self).emit(record)
+        finally:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+    def reopen_if_rotated(self):
+        ''' close the stream if path is no longer the file it is writing to, it is reopened by emit '''
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        super(SharedRotatingFileHandler, self).close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+
+class TraceSink(object):
+    ''' write a record for each request, as a JSON line, to path
+        the file is rotated when it reaches max_bytes, keeping backup_count older files, and never rotated if max_bytes is 0
+        the file can be shared by several processes, writes and rotation are serialized with a lock file
+        bodies are truncated to body_limit characters, secrets are redacted in headers and bodies
+        a successful request is recorded with a probability of sample_rate, errors are always recorded
+        records are queued, and written by a background thread, so that tracing does not slow down requests
+    '''
+    def __init__(self, path, max_bytes=10 * 1024 ** 2, backup_count=3, body_limit=4096, sample_rate=1.0, include_headers=False):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.include_headers = include_headers
+        self.logger = logging.getLogger('%s.%s' % (__name__, path))
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.file_handler = SharedRotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+        self.file_handler.setFormatter(JsonLinesFormatter(body_limit))
+        self.listener = None
+        if HAS_QUEUE_HANDLER:
+            records = queue.Queue(-1)
+            self.handler = logging.handlers.QueueHandler(records)
+            self.listener = logging.handlers.QueueListener(records, self.file_handler)
+            self.listener.start()
+        else:
+            self.handler = self.file_handler
+        self.logger.addHandler(self.handler)
+        atexit.register(self.stop)
+
+    def is_sampled(self, error):
+        return error is not None or self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def trace(self, method, url, params, json, data, headers, response, status_code, error, elapsed, on_cloud_request_id=None):
+        ''' queue a record for a request and its response
+            headers and request bodies are copied, as the caller may reuse them
+        '''
+        if not self.is_sampled(error):
+            return
+        entry = dict(method=method, url=url, status_code=status_code, elapsed_ms=int(elapsed * 1000), error=error)
+        if params:
+            entry['params'] = redact(params)
+        if json is not None or data is not None:
+            entry['request_body'] = redact(json) if json is not None else data
+        if on_cloud_request_id is not None:
+            entry['on_cloud_request_id'] = on_cloud_request_id
+        if self.include_headers:
+            entry['request_headers'] = redact(headers)
+            if response is not None:
+                entry['response_headers'] = redact(dict(response.headers))
+        if response is not None:
+            # decoded, redacted, and truncated by the formatter, in the background thread
+            entry['response_body'] = response.content
+        self.logger.log(logging.ERROR if error is not None else logging.DEBUG, '%s %s', method, url, extra=dict(trace=entry))
+
+    def stop(self):
+        ''' write queued records and close the file '''
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.logger.removeHandler(self.handler)
+        self.file_handler.close()
+        with _SINKS_LOCK:
+            if _SINKS.get(self.path) is self:
+                del _SINKS[self.path]
+
+
+def get_trace_sink(path, **kwargs):
+    ''' a single sink per file in a process, the options used to create it apply '''
+    with _SINKS_LOCK:
+        if path not in _SINKS:
+            _SINKS[path] = TraceSink(path, **kwargs)
+        return _SINKS[path]
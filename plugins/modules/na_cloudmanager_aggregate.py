@@ -131,9 +131,12 @@ msg:
 
 from ansible.module_utils.basic import AnsibleModule
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
-from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule, WORKING_ENVIRONMENT_LOOKUP_FIELDS
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
 
+# keys read from an aggregate record, the rest of each record is dropped
+AGGREGATE_FIELDS = ['name', 'disks']
+
 
 class NetAppCloudmanagerAggregate(object):
     '''
@@ -202,7 +205,8 @@ class NetAppCloudmanagerAggregate(object):
         elif 'working_environment_name' in self.parameters:
             working_environment_detail, error = self.na_helper.get_working_environment_details_by_name(self.rest_api,
                                                                                                        self.headers,
-                                                                                                       self.parameters['working_environment_name'])
+                                                                                                       self.parameters['working_environment_name'],
+                                                                                                       fields=WORKING_ENVIRONMENT_LOOKUP_FIELDS)
             if error is not None:
                 self.module.fail_json(msg="Error: Cannot find working environment: %s" % str(error))
         else:
@@ -219,7 +223,7 @@ class NetAppCloudmanagerAggregate(object):
         response, error, dummy = self.rest_api.get(api, header=self.headers)
         if error:
             self.module.fail_json(msg="Error: Failed to get aggregate list: %s, %s" % (str(error), str(response)))
-        for aggr in response:
+        for aggr in self.na_helper.project_fields(response, AGGREGATE_FIELDS):
             if aggr['name'] == self.parameters['name']:
                 return aggr
         return None
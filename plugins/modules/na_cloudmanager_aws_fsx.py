@@ -434,13 +434,17 @@ class NetAppCloudManagerAWSFSX:
             self.na_helper.changed = True
 
         if self.na_helper.changed and not self.module.check_mode:
-            if cd_action == "import":
-                self.recover_aws_fsx()
-                working_environment_id = self.parameters['file_system_id']
-            elif cd_action == "create":
-                working_environment_id = self.create_aws_fsx()
-            elif cd_action == "delete":
-                self.delete_aws_fsx(current['id'], self.parameters['tenant_id'])
+            # the working environments change, even if the operation fails midway
+            try:
+                if cd_action == "import":
+                    self.recover_aws_fsx()
+                    working_environment_id = self.parameters['file_system_id']
+                elif cd_action == "create":
+                    working_environment_id = self.create_aws_fsx()
+                elif cd_action == "delete":
+                    self.delete_aws_fsx(current['id'], self.parameters['tenant_id'])
+            finally:
+                self.rest_api.invalidate_working_environments()
 
         self.module.exit_json(changed=self.na_helper.changed, working_environment_id=working_environment_id)
 
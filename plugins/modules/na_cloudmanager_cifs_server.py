@@ -122,7 +122,7 @@ RETURN = r''' # '''
 
 from ansible.module_utils.basic import AnsibleModule
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
-from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule, WORKING_ENVIRONMENT_LOOKUP_FIELDS
 
 
 class NetAppCloudmanagerCifsServer:
@@ -189,7 +189,8 @@ class NetAppCloudmanagerCifsServer:
         else:
             working_environment_detail, error = self.na_helper.get_working_environment_details_by_name(self.rest_api,
                                                                                                        self.headers,
-                                                                                                       self.parameters['working_environment_name'])
+                                                                                                       self.parameters['working_environment_name'],
+                                                                                                       fields=WORKING_ENVIRONMENT_LOOKUP_FIELDS)
         if working_environment_detail is not None:
             self.parameters['working_environment_id'] = working_environment_detail['publicId']
         else:
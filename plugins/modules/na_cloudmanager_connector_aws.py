@@ -74,8 +74,24 @@ options:
   ami:
     description:
       - The image ID.
+      - If not provided, the latest Cloud Manager image published by NetApp for the region is used.
     type: str
 
+  ami_cache_ttl:
+    description:
+      - When ami is not provided, the latest image ID is cached per region and environment for this number of seconds.
+      - This avoids listing all the NetApp images for each create.  Set to 0 to disable the cache.
+    type: int
+    default: 0
+    version_added: 21.25.0
+
+  ami_cache_refresh:
+    description:
+      - When true, ignore any cached image ID and look up the latest image.  The cache is updated with the new value.
+    type: bool
+    default: false
+    version_added: 21.25.0
+
   company:
     description:
       - The name of the company of the user.
@@ -144,6 +160,17 @@ options:
         description: The tag value.
         type: str
 
+  stale_agents_pattern:
+    description:
+      - When set, the module runs in cleanup mode, and the connector instance is neither created nor deleted.
+      - The AWS agents in the account that failed or are inactive, and whose name matches this shell-style pattern, are deleted concurrently.
+      - Agents in any other status, like pending or deploying, are kept.
+      - For instance, C(connector-*) matches the agents left behind by failed deployments of connectors named connector-1, connector-2, ...
+      - The ids of the matching agents are reported in C(stale_agents).
+      - Use it with I(state=absent), so that the options required to create a connector are not needed.
+    type: str
+    version_added: 21.25.0
+
 notes:
 - Support check_mode.
 '''
@@ -177,6 +204,14 @@ EXAMPLES = """
     account_id: "{{ account-xxxxxxx }}"
     instance_id: i-xxxxxxxxxxxxx
     client_id: xxxxxxxxxxxxxxxxxxx
+
+- name: Delete the agents left behind by failed deployments
+  netapp.cloudmanager.na_cloudmanager_connector_aws:
+    state: absent
+    refresh_token: "{{ xxxxxxxxxxxxxxx }}"
+    name: ansible
+    region: us-west-1
+    stale_agents_pattern: "ansible-*"
 """
 
 RETURN = """
@@ -184,6 +219,12 @@ ids:
   description: Newly created AWS client ID in cloud manager, instance ID and account ID.
   type: dict
   returned: success
+stale_agents:
+  description: With stale_agents_pattern, the ids of the agents that matched the pattern, and were deleted unless in check mode.
+  type: list
+  elements: str
+  returned: when stale_agents_pattern is set
+  sample: ['FDQE8SwrbjVS6mqUgZoOHQmu2DvBNRRW']
 """
 
 import traceback
@@ -195,6 +236,8 @@ from ansible.module_utils._text import to_native
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account import AccountContext
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache
 IMPORT_EXCEPTION = None
 
 try:
@@ -224,6 +267,8 @@ class NetAppCloudManagerConnectorAWS(object):
             instance_id=dict(required=False, type='str'),
             client_id=dict(required=False, type='str'),
             ami=dict(required=False, type='str'),
+            ami_cache_ttl=dict(required=False, type='int', default=0),
+            ami_cache_refresh=dict(required=False, type='bool', default=False),
             company=dict(required=False, type='str'),
             security_group_ids=dict(required=False, type='list', elements='str'),
             iam_instance_profile_name=dict(required=False, type='str'),
@@ -238,6 +283,7 @@ class NetAppCloudManagerConnectorAWS(object):
                 tag_key=dict(type='str', no_log=False),
                 tag_value=dict(type='str')
             )),
+            stale_agents_pattern=dict(required=False, type='str'),
         ))
 
         self.module = AnsibleModule(
@@ -258,6 +304,7 @@ class NetAppCloudManagerConnectorAWS(object):
         self.parameters = self.na_helper.set_parameters(self.module.params)
 
         self.rest_api = CloudManagerRestAPI(self.module)
+        self.accounts = AccountContext(self.rest_api, self.na_helper, netapp_utils.get_feature(self.module, 'account_cache_ttl'))
 
     def get_instance(self):
         """
@@ -293,38 +340,61 @@ class NetAppCloudManagerConnectorAWS(object):
     def get_ami(self):
         """
         Get AWS EC2 Image
+        The image ID is cached per region and environment, as it only changes when NetApp publishes a new image.
         :return:
             Latest AMI
         """
+        cache = FileCache('ami') if self.parameters['ami_cache_ttl'] > 0 else None
+        cache_key = '%s:%s' % (self.parameters['environment'], self.parameters['region'])
+        if cache is not None and not self.parameters['ami_cache_refresh']:
+            latest_ami = cache.get(cache_key)
+            if latest_ami is not None:
+                return latest_ami
+
+        latest_ami = self.get_latest_ami()
+        if cache is not None:
+            cache.set(cache_key, latest_ami, self.parameters['ami_cache_ttl'])
+        return latest_ami
 
-        instance_ami = None
+    def get_latest_ami(self):
+        """
+        Scan the images page by page, only keeping the most recent one.
+        :return:
+            Latest AMI
+        """
         client = boto3.client('ec2', region_name=self.parameters['region'])
+        kwargs = dict(
+            Filters=[
+                {
+                    'Name': 'name',
+                    'Values': [
+                        self.rest_api.environment_data['AMI_FILTER'],
+                    ]
+                },
+            ],
+            Owners=[
+                self.rest_api.environment_data['AWS_ACCOUNT'],
+            ],
+        )
 
+        latest_date = None
+        latest_ami = None
         try:
-            instance_ami = client.describe_images(
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            self.rest_api.environment_data['AMI_FILTER'],
-                        ]
-                    },
-                ],
-                Owners=[
-                    self.rest_api.environment_data['AWS_ACCOUNT'],
-                ],
-            )
+            if client.can_paginate('describe_images'):
+                pages = client.get_paginator('describe_images').paginate(**kwargs)
+            else:
+                pages = [client.describe_images(**kwargs)]
+            for page in pages:
+                for image in page['Images']:
+                    if latest_date is None or image['CreationDate'] > latest_date:
+                        latest_date = image['CreationDate']
+                        latest_ami = image['ImageId']
         except ClientError as error:
             self.module.fail_json(msg=to_native(error), exception=traceback.format_exc())
 
-        latest_date = instance_ami['Images'][0]['CreationDate']
-        latest_ami = instance_ami['Images'][0]['ImageId']
-
-        for image in instance_ami['Images']:
-            if image['CreationDate'] > latest_date:
-                latest_date = image['CreationDate']
-                latest_ami = image['ImageId']
-
+        if latest_ami is None:
+            self.module.fail_json(msg="Error: no image found matching %s for account %s in region %s."
+                                  % (kwargs['Filters'][0]['Values'][0], kwargs['Owners'][0], self.parameters['region']))
         return latest_ami
 
     def create_instance(self):
@@ -447,7 +517,7 @@ class NetAppCloudManagerConnectorAWS(object):
 
     def set_account_id(self):
         if self.parameters.get('account_id') is None:
-            response, error = self.na_helper.get_or_create_account(self.rest_api)
+            response, error = self.accounts.get_or_create_account()
             if error is not None:
                 return error
             self.parameters['account_id'] = response
@@ -603,6 +673,11 @@ class NetAppCloudManagerConnectorAWS(object):
         Apply action to the Cloud Manager connector for AWS
         :return: None
         """
+        if self.parameters.get('stale_agents_pattern'):
+            results, error = self.na_helper.cleanup_stale_agents(self.rest_api, self.accounts, 'AWS', self.module.check_mode)
+            if error:
+                self.module.fail_json(msg=error, **results)
+            self.module.exit_json(**results)
         results = {
             'account_id': None,
             'client_id': None,
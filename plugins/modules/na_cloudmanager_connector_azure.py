@@ -167,6 +167,17 @@ options:
     - Storage account name must be between 3 and 24 characters in length and use numbers and lower-case letters only.
     type: str
     version_added: '21.17.0'
+
+  stale_agents_pattern:
+    description:
+      - When set, the module runs in cleanup mode, and the connector virtual machine is neither created nor deleted.
+      - The Azure agents in the account that failed or are inactive, and whose name matches this shell-style pattern, are deleted concurrently.
+      - Agents in any other status, like pending or deploying, are kept.
+      - For instance, C(connector-*) matches the agents left behind by failed deployments of connectors named connector-1, connector-2, ...
+      - The ids of the matching agents are reported in C(stale_agents).
+      - Use it with I(state=absent), I(client_id) is not required then.
+    type: str
+    version_added: 21.25.0
 '''
 
 EXAMPLES = """
@@ -206,6 +217,23 @@ EXAMPLES = """
     account_id: "{{ account-xxxxxxx }}"
     refresh_token: "{{ xxxxxxxxxxxxxxx }}"
     client_id: xxxxxxxxxxxxxxxxxxx
+
+- name: Delete the agents left behind by failed deployments
+  netapp.cloudmanager.na_cloudmanager_connector_azure:
+    state: absent
+    name: ansible
+    location: westus
+    resource_group: occm_group_westus
+    network_security_group_name: OCCM_SG
+    subnet_name: subnetxxxxx
+    company: NetApp
+    admin_password: Netapp123456
+    admin_username: bsuhas
+    vnet_name: Vnetxxxxx
+    subscription_id: "{{ xxxxxxxxxxxxxxxxx }}"
+    account_id: "{{ account-xxxxxxx }}"
+    refresh_token: "{{ xxxxxxxxxxxxxxx }}"
+    stale_agents_pattern: "ansible-*"
 """
 
 RETURN = """
@@ -214,6 +242,12 @@ msg:
   type: str
   returned: success
   sample: 'xxxxxxxxxxxxxxxx'
+stale_agents:
+  description: With stale_agents_pattern, the ids of the agents that matched the pattern, and were deleted unless in check mode.
+  type: list
+  elements: str
+  returned: when stale_agents_pattern is set
+  sample: ['FDQE8SwrbjVS6mqUgZoOHQmu2DvBNRRW']
 """
 
 import traceback
@@ -226,6 +260,7 @@ from ansible.module_utils._text import to_native
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account import AccountContext
 
 IMPORT_EXCEPTION = None
 
@@ -272,12 +307,13 @@ class NetAppCloudManagerConnectorAzure(object):
             admin_username=dict(required=True, type='str'),
             admin_password=dict(required=True, type='str', no_log=True),
             storage_account=dict(required=False, type='str'),
+            stale_agents_pattern=dict(required=False, type='str'),
         ))
 
         self.module = AnsibleModule(
             argument_spec=self.argument_spec,
             required_if=[
-                ['state', 'absent', ['client_id']]
+                ['state', 'absent', ['client_id', 'stale_agents_pattern'], True]
             ],
             required_one_of=[['refresh_token', 'sa_client_id']],
             required_together=[['sa_client_id', 'sa_secret_key']],
@@ -293,6 +329,7 @@ class NetAppCloudManagerConnectorAzure(object):
         if 'storage_account' not in self.parameters or self.parameters['storage_account'] == "":
             self.parameters['storage_account'] = self.parameters['name'].lower() + 'sa'
         self.rest_api = CloudManagerRestAPI(self.module)
+        self.accounts = AccountContext(self.rest_api, self.na_helper, netapp_utils.get_feature(self.module, 'account_cache_ttl'))
 
     def get_deploy_azure_vm(self):
         """
@@ -429,7 +466,7 @@ class NetAppCloudManagerConnectorAzure(object):
             subnet = '%s/subnets/%s' % (network, self.parameters['subnet_name'])
 
         if self.parameters.get('account_id') is None:
-            response, error = self.na_helper.get_or_create_account(self.rest_api)
+            response, error = self.accounts.get_or_create_account()
             if error is not None:
                 self.module.fail_json(
                     msg="Error: unexpected response on getting account: %s, %s" % (str(error), str(response)))
@@ -563,6 +600,11 @@ class NetAppCloudManagerConnectorAzure(object):
         Apply action to the Cloud Manager connector for AZURE
         :return: None
         """
+        if self.parameters.get('stale_agents_pattern'):
+            results, error = self.na_helper.cleanup_stale_agents(self.rest_api, self.accounts, 'AZURE', self.module.check_mode)
+            if error:
+                self.module.fail_json(msg=error, **results)
+            self.module.exit_json(**results)
         client_id = None
         principal_id = None
         if not self.module.check_mode:
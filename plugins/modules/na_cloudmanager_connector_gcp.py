@@ -135,6 +135,24 @@ options:
     - Ignored when state is present.
     type: str
 
+  gcp_token_cache:
+    description:
+    - Whether to cache the GCP access token until it expires, so that parallel and subsequent tasks using the same credentials share it.
+    - The token is stored in a file only readable by the current user, under ~/.ansible/tmp/cloudmanager_cache.
+    type: bool
+    default: false
+    version_added: 21.25.0
+
+  stale_agents_pattern:
+    description:
+      - When set, the module runs in cleanup mode, and the connector instance is neither created nor deleted.
+      - The GCP agents in the account that failed or are inactive, and whose name matches this shell-style pattern, are deleted concurrently.
+      - Agents in any other status, like pending or deploying, are kept.
+      - For instance, C(connector-*) matches the agents left behind by failed deployments of connectors named connector-1, connector-2, ...
+      - The ids of the matching agents are reported in C(stale_agents).
+    type: str
+    version_added: 21.25.0
+
 '''
 
 EXAMPLES = """
@@ -182,16 +200,27 @@ client_ids:
   elements: str
   returned: success
   sample: ['FDQE8SwrbjVS6mqUgZoOHQmu2DvBNRRW']
+stale_agents:
+  description: With stale_agents_pattern, the ids of the agents that matched the pattern, and were deleted unless in check mode.
+  type: list
+  elements: str
+  returned: when stale_agents_pattern is set
+  sample: ['FDQE8SwrbjVS6mqUgZoOHQmu2DvBNRRW']
 """
 import uuid
 import time
 import base64
+import datetime
+import hashlib
 import json
+import os
 
 from ansible.module_utils.basic import AnsibleModule
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account import AccountContext
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache
 
 IMPORT_ERRORS = []
 HAS_GCP_COLLECTION = False
@@ -206,6 +235,8 @@ except ImportError as exc:
     IMPORT_ERRORS.append(str(exc))
 
 GCP_DEPLOYMENT_MANAGER = "www.googleapis.com"
+# refresh the cached GCP token before it expires
+GCP_TOKEN_EXPIRY_MARGIN = 300
 UUID = str(uuid.uuid4())
 
 
@@ -233,6 +264,8 @@ class NetAppCloudManagerConnectorGCP(object):
             proxy_certificates=dict(required=False, type='list', elements='str'),
             account_id=dict(required=False, type='str'),
             client_id=dict(required=False, type='str'),
+            gcp_token_cache=dict(required=False, type='bool', default=False),
+            stale_agents_pattern=dict(required=False, type='str'),
         ))
 
         self.module = AnsibleModule(
@@ -244,15 +277,73 @@ class NetAppCloudManagerConnectorGCP(object):
         self.na_helper = NetAppModule()
         self.parameters = self.na_helper.set_parameters(self.module.params)
         self.rest_api = CloudManagerRestAPI(self.module)
+        self.accounts = AccountContext(self.rest_api, self.na_helper, netapp_utils.get_feature(self.module, 'account_cache_ttl'))
         self.gcp_common_suffix_name = "-vm-boot-deployment"
+        self.gcp_credentials = None
         self.fail_when_import_errors(IMPORT_ERRORS, HAS_GCP_COLLECTION)
         super(NetAppCloudManagerConnectorGCP, self).__init__()
+        # the GCP token is only acquired when a Google API is called
+        self.rest_api.gcp_token = None
 
-        self.rest_api.gcp_token, error = self.get_gcp_token()
-        if error:
-            self.module.fail_json(msg='Error getting gcp token: %s' % repr(error))
+    def set_gcp_token(self):
+        '''
+        get gcp token on first use
+        '''
+        if self.rest_api.gcp_token is None:
+            self.rest_api.gcp_token, error = self.get_gcp_token()
+            if error:
+                self.module.fail_json(msg='Error getting gcp token: %s' % repr(error))
+        return self.rest_api.gcp_token
 
     def get_gcp_token(self):
+        '''
+        get gcp token from cache, or from gcp service account credential json file
+        '''
+        if not self.parameters['gcp_token_cache']:
+            return self.get_new_gcp_token()
+        cache = FileCache('gcp_token')
+        # hold the lock while refreshing, so that parallel forks only refresh once
+        with cache.lock():
+            cache_key, error = self.get_gcp_token_cache_key()
+            if error:
+                return None, error
+            token = cache.get(cache_key)
+            if token is not None:
+                return token, None
+            token, error = self.get_new_gcp_token()
+            if error is None:
+                ttl = self.get_gcp_token_ttl()
+                if ttl > 0:
+                    cache.set(cache_key, token, ttl)
+        return token, error
+
+    def get_gcp_token_cache_key(self):
+        '''
+        identify the credentials used to get the token, without keeping any secret
+        '''
+        if 'gcp_service_account_path' in self.parameters:
+            try:
+                with open(self.parameters['gcp_service_account_path']) as fh:
+                    key = json.load(fh)
+            except (OSError, IOError, ValueError) as error:
+                return None, "opening %s: got: %s" % (self.parameters['gcp_service_account_path'], repr(error))
+            if not isinstance(key, dict):
+                return None, "Error: gcp_service_account_path file is empty"
+            identity = 'sa:%s:%s' % (key.get('client_email'), key.get('private_key_id'))
+        else:
+            identity = 'default:%s' % os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+        return hashlib.sha256(identity.encode()).hexdigest(), None
+
+    def get_gcp_token_ttl(self):
+        '''
+        number of seconds the token can be reused, 0 if unknown
+        '''
+        expiry = getattr(self.gcp_credentials, 'expiry', None)
+        if not isinstance(expiry, datetime.datetime):
+            return 0
+        return int((expiry - datetime.datetime.utcnow()).total_seconds()) - GCP_TOKEN_EXPIRY_MARGIN
+
+    def get_new_gcp_token(self):
         '''
         get gcp token from gcp service account credential json file
         '''
@@ -277,6 +368,7 @@ class NetAppCloudManagerConnectorGCP(object):
             credentials, project = google.auth.default(scopes=scopes)
 
         credentials.refresh(requests.Request())
+        self.gcp_credentials = credentials
 
         return credentials.token, None
 
@@ -298,6 +390,7 @@ class NetAppCloudManagerConnectorGCP(object):
         '''
         api_url = GCP_DEPLOYMENT_MANAGER + '/deploymentmanager/v2/projects/%s/global/deployments/%s%s' % (
             self.parameters['project_id'], self.parameters['name'], self.gcp_common_suffix_name)
+        self.set_gcp_token()
         headers = {
             "X-User-Token": self.rest_api.token_type + " " + self.rest_api.token,
             'Authorization': self.rest_api.token_type + " " + self.rest_api.gcp_token,
@@ -319,7 +412,7 @@ class NetAppCloudManagerConnectorGCP(object):
         # get account ID
         if 'account_id' not in self.parameters:
             # get account ID
-            response, error = self.na_helper.get_or_create_account(self.rest_api)
+            response, error = self.accounts.get_or_create_account()
             if error is not None:
                 self.module.fail_json(
                     msg="Error: unexpected response on getting account: %s, %s" % (str(error), str(response)))
@@ -456,6 +549,7 @@ class NetAppCloudManagerConnectorGCP(object):
         api_url = GCP_DEPLOYMENT_MANAGER + '/deploymentmanager/v2/projects/%s/global/deployments' % (
             self.parameters['project_id'])
 
+        self.set_gcp_token()
         headers = {
             'X-User-Token': self.rest_api.token_type + " " + self.rest_api.gcp_token,
             'X-Tenancy-Account-Id': self.parameters['account_id'],
@@ -528,6 +622,7 @@ class NetAppCloudManagerConnectorGCP(object):
             self.parameters['project_id'],
             self.parameters['name'],
             self.gcp_common_suffix_name)
+        self.set_gcp_token()
         headers = {
             "X-User-Token": self.rest_api.token_type + " " + self.rest_api.token,
             'Authorization': self.rest_api.token_type + " " + self.rest_api.gcp_token,
@@ -597,6 +692,11 @@ class NetAppCloudManagerConnectorGCP(object):
         Apply action to the Cloud Manager connector for GCP
         :return: None
         """
+        if self.parameters.get('stale_agents_pattern'):
+            results, error = self.na_helper.cleanup_stale_agents(self.rest_api, self.accounts, 'GCP', self.module.check_mode)
+            if error:
+                self.module.fail_json(msg=error, **results)
+            self.module.exit_json(**results)
         client_id = ""
         agents, client_ids = [], []
         current_vm = self.get_deploy_vm()
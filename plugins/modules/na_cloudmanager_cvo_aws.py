@@ -831,13 +831,17 @@ class NetAppCloudManagerCVOAWS:
                 self.module.fail_json(changed=False, msg=error)
 
         if self.na_helper.changed and not self.module.check_mode:
-            if cd_action == "create":
-                self.validate_cvo_params()
-                working_environment_id = self.create_cvo_aws()
-            elif cd_action == "delete":
-                self.delete_cvo_aws(current['publicId'])
-            else:
-                self.update_cvo_aws(current['publicId'], modify)
+            # the working environments change, even if the operation fails midway
+            try:
+                if cd_action == "create":
+                    self.validate_cvo_params()
+                    working_environment_id = self.create_cvo_aws()
+                elif cd_action == "delete":
+                    self.delete_cvo_aws(current['publicId'])
+                else:
+                    self.update_cvo_aws(current['publicId'], modify)
+            finally:
+                self.rest_api.invalidate_working_environments()
 
         self.module.exit_json(changed=self.na_helper.changed, working_environment_id=working_environment_id)
 
@@ -24,10 +24,24 @@ description:
 
 options:
   client_id:
-    required: true
-    type: str
+    type: list
+    elements: str
     description:
       - The connector ID of the Cloud Manager Connector.
+      - Since 21.25.0, a list of connector IDs is also accepted, to report the working environments of several connectors.
+      - Each connector is queried concurrently, using the same token, and the results are merged.
+      - Per working environment requests, for aggregates_info, volumes_info and snapmirror_info, are sent to the connector reporting the working environment.
+      - Other subsets, and AWS FSx file systems, use the first connector.
+      - One of client_id or all_connectors is required.
+
+  all_connectors:
+    type: bool
+    description:
+      - When true, the connectors are the active connectors reported by active_agents_info, rather than client_id.
+      - all_accounts applies, by default only the connectors in the first account are used.
+      - Mutually exclusive with client_id.
+    default: false
+    version_added: 21.25.0
 
   gather_subsets:
     type: list
@@ -41,10 +55,191 @@ options:
       - 'account_info'
       - 'agents_info'
       - 'active_agents_info'
+      - 'volumes_info'
+      - 'snapmirror_info'
+      - 'capacity_summary'
+      - With all, all subsets are collected, except volumes_info, snapmirror_info and capacity_summary, which send requests for every
+        working environment, and must be requested by name.
     default: 'all'
 
+  shard_count:
+    type: int
+    description:
+      - Number of shards the working environments are split into, to spread the collection across several hosts or forks.
+      - Working environments are assigned to a shard using a stable hash of their publicId.
+      - Per working environment subsets, working_environments_info, aggregates_info, volumes_info, snapmirror_info and capacity_summary,
+        only report the working environments in this shard.
+      - Other subsets are only collected by the shard with shard_index 0, so that results from all shards can be merged without duplicates.
+    default: 1
+    version_added: 21.25.0
+
+  shard_index:
+    type: int
+    description:
+      - Index of the shard to collect, from 0 to shard_count - 1.
+    default: 0
+    version_added: 21.25.0
+
+  output_file:
+    type: path
+    description:
+      - When set, records are written to this file in JSON Lines format as they are fetched, rather than returned in C(info).
+      - working_environments_info reports one record per working environment, aggregates_info and volumes_info one record per working environment.
+      - Other subsets report a single record.
+      - Each record is a dictionary with C(subset) and C(record) keys, and C(working_environment_type) and C(working_environment_id) when applicable.
+      - The file is created on the host running the module, and is only replaced once all subsets are collected.
+      - Only a summary is returned in C(output), and C(changed) is true as the file is written.
+      - In check mode, the records are collected and counted, but the file is not written.
+    version_added: 21.25.0
+
+  output_compress:
+    type: bool
+    description:
+      - When true, output_file is compressed with gzip.
+    default: false
+    version_added: 21.25.0
+
+  all_accounts:
+    type: bool
+    description:
+      - When true, agents_info and active_agents_info report the agents in all the accounts of the user, fetched concurrently.
+      - Each agent then reports the id of its account, in accountId for agents_info, and in account_id for active_agents_info.
+      - By default, only the agents in the first account are reported.
+    default: false
+    version_added: 21.25.0
+
+  max_concurrent_subsets:
+    type: int
+    description:
+      - Number of subsets collected concurrently.
+      - Inputs shared by several subsets, like the list of working environments or the account, are only fetched once.
+      - When output_file is set, subsets are collected one after the other, so that their records are not interleaved.
+    default: 4
+    version_added: 21.25.0
+
+  since_snapshot:
+    type: path
+    description:
+      - When set, only the objects that were added, changed, or removed since the previous run are reported.
+      - The file keeps a fingerprint of each object from the previous run, and is replaced at the end of each successful run.
+      - C(changed) is true when the file is replaced.  In check mode, changes are reported but the file is not replaced.
+      - Objects are working environments for working_environments_info, the aggregates or volumes of a working environment for
+        aggregates_info or volumes_info, and the whole subset for other subsets.
+      - The aggregates and volumes of a working environment are not fetched again when its record in the working environments list is unchanged.
+      - When the file does not exist, all objects are reported as added.
+      - Use a different file for each shard, and for each set of subsets.
+      - Mutually exclusive with output_file.
+    version_added: 21.25.0
+
+  tenant_id:
+    type: str
+    description:
+      - The NetApp account ID, used to report the volumes in the AWS FSx file systems of this account in volumes_info.
+      - By default, FSx file systems are not reported.
+    version_added: 21.25.0
+
+  max_concurrent_working_environments:
+    type: int
+    description:
+      - Number of working environments whose volumes are fetched concurrently, for volumes_info.
+      - Also the number of connectors queried concurrently, when client_id lists several connectors.
+    default: 8
+    version_added: 21.25.0
+
+  volumes_timeout:
+    type: int
+    description:
+      - Timeout in seconds for the request listing the volumes of a working environment, for volumes_info.
+      - A working environment that times out, or reports an error, is skipped with a warning, rather than failing the task.
+    default: 60
+    version_added: 21.25.0
+
+  volumes_fields:
+    type: list
+    elements: str
+    description:
+      - When set, only these keys are kept for each volume in volumes_info, for instance C(name), C(svmName), and C(size).
+      - By default, all keys are reported.
+    version_added: 21.25.0
+
+  snapmirror_relationships:
+    type: bool
+    description:
+      - When false, snapmirror_info only reports the summary, and not the list of relationships.
+    default: true
+    version_added: 21.25.0
+
+  snapmirror_lag_threshold:
+    type: int
+    description:
+      - Relationships with a lag time above this number of seconds are counted as lagging in the snapmirror_info summary.
+    version_added: 21.25.0
+
+  capacity_top:
+    type: int
+    description:
+      - Number of aggregates with the highest utilization, and of volumes with the highest used size, reported in capacity_summary.
+    default: 10
+    version_added: 21.25.0
+
+  fleet_snapshot:
+    type: path
+    description:
+      - When set, the working environments, aggregates and volumes in this shard are written to this file, in a compact columnar format.
+      - The file is created on the host running the module, and is only replaced once it is complete.
+      - C(changed) is true when the file is written.  In check mode, the rows are collected and counted, but the file is not written.
+      - It can be queried offline with the netapp.cloudmanager.fleet_snapshot lookup plugin, for instance to find the working environment
+        owning a volume, or the aggregates above a utilization threshold.
+      - The aggregates and volumes are shared with aggregates_info, volumes_info and capacity_summary when they are collected.
+      - filters apply, and AWS FSx file systems are included when tenant_id is set.
+    version_added: 21.25.0
+
+  filters:
+    type: dict
+    description:
+      - When set, only the working environments matching all these filters are reported by working_environments_info,
+        aggregates_info, volumes_info and snapmirror_info.
+      - Filters are evaluated on the working environment lists, so no request is sent for the aggregates, volumes,
+        or relationships of an excluded working environment.
+      - AWS FSx file systems are filtered too, with C(Amazon) as provider.
+    suboptions:
+      provider:
+        type: list
+        elements: str
+        description:
+          - Cloud providers to keep, matched against cloudProviderName, case insensitive, for instance C(Amazon), C(Azure), or C(GCP).
+      status:
+        type: list
+        elements: str
+        description:
+          - Statuses to keep, case insensitive, for instance C(ON) or C(OFF).
+      is_ha:
+        type: bool
+        description:
+          - When true, only keep HA working environments, when false, only keep single node working environments.
+      name_regex:
+        type: str
+        description:
+          - Python regular expression searched in the working environment name.
+      tags:
+        type: dict
+        description:
+          - Tags the working environment must have, with the same value.
+          - An empty value only requires the tag to be present.
+    version_added: 21.25.0
+
+  fields:
+    type: list
+    elements: str
+    description:
+      - When set, only these keys are kept for each working environment in working_environments_info, for instance C(name) and C(status).
+      - publicId is always kept.
+      - By default, all keys are reported.
+    version_added: 21.25.0
+
 notes:
 - Support check_mode
+- capacity_summary uses NumPy when it is installed on the host running the module, NumPy is optional.
 '''
 
 EXAMPLES = """
@@ -62,6 +257,68 @@ EXAMPLES = """
     gather_subsets:
       - aggregates_info
       - working_environments_info
+
+- name: Collect the name and size of all volumes, including FSx, to a file
+  netapp.cloudmanager.na_cloudmanager_info:
+    client_id: "{{ client_id }}"
+    refresh_token: "{{ refresh_token }}"
+    tenant_id: "{{ tenant_id }}"
+    gather_subsets:
+      - volumes_info
+    volumes_fields: ['name', 'svmName', 'size']
+    output_file: /tmp/volumes.jsonl.gz
+    output_compress: true
+
+- name: Collect working environments and aggregates from all active connectors in all accounts
+  netapp.cloudmanager.na_cloudmanager_info:
+    refresh_token: "{{ refresh_token }}"
+    all_connectors: true
+    all_accounts: true
+    gather_subsets:
+      - working_environments_info
+      - aggregates_info
+
+- name: Collect the name and status of the Azure HA working environments whose name starts with prod, and their aggregates
+  netapp.cloudmanager.na_cloudmanager_info:
+    client_id: "{{ client_id }}"
+    refresh_token: "{{ refresh_token }}"
+    gather_subsets:
+      - working_environments_info
+      - aggregates_info
+    filters:
+      provider: ['Azure']
+      is_ha: true
+      name_regex: '^prod'
+      tags:
+        environment: production
+    fields: ['name', 'status']
+
+- name: Write a fleet snapshot, and find the working environment owning a volume
+  netapp.cloudmanager.na_cloudmanager_info:
+    client_id: "{{ client_id }}"
+    refresh_token: "{{ refresh_token }}"
+    gather_subsets:
+      - working_environments_info
+    fleet_snapshot: /var/tmp/cloudmanager_fleet.snapshot
+
+- name: Query the fleet snapshot, without calling Cloud Manager
+  ansible.builtin.debug:
+    msg: "{{ lookup('netapp.cloudmanager.fleet_snapshot', 'volume', name='vol1', path='/var/tmp/cloudmanager_fleet.snapshot') }}"
+
+- name: Collect aggregates for one of 4 shards, each host in the play collects a different shard
+  netapp.cloudmanager.na_cloudmanager_info:
+    client_id: "{{ client_id }}"
+    refresh_token: "{{ refresh_token }}"
+    gather_subsets:
+      - aggregates_info
+    shard_count: 4
+    shard_index: "{{ ansible_play_hosts.index(inventory_hostname) % 4 }}"
+  register: shard_info
+
+- name: Merge the results from all shards
+  ansible.builtin.set_fact:
+    aggregates: "{{ ansible_play_hosts | map('extract', hostvars, ['shard_info', 'info', 'aggregates_info']) | combine(recursive=True) }}"
+  run_once: true
 """
 
 RETURN = """
@@ -69,7 +326,7 @@ info:
   description:
     - a dictionary of collected subsets
     - each subset if in JSON format
-  returned: success
+  returned: success, when output_file is not set
   type: dict
   sample: '{
     "info": {
@@ -121,12 +378,120 @@ info:
       ]
     }
   }'
+shard:
+  description:
+    - shard_index and shard_count used for the collection.
+  returned: success
+  type: dict
+  version_added: 21.25.0
+output:
+  description:
+    - summary of the records written to output_file, with the number of records for each subset.
+  returned: success, when output_file is set
+  type: dict
+  sample: '{
+    "output": {
+      "path": "/tmp/cloudmanager_info.jsonl.gz",
+      "compressed": true,
+      "records": {
+        "working_environments_info": 12,
+        "aggregates_info": 12
+      }
+    }
+  }'
+  version_added: 21.25.0
+connectors:
+  description:
+    - the connectors that were queried, with the IDs of the working environments in this shard reported by each connector.
+    - working environment IDs are only reported for subsets that need the list of working environments.
+  returned: success
+  type: dict
+  sample: '{
+    "connectors": {
+      "Nw4Q2O1kdnLtvhwegGalFnodEHUfPJWhclients": ["VsaWorkingEnvironment-3txYJOsX"],
+      "Zq8lOp4ZkYtLwQrtbVQ9dGmEgnUgVnSbclients": []
+    }
+  }'
+  version_added: 21.25.0
+capacity_summary:
+  description:
+    - capacity_summary subset in info, totals, utilization percentiles, and top consumers for aggregates and volumes.
+    - totals are reported for all objects, and by working environment, provider, and tier.
+    - the tier is the disk type of an aggregate, or the provider volume type of a volume.
+    - utilization percentiles are in percent of the total size, aggregates are ranked by utilization, and volumes by used size.
+    - computed with NumPy when it is installed on the host running the module, or with the array module otherwise, as reported in backend.
+  returned: success, when capacity_summary is in gather_subsets
+  type: dict
+  sample: '{
+    "backend": "numpy",
+    "aggregates": {
+      "count": 2,
+      "total_bytes": 2199023255552,
+      "used_bytes": 1099511627776,
+      "available_bytes": 1099511627776,
+      "utilization_percentiles": {"p50": 50.0, "p90": 74.0, "p95": 77.0, "p99": 79.4, "p100": 80.0},
+      "by_working_environment": {"VsaWorkingEnvironment-3txYJOsX": {"count": 2, "total_bytes": 2199023255552,
+                                                                  "used_bytes": 1099511627776, "available_bytes": 1099511627776}},
+      "by_provider": {"Amazon": {"count": 2, "total_bytes": 2199023255552, "used_bytes": 1099511627776, "available_bytes": 1099511627776}},
+      "by_tier": {"gp3": {"count": 2, "total_bytes": 2199023255552, "used_bytes": 1099511627776, "available_bytes": 1099511627776}},
+      "top": [{"working_environment_id": "VsaWorkingEnvironment-3txYJOsX", "name": "aggr1", "total_bytes": 1099511627776,
+               "used_bytes": 879609302220, "utilization": 80.0}]
+    },
+    "volumes": {}
+  }'
+  version_added: 21.25.0
+fleet_snapshot:
+  description:
+    - when fleet_snapshot is set, the path of the file, and the number of rows written for each table.
+  returned: success, when fleet_snapshot is set
+  type: dict
+  sample: '{
+    "fleet_snapshot": {
+      "path": "/var/tmp/cloudmanager_fleet.snapshot",
+      "rows": {"working_environments": 12, "aggregates": 30, "volumes": 1200}
+    }
+  }'
+  version_added: 21.25.0
+delta:
+  description:
+    - when since_snapshot is set, the number of added, changed, removed, and unchanged objects for each subset.
+    - kept counts the objects that could not be fetched, they are reported neither as removed nor as changed.
+    - baseline is true when there was no usable snapshot, and all objects are reported as added.
+    - in this mode, each subset in info is a dictionary with added and changed records keyed by id, and a list of removed ids.
+  returned: success, when since_snapshot is set
+  type: dict
+  sample: '{
+    "delta": {
+      "path": "/var/tmp/cloudmanager_info.snapshot",
+      "baseline": false,
+      "counts": {
+        "working_environments_info": {"added": 1, "changed": 0, "removed": 0, "unchanged": 11, "kept": 0}
+      }
+    }
+  }'
+  version_added: 21.25.0
 """
 
+import gzip
+import hashlib
+import json
+import os
+import re
+
 from ansible.module_utils.basic import AnsibleModule
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account import AccountContext
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_fetch import FetchGraph, HAS_FUTURES
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_delta import DeltaSnapshot
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_replication import normalize_relationship, ReplicationSummary
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_filter import WorkingEnvironmentFilter
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_capacity import CapacitySummary
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_columnar import FleetSnapshotWriter
+
+if HAS_FUTURES:
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class NetAppCloudmanagerInfo(object):
@@ -141,86 +506,655 @@ class NetAppCloudmanagerInfo(object):
         self.argument_spec = netapp_utils.cloudmanager_host_argument_spec()
         self.argument_spec.update(dict(
             gather_subsets=dict(type='list', elements='str', default='all'),
-            client_id=dict(required=True, type='str'),
+            client_id=dict(required=False, type='list', elements='str'),
+            all_connectors=dict(required=False, type='bool', default=False),
+            shard_count=dict(required=False, type='int', default=1),
+            shard_index=dict(required=False, type='int', default=0),
+            output_file=dict(required=False, type='path'),
+            output_compress=dict(required=False, type='bool', default=False),
+            all_accounts=dict(required=False, type='bool', default=False),
+            max_concurrent_subsets=dict(required=False, type='int', default=4),
+            since_snapshot=dict(required=False, type='path'),
+            tenant_id=dict(required=False, type='str'),
+            max_concurrent_working_environments=dict(required=False, type='int', default=8),
+            volumes_timeout=dict(required=False, type='int', default=60),
+            volumes_fields=dict(required=False, type='list', elements='str'),
+            snapmirror_relationships=dict(required=False, type='bool', default=True),
+            snapmirror_lag_threshold=dict(required=False, type='int'),
+            filters=dict(required=False, type='dict', options=dict(
+                provider=dict(required=False, type='list', elements='str'),
+                status=dict(required=False, type='list', elements='str'),
+                is_ha=dict(required=False, type='bool'),
+                name_regex=dict(required=False, type='str'),
+                tags=dict(required=False, type='dict'),
+            )),
+            fields=dict(required=False, type='list', elements='str'),
+            capacity_top=dict(required=False, type='int', default=10),
+            fleet_snapshot=dict(required=False, type='path'),
         ))
 
         self.module = AnsibleModule(
             argument_spec=self.argument_spec,
             required_one_of=[['refresh_token', 'sa_client_id']],
             required_together=[['sa_client_id', 'sa_secret_key']],
+            mutually_exclusive=[['output_file', 'since_snapshot']],
             supports_check_mode=True
         )
 
         self.na_helper = NetAppModule()
         # set up state variables
         self.parameters = self.na_helper.set_parameters(self.module.params)
+        if self.parameters['shard_count'] < 1:
+            self.module.fail_json(msg="Error: shard_count must be at least 1, found %d" % self.parameters['shard_count'])
+        if not 0 <= self.parameters['shard_index'] < self.parameters['shard_count']:
+            self.module.fail_json(msg="Error: shard_index must be between 0 and %d, found %d"
+                                  % (self.parameters['shard_count'] - 1, self.parameters['shard_index']))
+        for option in ('max_concurrent_subsets', 'max_concurrent_working_environments', 'volumes_timeout', 'capacity_top'):
+            if self.parameters[option] < 1:
+                self.module.fail_json(msg="Error: %s must be at least 1, found %d" % (option, self.parameters[option]))
+        if bool(self.parameters.get('client_id')) == self.parameters['all_connectors']:
+            self.module.fail_json(msg="Error: exactly one of client_id or all_connectors is required")
+        try:
+            self.we_filter = WorkingEnvironmentFilter(self.parameters.get('filters'))
+        except re.error as exc:
+            self.module.fail_json(msg="Error: invalid name_regex in filters: %s" % str(exc))
         # Calling generic rest_api class
         self.rest_api = CloudManagerRestAPI(self.module)
         self.rest_api.url += self.rest_api.environment_data['CLOUD_MANAGER_HOST']
         self.rest_api.api_root_path = None
+        # account_info, agents_info and active_agents_info share the account lookup
+        self.accounts = AccountContext(self.rest_api, self.na_helper, netapp_utils.get_feature(self.module, 'account_cache_ttl'))
         self.methods = dict(
-            working_environments_info=self.na_helper.get_working_environments_info,
+            working_environments_info=self.get_working_environments_info,
             aggregates_info=self.get_aggregates_info,
             accounts_info=self.na_helper.get_accounts_info,
-            account_info=self.na_helper.get_account_info,
-            agents_info=self.na_helper.get_agents_info,
-            active_agents_info=self.na_helper.get_active_agents_info,
+            account_info=self.accounts.get_account_info,
+            agents_info=self.get_agents_info,
+            active_agents_info=self.get_active_agents_info,
+            volumes_info=self.get_volumes_info,
+            snapmirror_info=self.get_snapmirror_info,
+            capacity_summary=self.get_capacity_summary,
         )
+        # one set of headers per connector, set in apply as the active connectors may need to be looked up
+        # subsets that are not per working environment use the first connector
+        self.connector_headers = []
         self.headers = {}
-        if 'client_id' in self.parameters:
-            self.headers['X-Agent-Id'] = self.rest_api.format_client_id(self.parameters['client_id'])
+        # headers of the connector reporting each working environment, and the working environments in this shard for each connector
+        self.we_headers = {}
+        self.connector_working_environments = {}
+        # with since_snapshot, fingerprints of the previous run
+        self.delta = DeltaSnapshot(self.parameters['since_snapshot']) if self.parameters.get('since_snapshot') else None
+        # each subset, and each input shared by several subsets, is fetched once
+        self.graph = FetchGraph(self.parameters['max_concurrent_subsets'])
+        self.graph.add('working_environments', self.get_connectors_working_environments)
+        self.graph.add('fsx_working_environments', lambda: self.na_helper.get_aws_fsx_working_environments(self.rest_api, self.headers))
+        for func in self.methods:
+            self.graph.add(func, lambda func=func: self.get_info(func, self.rest_api))
+        # these subsets send requests for every working environment, they are not included in 'all', and must be requested by name
+        self.opt_in_subsets = ['volumes_info', 'snapmirror_info', 'capacity_summary']
+        # these subsets report one entry per working environment, and are split across shards
+        self.sharded_subsets = ['working_environments_info', 'aggregates_info', 'volumes_info', 'snapmirror_info', 'capacity_summary']
+        # these subsets return (info, error), other subsets report errors in their info, as they always did
+        self.checked_subsets = ['aggregates_info', 'volumes_info', 'snapmirror_info', 'capacity_summary']
+        # when writing to output_file, these subsets are written one record at a time
+        # an error is yielded as (None, None, error), and ends the iteration
+        self.record_iterators = dict(
+            working_environments_info=self.iter_working_environments_info,
+            aggregates_info=self.iter_aggregates_info,
+            volumes_info=self.iter_volumes_info,
+        )
+        # the subsets collected by this shard, set in apply
+        self.subsets = []
 
-    def get_aggregates_info(self, rest_api, headers):
+    def in_shard(self, working_environment):
         '''
-        Get aggregates info: there are 4 types of working environments.
-        Each of the aggregates will be categorized by working environment type and working environment id
+        Check whether a working environment belongs to the current shard, using a stable hash of its publicId
         '''
-        aggregates = {}
-        # get list of working environments
-        working_environments, error = self.na_helper.get_working_environments_info(rest_api, headers)
+        if self.parameters['shard_count'] == 1:
+            return True
+        # FSx file systems have an id rather than a publicId
+        working_environment_id = working_environment.get('publicId') or working_environment['id']
+        digest = hashlib.sha1(working_environment_id.encode('utf-8')).hexdigest()
+        return int(digest, 16) % self.parameters['shard_count'] == self.parameters['shard_index']
+
+    def get_connectors(self):
+        '''
+        Return the ids of the connectors to query, from client_id, or the active connectors with all_connectors
+        '''
+        if self.parameters['all_connectors']:
+            agents, error = self.accounts.get_active_agents_info(self.parameters['all_accounts'])
+            if error is not None:
+                self.module.fail_json(msg="Error: Failed to get active connectors: %s" % str(error))
+            client_ids = [agent['client_id'] for agent in agents]
+            if not client_ids:
+                self.module.fail_json(msg="Error: no active connector found")
+        else:
+            client_ids = self.parameters['client_id']
+        connectors = []
+        for client_id in client_ids:
+            client_id = self.rest_api.format_client_id(client_id)
+            if client_id not in connectors:
+                connectors.append(client_id)
+        return connectors
+
+    def get_connectors_working_environments(self):
+        '''
+        Get the working environments of all connectors, concurrently, merged by working environment type
+        Remember the connector reporting each working environment, so that it is queried for its aggregates, volumes, or relationships
+        '''
+        def fetch(headers):
+            return self.na_helper.get_working_environments_info(self.rest_api, headers)
+
+        if HAS_FUTURES:
+            with ThreadPoolExecutor(max_workers=min(self.parameters['max_concurrent_working_environments'], len(self.connector_headers))) as executor:
+                results = list(executor.map(fetch, self.connector_headers))
+        else:
+            results = [fetch(headers) for headers in self.connector_headers]
+        merged = {}
+        for headers, (working_environments, error) in zip(self.connector_headers, results):
+            client_id = headers['X-Agent-Id']
+            if error is not None:
+                if len(self.connector_headers) > 1:
+                    error = 'connector %s: %s' % (client_id, str(error))
+                return working_environments, error
+            we_ids = self.connector_working_environments.setdefault(client_id, [])
+            for working_env_type in working_environments:
+                we_list = merged.setdefault(working_env_type, [])
+                for we in working_environments[working_env_type]:
+                    if we['publicId'] in self.we_headers or not self.we_filter.match(we):
+                        # already reported by another connector, or excluded by filters
+                        continue
+                    self.we_headers[we['publicId']] = headers
+                    we_list.append(we)
+                    if self.in_shard(we):
+                        we_ids.append(we['publicId'])
+        return merged, None
+
+    def get_we_headers(self, working_environment_id):
+        '''
+        Return the headers for the connector reporting a working environment, or for the first connector
+        '''
+        return self.we_headers.get(working_environment_id, self.headers)
+
+    def get_agents_info(self, rest_api, headers):
+        return self.accounts.get_agents_info(self.parameters['all_accounts'])
+
+    def get_active_agents_info(self, rest_api, headers):
+        return self.accounts.get_active_agents_info(self.parameters['all_accounts'])
+
+    def get_working_environments_info(self, rest_api, headers):
+        '''
+        Get working environments info, limited to the working environments in the current shard, and to the keys in fields
+        '''
+        working_environments, error = self.graph.get('working_environments')
+        if error is not None or (self.parameters['shard_count'] == 1 and not self.parameters.get('fields')):
+            return working_environments, error
+        # the list is shared with other subsets, and is not modified
+        fields = None if not self.parameters.get('fields') else self.parameters['fields'] + ['publicId']
+        return dict((working_env_type, self.na_helper.project_fields([we for we in working_environments[working_env_type] if self.in_shard(we)], fields))
+                    for working_env_type in working_environments), None
+
+    def iter_working_environments_info(self, rest_api, headers):
+        '''
+        Yield working environments one at a time, as (working environment type, id, record) tuples
+        '''
+        working_environments, error = self.get_working_environments_info(rest_api, headers)
         if error is not None:
-            self.module.fail_json(msg="Error: Failed to get working environments: %s" % str(error))
+            yield None, None, "Error: Failed to get working environments: %s" % str(error)
+            return
+        for working_env_type in working_environments:
+            for we in working_environments[working_env_type]:
+                yield working_env_type, we['publicId'], we
+
+    def iter_aggregates_info(self, rest_api, headers, complete=False, fetched=None):
+        '''
+        Yield aggregates as they are fetched, as (working environment type, id, list of aggregates) tuples
+        With complete, working environments that did not change since the previous run are fetched too
+        fetched optionally maps working environment ids to aggregates already fetched, they are not fetched again
+        '''
+        # get list of working environments, shared with working_environments_info
+        working_environments, error = self.graph.get('working_environments')
+        if error is not None:
+            yield None, None, "Error: Failed to get working environments: %s" % str(error)
+            return
         # Four types of working environments:
         # azureVsaWorkingEnvironments, gcpVsaWorkingEnvironments, onPremWorkingEnvironments, vsaWorkingEnvironments
         for working_env_type in working_environments:
-            we_aggregates = {}
             # get aggregates for each working environment
             for we in working_environments[working_env_type]:
+                if not self.in_shard(we):
+                    continue
+                if self.delta is not None and not complete and self.delta.unchanged('aggregates_info', we['publicId'], we):
+                    # the working environment did not change since the previous run, its aggregates are not fetched again
+                    continue
                 provider = we['cloudProviderName']
                 working_environment_id = we['publicId']
-                self.na_helper.set_api_root_path(we, rest_api)
+                if fetched and working_environment_id in fetched:
+                    yield working_env_type, working_environment_id, fetched[working_environment_id]
+                    continue
+                # subsets run concurrently, so rest_api.api_root_path is not used
+                api_root_path = self.na_helper.get_api_root_path(we)
                 if provider != "Amazon":
-                    api = '%s/aggregates/%s' % (rest_api.api_root_path, working_environment_id)
+                    api = '%s/aggregates/%s' % (api_root_path, working_environment_id)
                 else:
-                    api = '%s/aggregates?workingEnvironmentId=%s' % (rest_api.api_root_path, working_environment_id)
-                response, error, dummy = rest_api.get(api, None, header=headers)
+                    api = '%s/aggregates?workingEnvironmentId=%s' % (api_root_path, working_environment_id)
+                response, error, dummy = rest_api.get(api, None, header=self.get_we_headers(working_environment_id))
                 if error:
-                    self.module.fail_json(msg="Error: Failed to get aggregate list: %s" % str(error))
+                    yield None, None, "Error: Failed to get aggregate list: %s" % str(error)
+                    return
+                yield working_env_type, working_environment_id, response
+            # report empty types, as get_aggregates_info does
+            yield working_env_type, None, None
+
+    def get_aggregates_info(self, rest_api, headers):
+        '''
+        Get aggregates info: there are 4 types of working environments.
+        Each of the aggregates will be categorized by working environment type and working environment id
+        :return: aggregates, error
+        '''
+        aggregates = {}
+        for working_env_type, working_environment_id, response in self.iter_aggregates_info(rest_api, headers):
+            if working_env_type is None:
+                return None, response
+            we_aggregates = aggregates.setdefault(working_env_type, {})
+            if working_environment_id is not None:
                 we_aggregates[working_environment_id] = response
-            aggregates[working_env_type] = we_aggregates
-        return aggregates
+        return aggregates, None
+
+    def get_shard_working_environments(self, include_fsx=True):
+        '''
+        Return the working environment types, and the (working environment type, id, record) tuples of the working environments in this shard
+        AWS FSx file systems are included when tenant_id is set
+        :return: working environment types, entries, error
+        '''
+        working_environments, error = self.graph.get('working_environments')
+        if error is not None:
+            return None, None, "Error: Failed to get working environments: %s" % str(error)
+        working_env_types = list(working_environments)
+        entries = [(working_env_type, we['publicId'], we) for working_env_type in working_environments for we in working_environments[working_env_type]]
+        if include_fsx and self.parameters.get('tenant_id'):
+            file_systems, error = self.graph.get('fsx_working_environments')
+            if error is not None:
+                return None, None, "Error: Failed to get AWS FSx working environments: %s" % str(error)
+            working_env_types.append('fsxWorkingEnvironments')
+            entries.extend(('fsxWorkingEnvironments', we['id'], we) for we in file_systems or [] if self.we_filter.match(we, provider='Amazon'))
+        return working_env_types, [entry for entry in entries if self.in_shard(entry[2])], None
+
+    def get_we_volumes(self, working_env_type, working_environment_id, we):
+        '''
+        Get the volumes of a working environment, limited to the keys in volumes_fields
+        :return: list of volumes, error
+        '''
+        response, error = self.fetch_we_volumes(working_env_type, working_environment_id, we)
+        if error is None and self.parameters.get('volumes_fields'):
+            response = self.na_helper.project_fields(response, self.parameters['volumes_fields'])
+        return response, error
+
+    def fetch_we_volumes(self, working_env_type, working_environment_id, we):
+        '''
+        Get the volumes of a working environment, using the provider API root path
+        :return: list of volumes, error
+        '''
+        if working_env_type == 'fsxWorkingEnvironments':
+            api = '/occm/api/fsx/volumes?fileSystemId=%s' % working_environment_id
+        elif we.get('workingEnvironmentType') == 'ON_PREM':
+            api = '/occm/api/onprem/volumes?workingEnvironmentId=%s' % working_environment_id
+        else:
+            api = '%s/volumes?workingEnvironmentId=%s' % (self.na_helper.get_api_root_path(we), working_environment_id)
+        response, error, dummy = self.rest_api.get(api, None, header=self.get_we_headers(working_environment_id), timeout=self.parameters['volumes_timeout'])
+        if error is not None:
+            return None, error
+        return response, None
+
+    def iter_concurrently(self, subset, entries, fetch, skip_unchanged=True):
+        '''
+        Call fetch for each (working environment type, id, record) entry, concurrently, and yield (working environment type, id, response) as they complete
+        Working environments reporting an error are skipped with a warning, with since_snapshot they are kept from the previous run
+        '''
+        if self.delta is not None and skip_unchanged:
+            # working environments that did not change since the previous run are not fetched again
+            entries = [entry for entry in entries if not self.delta.unchanged(subset, entry[1], entry[2])]
+        if not entries:
+            return
+        for working_env_type, working_environment_id, response, error in self.iter_results(entries, fetch):
+            if error is not None:
+                self.module.warn('Failed to get %s for working environment %s: %s' % (subset, working_environment_id, str(error)))
+                if self.delta is not None and skip_unchanged:
+                    self.delta.keep(subset, working_environment_id)
+                continue
+            yield working_env_type, working_environment_id, response
+
+    def iter_results(self, entries, fetch):
+        '''
+        Call fetch for each entry, and yield (working environment type, id, response, error) as they complete
+        Without concurrent.futures, on python 2.7 without the futures backport, entries are fetched sequentially
+        '''
+        if not HAS_FUTURES:
+            for working_env_type, working_environment_id, we in entries:
+                response, error = fetch(working_env_type, working_environment_id, we)
+                yield working_env_type, working_environment_id, response, error
+            return
+        with ThreadPoolExecutor(max_workers=min(self.parameters['max_concurrent_working_environments'], len(entries))) as executor:
+            futures = dict((executor.submit(fetch, *entry), entry) for entry in entries)
+            for future in as_completed(futures):
+                working_env_type, working_environment_id, dummy = futures[future]
+                response, error = future.result()
+                yield working_env_type, working_environment_id, response, error
+
+    def iter_volumes_info(self, rest_api, headers, complete=False, fetched=None):
+        '''
+        Yield volumes as they are fetched, concurrently, as (working environment type, id, list of volumes) tuples
+        With complete, all keys are kept, and working environments that did not change since the previous run are fetched too
+        fetched optionally maps working environment ids to volumes already fetched with all keys, they are not fetched again
+        '''
+        working_env_types, entries, error = self.get_shard_working_environments()
+        if error is not None:
+            yield None, None, error
+            return
+        if fetched:
+            for entry in entries:
+                if entry[1] in fetched:
+                    yield entry[0], entry[1], fetched[entry[1]]
+            entries = [entry for entry in entries if entry[1] not in fetched]
+        fetch = self.fetch_we_volumes if complete else self.get_we_volumes
+        for entry in self.iter_concurrently('volumes_info', entries, fetch, skip_unchanged=not complete):
+            yield entry
+        # report empty types, as iter_aggregates_info does
+        for working_env_type in working_env_types:
+            yield working_env_type, None, None
+
+    def get_volumes_info(self, rest_api, headers):
+        '''
+        Get volumes info for all working environments, categorized by working environment type and working environment id
+        :return: volumes, error
+        '''
+        volumes = {}
+        for working_env_type, working_environment_id, response in self.iter_volumes_info(rest_api, headers):
+            if working_env_type is None:
+                return None, response
+            we_volumes = volumes.setdefault(working_env_type, {})
+            if working_environment_id is not None:
+                we_volumes[working_environment_id] = response
+        return volumes, None
+
+    def get_we_replication_status(self, working_env_type, working_environment_id, we):
+        '''
+        Get the relationships with this working environment as source, as compact records
+        :return: list of relationships, error
+        '''
+        api = '/occm/api/replication/status/%s' % working_environment_id
+        response, error, dummy = self.rest_api.get(api, None, header=self.get_we_headers(working_environment_id))
+        if error is not None:
+            return None, error
+        relationships = [normalize_relationship(record) for record in response or []]
+        # a relationship is reported for its source and its destination, only keep it once
+        return [relationship for relationship in relationships if relationship['source_working_environment_id'] in (None, working_environment_id)], None
+
+    def get_snapmirror_info(self, rest_api, headers):
+        '''
+        Get the snapmirror relationships of all working environments, and fleet statistics computed as they are fetched
+        :return: info, error
+        '''
+        dummy, entries, error = self.get_shard_working_environments(include_fsx=False)
+        if error is not None:
+            return None, error
+        summary = ReplicationSummary(self.parameters.get('snapmirror_lag_threshold'))
+        relationships = []
+        # lag times change all the time, so working environments are always fetched again with since_snapshot
+        for dummy_type, dummy_id, response in self.iter_concurrently('snapmirror_info', entries, self.get_we_replication_status, skip_unchanged=False):
+            for relationship in response:
+                summary.add(relationship)
+            if self.parameters['snapmirror_relationships']:
+                relationships.extend(response)
+        info = dict(summary=summary.summary())
+        if self.parameters['snapmirror_relationships']:
+            # working environments complete in any order
+            sort_keys = ('source_working_environment_id', 'source_svm_name', 'source_volume_name')
+            info['relationships'] = sorted(relationships, key=lambda relationship: [relationship[key] or '' for key in sort_keys])
+        return info, None
+
+    def get_complete_subset(self, func):
+        '''
+        Return (working environment id, records) tuples for aggregates_info or volumes_info, with all working environments in the shard and all keys
+        The subset is shared with the subset itself when both are collected, so the records are fetched once
+        With since_snapshot, the subset only has the working environments that changed, the other ones are fetched
+        :return: list of tuples, error
+        '''
+        fetched = None
+        if (func == 'aggregates_info' or not self.parameters.get('volumes_fields')) and (self.delta is None or func in self.subsets):
+            result, error = self.graph.get(func)
+            if error is not None:
+                return None, error
+            entries = [(working_environment_id, records)
+                       for working_env_type in result for working_environment_id, records in result[working_env_type].items()]
+            if self.delta is None:
+                return entries, None
+            fetched = dict(entries)
+        entries = []
+        for working_env_type, working_environment_id, records in self.record_iterators[func](self.rest_api, self.headers, complete=True, fetched=fetched):
+            if working_env_type is None:
+                return None, records
+            if working_environment_id is not None:
+                entries.append((working_environment_id, records))
+        return entries, None
+
+    def get_capacity_summary(self, rest_api, headers):
+        '''
+        Get capacity totals by working environment, provider and tier, utilization percentiles, and top consumers, for aggregates and volumes
+        :return: summary, error
+        '''
+        dummy, entries, error = self.get_shard_working_environments()
+        if error is not None:
+            return None, error
+        # AWS FSx file systems do not report a provider
+        providers = dict((working_environment_id, 'Amazon' if working_env_type == 'fsxWorkingEnvironments' else we.get('cloudProviderName'))
+                         for working_env_type, working_environment_id, we in entries)
+        summary = CapacitySummary()
+        aggregates_entries, error = self.get_complete_subset('aggregates_info')
+        if error is not None:
+            return None, error
+        for working_environment_id, aggregates in aggregates_entries:
+            summary.add_aggregates(working_environment_id, providers.get(working_environment_id), aggregates)
+        volumes_entries, error = self.get_complete_subset('volumes_info')
+        if error is not None:
+            return None, error
+        for working_environment_id, volumes in volumes_entries:
+            summary.add_volumes(working_environment_id, providers.get(working_environment_id), volumes)
+        return summary.summary(self.parameters['capacity_top']), None
+
+    def write_fleet_snapshot(self):
+        '''
+        Write the working environments, aggregates and volumes in this shard to fleet_snapshot
+        :return: path and number of rows for each table
+        '''
+        path = self.parameters['fleet_snapshot']
+        writer = FleetSnapshotWriter()
+        dummy, entries, error = self.get_shard_working_environments()
+        if error is not None:
+            self.module.fail_json(msg=error)
+        for working_env_type, working_environment_id, we in entries:
+            # AWS FSx file systems do not report a provider
+            writer.add_working_environment(working_env_type, working_environment_id, we,
+                                           provider='Amazon' if working_env_type == 'fsxWorkingEnvironments' else None)
+        for func, add in (('aggregates_info', writer.add_aggregates), ('volumes_info', writer.add_volumes)):
+            entries, error = self.get_complete_subset(func)
+            if error is not None:
+                self.module.fail_json(msg=error)
+            for working_environment_id, records in entries:
+                add(working_environment_id, records)
+        if self.module.check_mode:
+            return dict(path=path, rows=writer.counts())
+        try:
+            rows = writer.write(path)
+        except (OSError, IOError) as exc:
+            self.module.fail_json(msg="Error: writing to %s: %s" % (path, str(exc)))
+        return dict(path=path, rows=rows)
+
+    def get_objects(self, func, result):
+        '''
+        Split the result of a subset into objects keyed by id, to compare them with the previous run
+        '''
+        if func == 'working_environments_info':
+            working_environments, error = result
+            if error is not None:
+                self.module.fail_json(msg="Error: Failed to get working environments: %s" % str(error))
+            return dict((we['publicId'], we) for working_env_type in working_environments for we in working_environments[working_env_type])
+        if func in ('aggregates_info', 'volumes_info'):
+            return dict((working_environment_id, aggregates) for working_env_type in result
+                        for working_environment_id, aggregates in result[working_env_type].items())
+        return {func: result}
+
+    def get_delta(self, info):
+        '''
+        Report the objects that changed since the previous run, and save the fingerprints of this run
+        '''
+        info = dict((func, self.delta.diff(func, self.get_objects(func, result))) for func, result in info.items())
+        if not self.module.check_mode:
+            try:
+                self.delta.save()
+            except (OSError, IOError) as exc:
+                self.module.fail_json(msg="Error: writing to %s: %s" % (self.delta.path, str(exc)))
+        return info, dict(path=self.delta.path, baseline=self.delta.baseline, counts=self.delta.counts)
 
     def get_info(self, func, rest_api):
         '''
-        Main get info function
+        Main get info function, called from worker threads, so that errors are returned rather than reported with fail_json
+        :return: info, error
         '''
-        return self.methods[func](rest_api, self.headers)
+        if func in self.checked_subsets:
+            return self.methods[func](rest_api, self.headers)
+        return self.methods[func](rest_api, self.headers), None
 
-    def apply(self):
+    def write_records(self, func, fh):
         '''
-        Apply action to the Cloud Manager
-        :return: None
+        Fetch a subset and write its records to the output file as they are received
+        :return: number of records, error
         '''
-        info = {}
-        if 'all' in self.parameters['gather_subsets']:
-            self.parameters['gather_subsets'] = self.methods.keys()
-        for func in self.parameters['gather_subsets']:
+        count = 0
+        if func == 'aggregates_info' and ('capacity_summary' in self.subsets or self.parameters.get('fleet_snapshot')):
+            # the aggregates are kept in the graph, and shared with capacity_summary and fleet_snapshot rather than fetched again
+            aggregates, error = self.graph.get(func)
+            if error is not None:
+                return count, error
+            for working_env_type in aggregates:
+                for working_environment_id, record in aggregates[working_env_type].items():
+                    line = dict(subset=func, record=record, working_environment_type=working_env_type, working_environment_id=working_environment_id)
+                    fh.write((json.dumps(line) + '\n').encode('utf-8'))
+                    count += 1
+        elif func in self.record_iterators:
+            for working_env_type, working_environment_id, record in self.record_iterators[func](self.rest_api, self.headers):
+                if working_env_type is None:
+                    return count, record
+                if working_environment_id is None:
+                    # a working environment type without any working environment
+                    continue
+                line = dict(subset=func, record=record, working_environment_type=working_env_type, working_environment_id=working_environment_id)
+                fh.write((json.dumps(line) + '\n').encode('utf-8'))
+                count += 1
+        else:
+            record, error = self.graph.get(func)
+            if error is not None:
+                return count, error
+            line = dict(subset=func, record=record)
+            fh.write((json.dumps(line) + '\n').encode('utf-8'))
+            count += 1
+        return count, None
+
+    def get_subsets(self):
+        '''
+        Validate gather_subsets and return the subsets to collect for this shard
+        '''
+        subsets = []
+        gather_subsets = self.parameters['gather_subsets']
+        if 'all' in gather_subsets:
+            gather_subsets = [func for func in self.methods if func not in self.opt_in_subsets or func in gather_subsets]
+        for func in gather_subsets:
             if func in self.methods:
-                info[func] = self.get_info(func, self.rest_api)
+                if self.parameters['shard_index'] > 0 and func not in self.sharded_subsets:
+                    # only collected once, by the first shard
+                    continue
+                subsets.append(func)
             else:
                 msg = '%s is not a valid gather_subset. Only %s are allowed' % (func, self.methods.keys())
                 self.module.fail_json(msg=msg)
-        self.module.exit_json(changed=False, info=info)
+        return subsets
+
+    def write_output_file(self, subsets):
+        '''
+        Write all subsets to output_file, and return a summary
+        '''
+        path = self.parameters['output_file']
+        compress = self.parameters['output_compress']
+        records = {}
+        error = None
+        if self.module.check_mode:
+            # the records are collected and counted, but not written
+            with open(os.devnull, 'wb') as fh:
+                for func in subsets:
+                    records[func], error = self.write_records(func, fh)
+                    if error is not None:
+                        self.module.fail_json(msg=error)
+            return dict(path=path, compressed=compress, records=records)
+        # write to a temporary file, so that an existing file is only replaced on success
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            fh = gzip.open(tmp_path, 'wb') if compress else open(tmp_path, 'wb')
+            with fh:
+                for func in subsets:
+                    records[func], error = self.write_records(func, fh)
+                    if error is not None:
+                        break
+            if error is None:
+                os.rename(tmp_path, path)
+        except (OSError, IOError) as exc:
+            self.module.fail_json(msg="Error: writing to %s: %s" % (path, str(exc)))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if error is not None:
+            self.module.fail_json(msg=error)
+        return dict(path=path, compressed=compress, records=records)
+
+    def get_subsets_info(self, subsets):
+        '''
+        Fetch all subsets, concurrently, and report the first error once they complete
+        '''
+        info = {}
+        for func, (result, error) in self.graph.run(subsets).items():
+            if error is not None:
+                self.module.fail_json(msg=error)
+            info[func] = result
+        return info
+
+    def get_connectors_summary(self):
+        '''
+        Report the working environment ids for each connector
+        '''
+        return dict((headers['X-Agent-Id'], self.connector_working_environments.get(headers['X-Agent-Id'], [])) for headers in self.connector_headers)
+
+    def apply(self):
+        '''
+        Apply action to the Cloud Manager
+        :return: None
+        '''
+        subsets = self.subsets = self.get_subsets()
+        self.connector_headers = [{'X-Agent-Id': client_id} for client_id in self.get_connectors()]
+        self.headers = self.connector_headers[0]
+        shard = dict(index=self.parameters['shard_index'], count=self.parameters['shard_count'])
+        results = dict(changed=False, shard=shard)
+        if self.parameters.get('output_file'):
+            results['output'] = self.write_output_file(subsets)
+            results['changed'] = True
+        else:
+            results['info'] = self.get_subsets_info(subsets)
+            if self.delta is not None:
+                results['info'], results['delta'] = self.get_delta(results['info'])
+                results['changed'] = True
+        if self.parameters.get('fleet_snapshot'):
+            results['fleet_snapshot'] = self.write_fleet_snapshot()
+            results['changed'] = True
+        results['connectors'] = self.get_connectors_summary()
+        self.module.exit_json(**results)
 
 
 def main():
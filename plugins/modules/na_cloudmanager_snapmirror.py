@@ -128,6 +128,15 @@ options:
     required: true
     type: str
 
+  intercluster_lifs_cache_ttl:
+    description:
+    - The intercluster LIFs are cached per source and destination working environment for this number of seconds.
+    - This avoids discovering the LIFs again for each relationship between the same clusters.  Set to 0 to disable the cache.
+    - The cache is keyed by user and connector.  The cached entry is discarded if creating the relationship fails.
+    type: int
+    default: 0
+    version_added: 21.25.0
+
 notes:
 - Support check_mode.
 '''
@@ -162,11 +171,17 @@ RETURN = r''' # '''
 
 from ansible.module_utils.basic import AnsibleModule
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
-from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule, WORKING_ENVIRONMENT_LOOKUP_FIELDS
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_snapmirror import build_quote_request, find_snapmirror, \
+    index_replication_status, InterclusterLifs
 
 
 PROVIDER_TO_CAPACITY_TIER = {'amazon': 'S3', 'azure': 'Blob', 'gcp': 'cloudStorage'}
+# keys read from the source volume and aggregate records, the rest of each record is dropped
+VOLUME_FIELDS = ['name', 'svmName', 'size', 'snapshotPolicy', 'deduplication', 'thinProvisioning', 'compression',
+                 'aggregateName', 'providerVolumeType']
+AGGREGATE_FIELDS = ['name', 'providerVolumes']
 
 
 class NetAppCloudmanagerSnapmirror:
@@ -195,6 +210,7 @@ class NetAppCloudmanagerSnapmirror:
             provider_volume_type=dict(required=False, type='str'),
             tenant_id=dict(required=False, type='str'),
             client_id=dict(required=True, type='str'),
+            intercluster_lifs_cache_ttl=dict(required=False, type='int', default=0),
         ))
         self.module = AnsibleModule(
             argument_spec=self.argument_spec,
@@ -221,25 +237,30 @@ class NetAppCloudmanagerSnapmirror:
         }
         if self.rest_api.simulator:
             self.headers.update({'x-simulator': 'true'})
+        # source and destination working environments, resolved once for get and create
+        self.working_environments = None
+        self.interclusterlifs = InterclusterLifs(self.rest_api, self.headers, self.parameters['intercluster_lifs_cache_ttl'])
+
+    def get_working_environments(self):
+        if self.working_environments is None:
+            source_we_info, dest_we_info, err = self.na_helper.get_working_environment_detail_for_snapmirror(self.rest_api, self.headers,
+                                                                                                             WORKING_ENVIRONMENT_LOOKUP_FIELDS)
+            if err is not None:
+                self.module.fail_json(changed=False, msg=err)
+            self.working_environments = source_we_info, dest_we_info
+        return self.working_environments
 
     def get_snapmirror(self):
-        source_we_info, dest_we_info, err = self.na_helper.get_working_environment_detail_for_snapmirror(self.rest_api, self.headers)
-        if err is not None:
-            self.module.fail_json(changed=False, msg=err)
+        source_we_info, dest_we_info = self.get_working_environments()
 
         get_url = '/occm/api/replication/status/%s' % source_we_info['publicId']
         snapmirror_info, err, dummy = self.rest_api.send_request("GET", get_url, None, header=self.headers)
         if err is not None:
             self.module.fail_json(changed=False, msg='Error getting snapmirror relationship %s: %s.' % (err, snapmirror_info))
-        sm_found = False
-        snapmirror = None
-        for sm in snapmirror_info:
-            if sm['destination']['volumeName'] == self.parameters['destination_volume_name']:
-                sm_found = True
-                snapmirror = sm
-                break
-
-        if not sm_found:
+        dest_svm_name = self.parameters.get('destination_svm_name') or dest_we_info.get('svmName')
+        snapmirror = find_snapmirror(index_replication_status(snapmirror_info), dest_we_info.get('publicId'), dest_svm_name,
+                                     self.parameters['destination_volume_name'])
+        if snapmirror is None:
             return None
         result = {
             'source_working_environment_id': source_we_info['publicId'],
@@ -254,9 +275,7 @@ class NetAppCloudmanagerSnapmirror:
         snapmirror_build_data = {}
         replication_request = {}
         replication_volume = {}
-        source_we_info, dest_we_info, err = self.na_helper.get_working_environment_detail_for_snapmirror(self.rest_api, self.headers)
-        if err is not None:
-            self.module.fail_json(changed=False, msg=err)
+        source_we_info, dest_we_info = self.get_working_environments()
         if self.parameters.get('capacity_tier') is not None:
             if self.parameters['capacity_tier'] == 'NONE':
                 self.parameters.pop('capacity_tier')
@@ -300,7 +319,8 @@ class NetAppCloudmanagerSnapmirror:
                 self.parameters['destination_working_environment_name'] = dest_we_info['name']
                 dest_working_env_detail, err = self.na_helper.get_working_environment_details_by_name(self.rest_api,
                                                                                                       self.headers,
-                                                                                                      self.parameters['destination_working_environment_name'])
+                                                                                                      self.parameters['destination_working_environment_name'],
+                                                                                                      fields=WORKING_ENVIRONMENT_LOOKUP_FIELDS)
                 if err:
                     self.module.fail_json(changed=False, msg='Error getting destination info %s: %s.' % (err, dest_working_env_detail))
                 self.parameters['destination_svm_name'] = dest_working_env_detail['svmName']
@@ -351,10 +371,13 @@ class NetAppCloudmanagerSnapmirror:
 
         response, err, on_cloud_request_id = self.rest_api.send_request("POST", api, None, snapmirror_build_data, header=self.headers)
         if err is not None:
+            # the cached LIFs may be stale
+            self.delete_cached_interclusterlifs(source_we_info['publicId'], dest_we_info['publicId'])
             self.module.fail_json(changed=False, msg='Error creating snapmirror relationship %s: %s.' % (err, response))
         wait_on_completion_api_url = '/occm/api/audit/activeTask/%s' % (str(on_cloud_request_id))
         err = self.rest_api.wait_on_completion(wait_on_completion_api_url, "snapmirror", "create", 20, 5)
         if err is not None:
+            self.delete_cached_interclusterlifs(source_we_info['publicId'], dest_we_info['publicId'])
             self.module.fail_json(changed=False, msg=err)
 
     def get_volumes(self, working_environment_detail, name):
@@ -363,7 +386,7 @@ class NetAppCloudmanagerSnapmirror:
             self.rest_api.api_root_path, working_environment_detail['publicId'], name), None, header=self.headers)
         if err is not None:
             self.module.fail_json(changed=False, msg='Error getting volume %s: %s.' % (err, response))
-        return response
+        return self.na_helper.project_fields(response, VOLUME_FIELDS)
 
     def quote_volume(self, quote):
         response, err, on_cloud_request_id = self.rest_api.send_request("POST", '%s/volumes/quote' %
@@ -381,7 +404,7 @@ class NetAppCloudmanagerSnapmirror:
                                                           (working_environment_detail['publicId'], name), None, header=self.headers)
         if err is not None:
             self.module.fail_json(changed=False, msg='Error getting volume on prem %s: %s.' % (err, response))
-        return response
+        return self.na_helper.project_fields(response, VOLUME_FIELDS)
 
     def get_aggregate_detail(self, working_environment_detail, aggregate_name):
         if working_environment_detail['workingEnvironmentType'] == 'ON_PREM':
@@ -397,44 +420,19 @@ class NetAppCloudmanagerSnapmirror:
         response, error, dummy = self.rest_api.get(api, header=self.headers)
         if error:
             self.module.fail_json(msg="Error: Failed to get aggregate list: %s" % str(error))
-        for aggr in response:
+        for aggr in self.na_helper.project_fields(response, AGGREGATE_FIELDS):
             if aggr['name'] == aggregate_name:
                 return aggr
         return None
 
     def build_quote_request(self, source_we_info, dest_we_info, vol_dest_quote):
-        quote = dict()
-        quote['size'] = {'size': vol_dest_quote['size']['size'], 'unit': vol_dest_quote['size']['unit']}
-        quote['name'] = self.parameters['destination_volume_name']
-        quote['snapshotPolicyName'] = vol_dest_quote['snapshotPolicy']
-        quote['enableDeduplication'] = vol_dest_quote['deduplication']
-        quote['enableThinProvisioning'] = vol_dest_quote['thinProvisioning']
-        quote['enableCompression'] = vol_dest_quote['compression']
-        quote['verifyNameUniqueness'] = True
-        quote['replicationFlow'] = True
-
         # Use source working environment to get physical properties info of volumes
         aggregate = self.get_aggregate_detail(source_we_info, vol_dest_quote['aggregateName'])
         if aggregate is None:
             self.module.fail_json(changed=False, msg='Error getting aggregate on source volume')
-        # All the volumes in one aggregate have the same physical properties
-        if source_we_info['workingEnvironmentType'] != 'ON_PREM':
-            if aggregate['providerVolumes'][0]['diskType'] == 'gp3' or aggregate['providerVolumes'][0]['diskType'] == 'io1'\
-                    or aggregate['providerVolumes'][0]['diskType'] == 'io2':
-                quote['iops'] = aggregate['providerVolumes'][0]['iops']
-            if aggregate['providerVolumes'][0]['diskType'] == 'gp3':
-                quote['throughput'] = aggregate['providerVolumes'][0]['throughput']
-            quote['workingEnvironmentId'] = dest_we_info['publicId']
-            quote['svmName'] = self.parameters['destination_svm_name']
-        if self.parameters.get('capacity_tier') is not None:
-            quote['capacityTier'] = self.parameters['capacity_tier']
-
-        if self.parameters.get('provider_volume_type') is None:
-            quote['providerVolumeType'] = vol_dest_quote['providerVolumeType']
-        else:
-            quote['providerVolumeType'] = self.parameters['provider_volume_type']
-
-        return quote
+        return build_quote_request(source_we_info, dest_we_info, vol_dest_quote, aggregate, self.parameters['destination_volume_name'],
+                                   self.parameters['destination_svm_name'], self.parameters.get('capacity_tier'),
+                                   self.parameters.get('provider_volume_type'))
 
     def delete_snapmirror(self, sm_detail):
         api_delete = '/occm/api/replication/%s/%s/%s' %\
@@ -443,11 +441,13 @@ class NetAppCloudmanagerSnapmirror:
         if err is not None:
             self.module.fail_json(changed=False, msg='Error deleting snapmirror relationship %s: %s.' % (err, dummy))
 
+    def delete_cached_interclusterlifs(self, source_we_id, dest_we_id):
+        self.interclusterlifs.delete(source_we_id, dest_we_id)
+
     def get_interclusterlifs(self, source_we_id, dest_we_id):
-        api_get = '/occm/api/replication/intercluster-lifs?peerWorkingEnvironmentId=%s&workingEnvironmentId=%s' % (dest_we_id, source_we_id)
-        response, err, dummy_second = self.rest_api.send_request("GET", api_get, None, header=self.headers)
+        response, err = self.interclusterlifs.get(source_we_id, dest_we_id)
         if err is not None:
-            self.module.fail_json(changed=False, msg='Error getting interclusterlifs %s: %s.' % (err, response))
+            self.module.fail_json(changed=False, msg=err)
         return response
 
     def apply(self):
@@ -0,0 +1,615 @@
+#!/usr/bin/python
+
+# (c) 2022, NetApp, Inc
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''
+na_cloudmanager_snapmirror_bulk
+'''
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = '''
+
+module: na_cloudmanager_snapmirror_bulk
+short_description: NetApp Cloud Manager SnapMirror, for a list of relationships
+extends_documentation_fragment:
+    - netapp.cloudmanager.netapp.cloudmanager
+version_added: '21.25.0'
+author: NetApp Ansible Team (@carchi8py) <ng-ansibleteam@netapp.com>
+
+description:
+- Create or Delete a list of SnapMirror relationships on Cloud Manager.
+- Relationships are grouped by source and destination working environments.
+- The replication status, intercluster LIFs, source volumes and aggregates are only fetched once per group.
+- Quotes, creates and deletes are run concurrently, with a limit per destination working environment.
+- The Cloud Manager tasks for all the relationships are polled together.
+
+options:
+
+  relationships:
+    description:
+    - The list of SnapMirror relationships.
+    - Each relationship supports the same options as M(netapp.cloudmanager.na_cloudmanager_snapmirror).
+    - AWS FSx destinations are not supported, use M(netapp.cloudmanager.na_cloudmanager_snapmirror) instead.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      state:
+        description:
+        - Whether the specified snapmirror relationship should exist or not.
+        choices: ['present', 'absent']
+        default: 'present'
+        type: str
+      source_working_environment_name:
+        description:
+        - The working environment name of the source volume.
+        type: str
+      destination_working_environment_name:
+        description:
+        - The working environment name of the destination volume.
+        type: str
+      source_working_environment_id:
+        description:
+        - The public ID of the working environment of the source volume.
+        type: str
+      destination_working_environment_id:
+        description:
+        - The public ID of the working environment of the destination volume.
+        type: str
+      destination_aggregate_name:
+        description:
+        - The aggregate in which the volume will be created.
+        - If not provided, Cloud Manager chooses the best aggregate for you.
+        type: str
+      policy:
+        description:
+        - The SnapMirror policy name.
+        type: str
+        default: 'MirrorAllSnapshots'
+      max_transfer_rate:
+        description:
+        - Maximum transfer rate limit KB/s.
+        - Use 0 for no limit, otherwise use number between 1024 and 2,147,482,624.
+        type: int
+        default: 100000
+      source_svm_name:
+        description:
+        - The name of the source SVM.
+        - The default SVM name is used, if a name is not provided.
+        type: str
+      destination_svm_name:
+        description:
+        - The name of the destination SVM.
+        - The default SVM name is used, if a name is not provided.
+        type: str
+      source_volume_name:
+        description:
+        - The name of the source volume.
+        required: true
+        type: str
+      destination_volume_name:
+        description:
+        - The name of the destination volume to be created for snapmirror relationship.
+        required: true
+        type: str
+      schedule:
+        description:
+        - The name of the Schedule.
+        type: str
+        default: '1hour'
+      provider_volume_type:
+        description:
+        - The underlying cloud provider volume type.
+        - For AWS ['gp3', 'gp2', 'io1', 'st1', 'sc1'].
+        - For Azure ['Premium_LRS','Standard_LRS','StandardSSD_LRS'].
+        - For GCP ['pd-balanced','pd-ssd','pd-standard'].
+        type: str
+      capacity_tier:
+        description:
+        - The volume capacity tier for tiering cold data to object storage.
+        - The default values for each cloud provider are as follows, Amazon 'S3', Azure 'Blob', GCP 'cloudStorage'.
+        - If NONE, the capacity tier will not be set on volume creation.
+        type: str
+        choices: ['S3', 'Blob', 'cloudStorage', 'NONE']
+
+  client_id:
+    description:
+    - The connector ID of the Cloud Manager Connector.
+    required: true
+    type: str
+
+  max_concurrent_operations:
+    description:
+    - The maximum number of requests or Cloud Manager tasks running at the same time.
+    type: int
+    default: 8
+
+  max_concurrent_per_destination:
+    description:
+    - The maximum number of relationships being created or deleted at the same time for a destination working environment.
+    type: int
+    default: 1
+
+  intercluster_lifs_cache_ttl:
+    description:
+    - The intercluster LIFs are cached per source and destination working environment for this number of seconds.
+    - The cache is keyed by user and connector, and shared with M(netapp.cloudmanager.na_cloudmanager_snapmirror).  Set to 0 to disable the cache.
+    - Within a run, the LIFs are fetched once per pair of working environments, whether the cache is enabled or not.
+    type: int
+    default: 0
+
+  wait_timeout:
+    description:
+    - How long to wait in seconds for each quote or create task to complete.
+    type: int
+    default: 100
+
+  wait_interval:
+    description:
+    - How long to wait in seconds between two polls of the pending tasks.
+    type: int
+    default: 5
+
+notes:
+- Support check_mode.
+'''
+
+EXAMPLES = '''
+- name: Create snapmirror relationships
+  netapp.cloudmanager.na_cloudmanager_snapmirror_bulk:
+    relationships:
+      - source_working_environment_name: source
+        destination_working_environment_name: dest
+        source_volume_name: vol1
+        destination_volume_name: vol1_copy
+      - source_working_environment_name: source
+        destination_working_environment_name: dest
+        source_volume_name: vol2
+        destination_volume_name: vol2_copy
+        schedule: 5min
+    max_concurrent_per_destination: 2
+    client_id: client_id
+    refresh_token: refresh_token
+
+- name: Delete snapmirror relationships
+  netapp.cloudmanager.na_cloudmanager_snapmirror_bulk:
+    relationships:
+      - state: absent
+        source_working_environment_name: source
+        destination_working_environment_name: dest
+        source_volume_name: vol1
+        destination_volume_name: vol1_copy
+    client_id: client_id
+    refresh_token: refresh_token
+'''
+
+RETURN = r'''
+relationships:
+  description:
+    - One entry per relationship, in the same order as the relationships option.
+    - action is create, delete, or null when no change is needed.
+  returned: always
+  type: list
+  sample: '[
+    {
+      "source_working_environment_id": "VsaWorkingEnvironment-abc",
+      "destination_working_environment_id": "VsaWorkingEnvironment-def",
+      "destination_svm_name": "svm_dest",
+      "destination_volume_name": "vol1_copy",
+      "action": "create",
+      "error": null
+    }
+  ]'
+'''
+
+from functools import partial
+import threading
+import time
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule, WORKING_ENVIRONMENT_LOOKUP_FIELDS
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp import CloudManagerRestAPI
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_scheduler import HAS_FUTURES, KeyedScheduler
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_snapmirror import build_quote_request, find_snapmirror, \
+    index_replication_status, InterclusterLifs
+
+if HAS_FUTURES:
+    from concurrent.futures import wait
+
+
+PROVIDER_TO_CAPACITY_TIER = {'amazon': 'S3', 'azure': 'Blob', 'gcp': 'cloudStorage'}
+# keys read from the source volume and aggregate records, the rest of each record is dropped
+VOLUME_FIELDS = ['name', 'svmName', 'size', 'snapshotPolicy', 'deduplication', 'thinProvisioning', 'compression',
+                 'aggregateName', 'providerVolumeType']
+AGGREGATE_FIELDS = ['name', 'providerVolumes']
+
+
+class TaskPoller(object):
+    '''
+    Cloud Manager tasks submitted by the worker threads are polled together by the main thread.
+    A worker calls wait(), and is blocked until poll() sees the task completed or the timeout expires.
+    If the main thread stops polling, cancel() releases the workers that are still waiting.
+    '''
+
+    def __init__(self, rest_api, timeout):
+        self.rest_api = rest_api
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def wait(self, task_id, action_name, task, interval=5):
+        entry = dict(event=threading.Event(), error=None, deadline=time.time() + self.timeout, action_name=action_name, task=task)
+        with self.lock:
+            self.pending[task_id] = entry
+        # poll() reports the timeout, this is a safety net in case the main thread is not polling
+        if not entry['event'].wait(self.timeout + interval):
+            with self.lock:
+                self.pending.pop(task_id, None)
+            return 'Taking too long for %s to %s or not properly setup' % (action_name, task)
+        return entry['error']
+
+    def cancel(self, error):
+        ''' release all waiting workers with an error '''
+        with self.lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+        for entry in pending:
+            entry['error'] = error
+            entry['event'].set()
+
+    def poll(self):
+        ''' check the status of all pending tasks once '''
+        with self.lock:
+            pending = list(self.pending.items())
+        for task_id, entry in pending:
+            status, failure_error_message, error = self.rest_api.check_task_status('/occm/api/audit/activeTask/%s' % task_id)
+            if error is not None:
+                entry['error'] = error
+            elif status == -1:
+                entry['error'] = 'Failed to %s %s, error: %s' % (entry['task'], entry['action_name'], failure_error_message)
+            elif status == 0 and time.time() < entry['deadline']:
+                continue
+            elif status == 0:
+                entry['error'] = 'Taking too long for %s to %s or not properly setup' % (entry['action_name'], entry['task'])
+            with self.lock:
+                del self.pending[task_id]
+            entry['event'].set()
+
+
+class NetAppCloudmanagerSnapmirrorBulk:
+
+    def __init__(self):
+        """
+        Parse arguments, setup state variables,
+        check parameters and ensure request module is installed
+        """
+        self.argument_spec = netapp_utils.cloudmanager_host_argument_spec()
+        self.argument_spec.update(dict(
+            relationships=dict(required=True, type='list', elements='dict', options=dict(
+                state=dict(required=False, choices=['present', 'absent'], default='present'),
+                source_working_environment_id=dict(required=False, type='str'),
+                destination_working_environment_id=dict(required=False, type='str'),
+                source_working_environment_name=dict(required=False, type='str'),
+                destination_working_environment_name=dict(required=False, type='str'),
+                destination_aggregate_name=dict(required=False, type='str'),
+                policy=dict(required=False, type='str', default='MirrorAllSnapshots'),
+                max_transfer_rate=dict(required=False, type='int', default=100000),
+                schedule=dict(required=False, type='str', default='1hour'),
+                source_svm_name=dict(required=False, type='str'),
+                destination_svm_name=dict(required=False, type='str'),
+                source_volume_name=dict(required=True, type='str'),
+                destination_volume_name=dict(required=True, type='str'),
+                capacity_tier=dict(required=False, type='str', choices=['NONE', 'S3', 'Blob', 'cloudStorage']),
+                provider_volume_type=dict(required=False, type='str'),
+            ), required_one_of=[
+                ['source_working_environment_id', 'source_working_environment_name'],
+                ['destination_working_environment_id', 'destination_working_environment_name'],
+            ]),
+            client_id=dict(required=True, type='str'),
+            max_concurrent_operations=dict(required=False, type='int', default=8),
+            max_concurrent_per_destination=dict(required=False, type='int', default=1),
+            intercluster_lifs_cache_ttl=dict(required=False, type='int', default=0),
+            wait_timeout=dict(required=False, type='int', default=100),
+            wait_interval=dict(required=False, type='int', default=5),
+        ))
+        self.module = AnsibleModule(
+            argument_spec=self.argument_spec,
+            required_one_of=[
+                ['refresh_token', 'sa_client_id'],
+            ],
+            required_together=(['sa_client_id', 'sa_secret_key'],),
+            supports_check_mode=True
+        )
+
+        if not HAS_FUTURES:
+            self.module.fail_json(msg=missing_required_lib('futures'))
+
+        self.na_helper = NetAppModule()
+        # set up state variables
+        self.parameters = self.na_helper.set_parameters(self.module.params)
+        for option in ('max_concurrent_operations', 'max_concurrent_per_destination'):
+            if self.parameters[option] < 1:
+                self.module.fail_json(msg="Error: %s must be at least 1, found %d" % (option, self.parameters[option]))
+
+        self.rest_api = CloudManagerRestAPI(self.module)
+        self.rest_api.url += self.rest_api.environment_data['CLOUD_MANAGER_HOST']
+        self.rest_api.api_root_path = None
+        self.headers = {
+            'X-Agent-Id': self.rest_api.format_client_id(self.parameters['client_id'])
+        }
+        if self.rest_api.simulator:
+            self.headers.update({'x-simulator': 'true'})
+        # creates and deletes are keyed on the destination working environment id
+        self.scheduler = KeyedScheduler(self.parameters['max_concurrent_operations'], self.parameters['max_concurrent_per_destination'])
+        # set in apply(), once the working environments are known
+        self.api_root_paths = {}
+        self.poller = None
+        self.interclusterlifs = InterclusterLifs(self.rest_api, self.headers, self.parameters['intercluster_lifs_cache_ttl'])
+
+    def run_concurrently(self, funcs, scheduler_keys=None):
+        '''
+        Run a dict of functions with the scheduler, and return a dict of results with the same keys
+        scheduler_keys optionally maps each key to a scheduler key, functions with the same scheduler key are limited by max_concurrent_per_destination
+        While waiting, the main thread polls the Cloud Manager tasks started by the functions.
+        '''
+        scheduler_keys = scheduler_keys or {}
+        futures = dict((key, self.scheduler.submit(scheduler_keys.get(key), func)) for key, func in funcs.items())
+        timeout = None if self.poller is None else self.parameters['wait_interval']
+        try:
+            while wait(futures.values(), timeout=timeout).not_done:
+                self.poller.poll()
+        finally:
+            if self.poller is not None:
+                self.poller.cancel('Error: stopped polling Cloud Manager tasks')
+        return dict((key, future.result()) for key, future in futures.items())
+
+    def get_working_environments(self):
+        '''
+        Resolve the working environments for all relationships, using a single working environment list
+        Return a dict of working environment details indexed by publicId, and the source and destination ids for each relationship
+        '''
+        working_environments, error = self.na_helper.get_working_environments_info(self.rest_api, self.headers, WORKING_ENVIRONMENT_LOOKUP_FIELDS)
+        if error is not None:
+            self.module.fail_json(changed=False, msg="Error getting WE info: %s: %s" % (error, working_environments))
+        by_id, by_name = {}, {}
+        for values in working_environments.values():
+            for we in values:
+                by_id[we['publicId']] = we
+                by_name.setdefault(we['name'], we)
+        pairs = []
+        for relationship in self.parameters['relationships']:
+            pair = []
+            for side in ('source', 'destination'):
+                we_id = relationship.get('%s_working_environment_id' % side)
+                we_name = relationship.get('%s_working_environment_name' % side)
+                we = by_id.get(we_id) if we_id else by_name.get(we_name)
+                if we is None:
+                    self.module.fail_json(changed=False, msg="Error: cannot find %s working environment %s" % (side, we_id or we_name))
+                pair.append(we['publicId'])
+            pairs.append(tuple(pair))
+        return by_id, pairs
+
+    def get_api_root_paths(self, working_environments):
+        ''' set_api_root_path updates the shared rest_api object, so this is done before starting any thread '''
+        api_root_paths = {}
+        for we_id, we in working_environments.items():
+            if we.get('workingEnvironmentType') == 'ON_PREM':
+                continue
+            self.na_helper.set_api_root_path(we, self.rest_api)
+            api_root_paths[we_id] = self.rest_api.api_root_path
+        return api_root_paths
+
+    def get_replication_status(self, source_we_id):
+        response, err, dummy = self.rest_api.send_request("GET", '/occm/api/replication/status/%s' % source_we_id, None, header=self.headers)
+        if err is not None:
+            return None, 'Error getting snapmirror relationship %s: %s.' % (err, response)
+        return index_replication_status(response), None
+
+    def get_source_volumes(self, source_we):
+        if source_we['workingEnvironmentType'] != 'ON_PREM':
+            api = '%s/volumes?workingEnvironmentId=%s' % (self.api_root_paths[source_we['publicId']], source_we['publicId'])
+        else:
+            api = '/occm/api/onprem/volumes?workingEnvironmentId=%s' % source_we['publicId']
+        response, err, dummy = self.rest_api.send_request("GET", api, None, header=self.headers)
+        if err is not None:
+            return None, 'Error getting volume %s: %s.' % (err, response)
+        return self.na_helper.project_fields(response, VOLUME_FIELDS), None
+
+    def get_aggregates(self, source_we):
+        if source_we['workingEnvironmentType'] == 'ON_PREM':
+            api = "/occm/api/onprem/aggregates?workingEnvironmentId=%s" % source_we['publicId']
+        elif source_we['cloudProviderName'] != "Amazon":
+            api = '%s/aggregates/%s' % (self.api_root_paths[source_we['publicId']], source_we['publicId'])
+        else:
+            api = '%s/aggregates?workingEnvironmentId=%s' % (self.api_root_paths[source_we['publicId']], source_we['publicId'])
+        response, error, dummy = self.rest_api.get(api, header=self.headers)
+        if error:
+            return None, "Error: Failed to get aggregate list: %s" % str(error)
+        return dict((aggr['name'], aggr) for aggr in self.na_helper.project_fields(response, AGGREGATE_FIELDS)), None
+
+    def get_source_details(self, source_we):
+        ''' volumes and aggregates for a source working environment, only needed to create relationships '''
+        volumes, error = self.get_source_volumes(source_we)
+        if error is not None:
+            return None, error
+        aggregates, error = self.get_aggregates(source_we)
+        if error is not None:
+            return None, error
+        return dict(volumes=volumes, aggregates=aggregates), None
+
+    @staticmethod
+    def find_source_volume(volumes, relationship):
+        for vol in volumes:
+            if vol['name'] == relationship['source_volume_name'] and \
+                    relationship.get('source_svm_name') in (None, vol['svmName']):
+                return vol
+        return None
+
+    def build_quote_request(self, relationship, source_we, dest_we, source_volume, aggregates, dest_svm_name, capacity_tier):
+        aggregate = aggregates.get(source_volume['aggregateName'])
+        if aggregate is None:
+            return None, 'Error getting aggregate on source volume'
+        return build_quote_request(source_we, dest_we, source_volume, aggregate, relationship['destination_volume_name'], dest_svm_name, capacity_tier,
+                                   relationship.get('provider_volume_type')), None
+
+    def quote_volume(self, dest_we, quote):
+        response, err, on_cloud_request_id = self.rest_api.send_request("POST", '%s/volumes/quote' % self.api_root_paths[dest_we['publicId']],
+                                                                        None, quote, header=self.headers)
+        if err is not None:
+            return None, 'Error quoting destination volume %s: %s.' % (err, response)
+        err = self.poller.wait(on_cloud_request_id, "volume", "quote", self.parameters['wait_interval'])
+        if err is not None:
+            return None, err
+        return response, None
+
+    def create_snapmirror(self, relationship, source_we, dest_we, source_details, interclusterlifs_info):
+        '''
+        Quote the destination volume if needed, and create the relationship
+        Return an error message, or None
+        '''
+        capacity_tier = relationship.get('capacity_tier')
+        if capacity_tier == 'NONE':
+            capacity_tier = None
+        elif capacity_tier is None and dest_we.get('cloudProviderName'):
+            capacity_tier = PROVIDER_TO_CAPACITY_TIER[dest_we['cloudProviderName'].lower()]
+
+        source_volume = self.find_source_volume(source_details['volumes'], relationship)
+        if source_volume is None:
+            return 'source volume not found'
+        dest_svm_name = relationship.get('destination_svm_name') or dest_we.get('svmName')
+        if dest_svm_name is None:
+            return 'Error: cannot find the default SVM for %s' % dest_we['publicId']
+
+        replication_request = {}
+        replication_volume = {}
+        if dest_we['workingEnvironmentType'] != 'ON_PREM':
+            quote, error = self.build_quote_request(relationship, source_we, dest_we, source_volume, source_details['aggregates'],
+                                                    dest_svm_name, capacity_tier)
+            if error is None:
+                quote_response, error = self.quote_volume(dest_we, quote)
+            if error is not None:
+                return error
+            replication_volume['numOfDisksApprovedToAdd'] = int(quote_response['numOfDisks'])
+            if 'iops' in quote:
+                replication_volume['iops'] = quote['iops']
+            if 'throughput' in quote:
+                replication_volume['throughput'] = quote['throughput']
+            if relationship.get('destination_aggregate_name') is not None:
+                replication_volume['advancedMode'] = True
+            else:
+                replication_volume['advancedMode'] = False
+                replication_volume['destinationAggregateName'] = quote_response['aggregateName']
+        if relationship.get('provider_volume_type') is None:
+            replication_volume['destinationProviderVolumeType'] = source_volume['providerVolumeType']
+        if capacity_tier is not None:
+            replication_volume['destinationCapacityTier'] = capacity_tier
+        replication_request['sourceWorkingEnvironmentId'] = source_we['publicId']
+        replication_request['destinationWorkingEnvironmentId'] = dest_we['publicId']
+        replication_volume['sourceVolumeName'] = relationship['source_volume_name']
+        replication_volume['destinationVolumeName'] = relationship['destination_volume_name']
+        replication_request['policyName'] = relationship['policy']
+        replication_request['scheduleName'] = relationship['schedule']
+        replication_request['maxTransferRate'] = relationship['max_transfer_rate']
+        replication_volume['sourceSvmName'] = source_volume['svmName']
+        replication_volume['destinationSvmName'] = dest_svm_name
+        replication_request['sourceInterclusterLifIps'] = [interclusterlifs_info['interClusterLifs'][0]['address']]
+        replication_request['destinationInterclusterLifIps'] = [interclusterlifs_info['peerInterClusterLifs'][0]['address']]
+
+        api = '/occm/api/replication/vsa' if dest_we['workingEnvironmentType'] != 'ON_PREM' else '/occm/api/replication/onprem'
+        body = dict(replicationRequest=replication_request, replicationVolume=replication_volume)
+        response, err, on_cloud_request_id = self.rest_api.send_request("POST", api, None, body, header=self.headers)
+        if err is not None:
+            # the cached LIFs may be stale
+            self.interclusterlifs.delete(source_we['publicId'], dest_we['publicId'])
+            return 'Error creating snapmirror relationship %s: %s.' % (err, response)
+        error = self.poller.wait(on_cloud_request_id, "snapmirror", "create", self.parameters['wait_interval'])
+        if error is not None:
+            self.interclusterlifs.delete(source_we['publicId'], dest_we['publicId'])
+        return error
+
+    def delete_snapmirror(self, relationship, dest_we_id, dest_svm_name):
+        api_delete = '/occm/api/replication/%s/%s/%s' % (dest_we_id, dest_svm_name, relationship['destination_volume_name'])
+        response, err, dummy = self.rest_api.send_request("DELETE", api_delete, None, None, header=self.headers)
+        if err is not None:
+            return 'Error deleting snapmirror relationship %s: %s.' % (err, response)
+        return None
+
+    def apply(self):
+        working_environments, pairs = self.get_working_environments()
+        self.api_root_paths = self.get_api_root_paths(working_environments)
+        relationships = self.parameters['relationships']
+
+        # replication status, once per source working environment
+        statuses = self.run_concurrently(dict((source_we_id, partial(self.get_replication_status, source_we_id))
+                                              for source_we_id in set(pair[0] for pair in pairs)))
+        for dummy, error in statuses.values():
+            if error is not None:
+                self.module.fail_json(changed=False, msg=error)
+
+        results, actions = [], []
+        for relationship, (source_we_id, dest_we_id) in zip(relationships, pairs):
+            dest_we = working_environments[dest_we_id]
+            dest_svm_name = relationship.get('destination_svm_name') or dest_we.get('svmName')
+            current = find_snapmirror(statuses[source_we_id][0], dest_we_id, dest_svm_name, relationship['destination_volume_name'])
+            action = None
+            if current is None and relationship['state'] == 'present':
+                action = 'create'
+            elif current is not None and relationship['state'] == 'absent':
+                action = 'delete'
+                dest_svm_name = current['destination']['svmName']
+            results.append(dict(
+                source_working_environment_id=source_we_id,
+                destination_working_environment_id=dest_we_id,
+                destination_svm_name=dest_svm_name,
+                destination_volume_name=relationship['destination_volume_name'],
+                action=action,
+                error=None,
+            ))
+            actions.append(action)
+        changed = any(action is not None for action in actions)
+        if not changed or self.module.check_mode:
+            self.module.exit_json(changed=changed, relationships=results)
+
+        # source volumes and aggregates once per source working environment, intercluster LIFs once per pair of working environments
+        create_pairs = set(pair for pair, action in zip(pairs, actions) if action == 'create')
+        funcs = dict((('source', source_we_id), partial(self.get_source_details, working_environments[source_we_id]))
+                     for source_we_id in set(pair[0] for pair in create_pairs))
+        funcs.update((('lifs', pair), partial(self.interclusterlifs.get, *pair)) for pair in create_pairs)
+        details = self.run_concurrently(funcs)
+        for dummy, error in details.values():
+            if error is not None:
+                self.module.fail_json(changed=False, msg=error)
+
+        self.poller = TaskPoller(self.rest_api, self.parameters['wait_timeout'])
+        operations, destinations = {}, {}
+        for index, (relationship, pair, action, result) in enumerate(zip(relationships, pairs, actions, results)):
+            source_we_id, dest_we_id = pair
+            if action == 'create':
+                operations[index] = partial(self.create_snapmirror, relationship, working_environments[source_we_id], working_environments[dest_we_id],
+                                            details[('source', source_we_id)][0], details[('lifs', pair)][0])
+            elif action == 'delete':
+                operations[index] = partial(self.delete_snapmirror, relationship, dest_we_id, result['destination_svm_name'])
+            destinations[index] = dest_we_id
+        errors = self.run_concurrently(operations, destinations)
+        self.scheduler.shutdown()
+        for index, error in errors.items():
+            results[index]['error'] = error
+        failed = [result for result in results if result['error'] is not None]
+        if failed:
+            msg = 'Error: %d of %d snapmirror operations failed: %s' % (len(failed), len(operations), ', '.join(result['error'] for result in failed))
+            self.module.fail_json(changed=len(failed) < len(operations), relationships=results, msg=msg)
+        self.module.exit_json(changed=True, relationships=results)
+
+
+def main():
+    '''Main Function'''
+    snapmirrors = NetAppCloudmanagerSnapmirrorBulk()
+    snapmirrors.apply()
+
+
+if __name__ == '__main__':
+    main()
@@ -203,6 +203,29 @@ options:
             required: true
             type: str
 
+    volume_index_cache_ttl:
+        description:
+        - For AWS FSx, all the volumes in the file system are listed to find the volume, and indexed by name.
+        - The index is cached for this number of seconds, and shared by the tasks for the same file system.
+        - The index is discarded when a volume is created, modified, or deleted.  Set to 0 to disable the cache.
+        - For other working environments, the volume is looked up by name in Cloud Manager, and this option is ignored.
+        type: int
+        default: 0
+        version_added: 21.25.0
+
+    quote_cache_ttl:
+        description:
+        - Quotes are cached for this number of seconds, and reused for volumes on the same working environment and SVM,
+          with the same provider volume type and aggregate, and a size within the same power of 2.
+        - Only quotes that neither create an aggregate nor add disks are reused.
+        - When I(aggregate_name) is set, the available capacity of the aggregates is cached as well, and the quote is skipped
+          when the aggregate has room for the volume.
+        - The cached entries are discarded if creating the volume fails.  Set to 0 to disable the cache.
+        - Ignored for AWS FSx, as no quote is needed.
+        type: int
+        default: 0
+        version_added: 21.25.0
+
 notes:
 - Support check_mode.
 '''
@@ -235,9 +258,17 @@ EXAMPLES = '''
 
 RETURN = r''' # '''
 
+import math
+
 from ansible.module_utils.basic import AnsibleModule
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
-from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import NetAppModule, WORKING_ENVIRONMENT_LOOKUP_FIELDS
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache
+
+
+# keys read from a volume record in get_volume, the rest of each record is dropped
+VOLUME_FIELDS = ['name', 'deduplication', 'thinProvisioning', 'compression', 'size', 'exportPolicyInfo', 'snapshotPolicy',
+                 'providerVolumeType', 'capacityTier', 'tieringPolicy', 'shareInfo', 'iscsiInfo']
 
 
 class NetAppCloudmanagerVolume(object):
@@ -280,7 +311,8 @@ class NetAppCloudmanagerVolume(object):
             initiators=dict(required=False, type='list', elements='dict', options=dict(
                 alias=dict(required=True, type='str'),
                 iqn=dict(required=True, type='str'),)),
-
+            volume_index_cache_ttl=dict(required=False, type='int', default=0),
+            quote_cache_ttl=dict(required=False, type='int', default=0),
         ))
         self.module = AnsibleModule(
             argument_spec=self.argument_spec,
@@ -319,12 +351,14 @@ class NetAppCloudmanagerVolume(object):
         else:
             working_environment_detail, error = self.na_helper.get_working_environment_details_by_name(self.rest_api,
                                                                                                        self.headers,
-                                                                                                       self.parameters['working_environment_name'])
+                                                                                                       self.parameters['working_environment_name'],
+                                                                                                       fields=WORKING_ENVIRONMENT_LOOKUP_FIELDS)
         if working_environment_detail is None:
             self.module.fail_json(msg="Error: Cannot find working environment, if it is an AWS FSxN, please provide tenant_id: %s" % str(error))
         self.parameters['working_environment_id'] = working_environment_detail['publicId']\
             if working_environment_detail.get('publicId') else working_environment_detail['id']
         self.na_helper.set_api_root_path(working_environment_detail, self.rest_api)
+        self.working_environment_detail = working_environment_detail
         self.is_fsx = self.parameters['working_environment_id'].startswith('fs-')
 
         if self.parameters.get('svm_name') is None:
@@ -390,61 +424,102 @@ class NetAppCloudmanagerVolume(object):
                     new_users.append(user)
             self.parameters['users'] = new_users
 
-    def get_volume(self):
-        if self.is_fsx:
-            query_param = 'fileSystemId'
-        else:
-            query_param = 'workingEnvironmentId'
-        response, err, dummy = self.rest_api.send_request("GET", "%s/volumes?%s=%s" % (
-            self.rest_api.api_root_path, query_param, self.parameters['working_environment_id']), None, header=self.headers)
+    def get_volumes(self, api):
+        response, err, dummy = self.rest_api.send_request("GET", api, None, header=self.headers)
         if err is not None:
             self.module.fail_json(changed=False, msg="Error: unexpected response on getting volume: %s, %s" % (str(err), str(response)))
-        target_vol = dict()
         if response is None:
-            return None
-        for volume in response:
+            return []
+        return self.na_helper.project_fields(response, VOLUME_FIELDS)
+
+    def get_volume_index_cache(self):
+        '''
+        Return the cache and the key for the file system, or None, None if the cache is disabled
+        '''
+        if self.parameters['volume_index_cache_ttl'] <= 0:
+            return None, None
+        return FileCache('volume_index'), '%s:%s' % (self.rest_api.get_user_key(), self.parameters['working_environment_id'])
+
+    def delete_cached_volume_index(self):
+        cache, cache_key = self.get_volume_index_cache()
+        if cache is not None:
+            cache.delete(cache_key)
+
+    def get_volume_index(self):
+        '''
+        Get all the volumes in a FSx file system, indexed by name.
+        The index is cached across tasks, if volume_index_cache_ttl is set.
+        '''
+        cache, cache_key = self.get_volume_index_cache()
+        if cache is not None:
+            index = cache.get(cache_key)
+            if index is not None:
+                return index
+        volumes = self.get_volumes("%s/volumes?fileSystemId=%s" % (self.rest_api.api_root_path, self.parameters['working_environment_id']))
+        index = dict((volume['name'], volume) for volume in volumes)
+        if cache is not None:
+            cache.set(cache_key, index, self.parameters['volume_index_cache_ttl'])
+        return index
+
+    def get_volume_record(self):
+        '''
+        Get the volume record matching name, or None
+        Cloud Manager filters the volumes by name, except for FSx
+        '''
+        if self.is_fsx:
+            return self.get_volume_index().get(self.parameters['name'])
+        volumes = self.get_volumes("%s/volumes?workingEnvironmentId=%s&name=%s" % (
+            self.rest_api.api_root_path, self.parameters['working_environment_id'], self.parameters['name']))
+        for volume in volumes:
             if volume['name'] == self.parameters['name']:
-                target_vol['name'] = volume['name']
-                target_vol['enable_deduplication'] = volume['deduplication']
-                target_vol['enable_thin_provisioning'] = volume['thinProvisioning']
-                target_vol['enable_compression'] = volume['compression']
-                if self.parameters.get('size'):
-                    target_vol['size'] = volume['size']['size']
-                if self.parameters.get('size_unit'):
-                    target_vol['size_unit'] = volume['size']['unit']
-                if self.parameters.get('export_policy_nfs_version') and volume.get('exportPolicyInfo'):
-                    target_vol['export_policy_nfs_version'] = volume['exportPolicyInfo']['nfsVersion']
-                if self.parameters.get('export_policy_ip') and volume.get('exportPolicyInfo'):
-                    target_vol['export_policy_ip'] = volume['exportPolicyInfo']['ips']
-                if self.parameters.get('export_policy_type') and volume.get('exportPolicyInfo'):
-                    target_vol['export_policy_type'] = volume['exportPolicyInfo']['policyType']
-                if self.parameters.get('snapshot_policy'):
-                    target_vol['snapshot_policy'] = volume['snapshotPolicy']
-                if self.parameters.get('provider_volume_type'):
-                    target_vol['provider_volume_type'] = volume['providerVolumeType']
-                if self.parameters.get('capacity_tier') and self.parameters.get('capacity_tier') != 'NONE':
-                    target_vol['capacity_tier'] = volume['capacityTier']
-                if self.parameters.get('tiering_policy'):
-                    target_vol['tiering_policy'] = volume['tieringPolicy']
-                if self.parameters.get('share_name') and volume.get('shareInfo'):
-                    target_vol['share_name'] = volume['shareInfo'][0]['shareName']
-                if self.parameters.get('users') and volume.get('shareInfo'):
-                    if len(volume['shareInfo'][0]['accessControlList']) > 0:
-                        target_vol['users'] = volume['shareInfo'][0]['accessControlList'][0]['users']
-                    else:
-                        target_vol['users'] = []
-                if self.parameters.get('users') and volume.get('shareInfo'):
-                    if len(volume['shareInfo'][0]['accessControlList']) > 0:
-                        target_vol['permission'] = volume['shareInfo'][0]['accessControlList'][0]['permission']
-                    else:
-                        target_vol['permission'] = []
-                if self.parameters.get('os_name') and volume.get('iscsiInfo'):
-                    target_vol['os_name'] = volume['iscsiInfo']['osName']
-                if self.parameters.get('igroups') and volume.get('iscsiInfo'):
-                    target_vol['igroups'] = volume['iscsiInfo']['igroups']
-                return target_vol
+                return volume
         return None
 
+    def get_volume(self):
+        volume = self.get_volume_record()
+        if volume is None:
+            return None
+        target_vol = dict()
+        target_vol['name'] = volume['name']
+        target_vol['enable_deduplication'] = volume['deduplication']
+        target_vol['enable_thin_provisioning'] = volume['thinProvisioning']
+        target_vol['enable_compression'] = volume['compression']
+        if self.parameters.get('size'):
+            target_vol['size'] = volume['size']['size']
+        if self.parameters.get('size_unit'):
+            target_vol['size_unit'] = volume['size']['unit']
+        if self.parameters.get('export_policy_nfs_version') and volume.get('exportPolicyInfo'):
+            target_vol['export_policy_nfs_version'] = volume['exportPolicyInfo']['nfsVersion']
+        if self.parameters.get('export_policy_ip') and volume.get('exportPolicyInfo'):
+            target_vol['export_policy_ip'] = volume['exportPolicyInfo']['ips']
+        if self.parameters.get('export_policy_type') and volume.get('exportPolicyInfo'):
+            target_vol['export_policy_type'] = volume['exportPolicyInfo']['policyType']
+        if self.parameters.get('snapshot_policy'):
+            target_vol['snapshot_policy'] = volume['snapshotPolicy']
+        if self.parameters.get('provider_volume_type'):
+            target_vol['provider_volume_type'] = volume['providerVolumeType']
+        if self.parameters.get('capacity_tier') and self.parameters.get('capacity_tier') != 'NONE':
+            target_vol['capacity_tier'] = volume['capacityTier']
+        if self.parameters.get('tiering_policy'):
+            target_vol['tiering_policy'] = volume['tieringPolicy']
+        if self.parameters.get('share_name') and volume.get('shareInfo'):
+            target_vol['share_name'] = volume['shareInfo'][0]['shareName']
+        if self.parameters.get('users') and volume.get('shareInfo'):
+            if len(volume['shareInfo'][0]['accessControlList']) > 0:
+                target_vol['users'] = volume['shareInfo'][0]['accessControlList'][0]['users']
+            else:
+                target_vol['users'] = []
+        if self.parameters.get('users') and volume.get('shareInfo'):
+            if len(volume['shareInfo'][0]['accessControlList']) > 0:
+                target_vol['permission'] = volume['shareInfo'][0]['accessControlList'][0]['permission']
+            else:
+                target_vol['permission'] = []
+        if self.parameters.get('os_name') and volume.get('iscsiInfo'):
+            target_vol['os_name'] = volume['iscsiInfo']['osName']
+        if self.parameters.get('igroups') and volume.get('iscsiInfo'):
+            target_vol['igroups'] = volume['iscsiInfo']['igroups']
+        return target_vol
+
     def create_volume(self):
         exclude_list = ['client_id', 'size_unit', 'export_policy_name', 'export_policy_type', 'export_policy_ip',
                         'export_policy_nfs_version', 'capacity_tier']
@@ -480,10 +555,7 @@ class NetAppCloudmanagerVolume(object):
             if self.parameters.get('share_name'):
                 quote['shareInfo']['shareName'] = self.parameters['share_name']
         if not self.is_fsx:
-            response, err, dummy = self.rest_api.send_request("POST", "%s/volumes/quote" % self.rest_api.api_root_path,
-                                                              None, quote, header=self.headers)
-            if err is not None:
-                self.module.fail_json(changed=False, msg="Error: unexpected response on quoting volume: %s, %s" % (str(err), str(response)))
+            response = self.get_quote(quote)
             quote['newAggregate'] = response['newAggregate']
             quote['aggregateName'] = response['aggregateName']
             quote['maxNumOfDisksApprovedToAdd'] = response['numOfDisks']
@@ -510,12 +582,105 @@ class NetAppCloudmanagerVolume(object):
         response, err, on_cloud_request_id = self.rest_api.send_request("POST", "%s/volumes?createAggregateIfNotFound=%s" % (
             self.rest_api.api_root_path, create_aggregate_if_not_exists), None, quote, header=self.headers)
         if err is not None:
+            # the cached quote or capacity may be stale
+            self.delete_cached_quote()
             self.module.fail_json(changed=False, msg="Error: unexpected on creating volume: %s, %s" % (str(err), str(response)))
+        if not self.is_fsx:
+            self.update_cached_capacity(quote['aggregateName'])
         wait_on_completion_api_url = '/occm/api/audit/activeTask/%s' % (str(on_cloud_request_id))
         err = self.rest_api.wait_on_completion(wait_on_completion_api_url, "volume", "create", 20, 5)
         if err is not None:
             self.module.fail_json(changed=False, msg="Error: unexpected response wait_on_completion for creating volume: %s, %s" % (str(err), str(response)))
 
+    def get_quote_cache(self):
+        '''
+        Return the cache for quotes and aggregate capacity, or None if the cache is disabled
+        '''
+        if self.parameters['quote_cache_ttl'] <= 0:
+            return None
+        return FileCache('volume_quotes')
+
+    def get_quote_cache_key(self, item):
+        return '%s:%s:%s' % (self.rest_api.get_user_key(), self.parameters['working_environment_id'], item)
+
+    def get_quote_key(self):
+        '''
+        Volumes on the same SVM and aggregate, with the same provider volume type and a similar size, get the same quote
+        '''
+        size_class = 2 ** int(math.ceil(math.log(max(self.parameters['size'], 1), 2)))
+        return self.get_quote_cache_key('quote:%s:%s:%s:%s' % (self.parameters['svm_name'], self.parameters.get('aggregate_name', ''),
+                                                               self.parameters.get('provider_volume_type', ''), size_class))
+
+    def delete_cached_quote(self):
+        cache = self.get_quote_cache()
+        if cache is not None:
+            with cache.lock():
+                cache.delete(self.get_quote_key())
+                cache.delete(self.get_quote_cache_key('aggregates'))
+
+    def get_aggregates_capacity(self, cache):
+        '''
+        Get the available capacity in GB of each aggregate, cached across tasks
+        '''
+        cache_key = self.get_quote_cache_key('aggregates')
+        capacity = cache.get(cache_key)
+        if capacity is not None:
+            return capacity
+        if self.working_environment_detail.get('cloudProviderName') != 'Amazon':
+            api = '%s/aggregates/%s'
+        else:
+            api = '%s/aggregates?workingEnvironmentId=%s'
+        response, err, dummy = self.rest_api.send_request("GET", api % (self.rest_api.api_root_path, self.parameters['working_environment_id']),
+                                                          None, header=self.headers)
+        if err is not None:
+            self.module.fail_json(changed=False, msg="Error: unexpected response on getting aggregates: %s, %s" % (str(err), str(response)))
+        capacity = dict()
+        for aggr in self.na_helper.project_fields(response or [], ['name', 'availableCapacity']):
+            available = aggr.get('availableCapacity') or {}
+            unit = str(available.get('unit')).lower()
+            if unit in netapp_utils.POW2_BYTE_MAP and available.get('size') is not None:
+                capacity[aggr['name']] = available['size'] * netapp_utils.POW2_BYTE_MAP[unit] / netapp_utils.POW2_BYTE_MAP['gb']
+        cache.set(cache_key, capacity, self.parameters['quote_cache_ttl'])
+        return capacity
+
+    def update_cached_capacity(self, aggregate_name):
+        '''
+        Reduce the cached capacity of the aggregate by the size of the new volume, so that back to back volumes do not overcommit it
+        '''
+        cache = self.get_quote_cache()
+        if cache is None:
+            return
+        cache_key = self.get_quote_cache_key('aggregates')
+        with cache.lock():
+            capacity = cache.get(cache_key)
+            if capacity is not None and aggregate_name in capacity:
+                capacity[aggregate_name] -= self.parameters['size']
+                cache.set(cache_key, capacity, self.parameters['quote_cache_ttl'])
+
+    def get_quote(self, quote):
+        '''
+        Return newAggregate, aggregateName, and numOfDisks for a new volume
+        With quote_cache_ttl, the quote is skipped if the aggregate is known to have room for the volume,
+        and quotes that do not add disks are reused
+        '''
+        cache = self.get_quote_cache()
+        if cache is not None and self.parameters.get('aggregate_name'):
+            available = self.get_aggregates_capacity(cache).get(self.parameters['aggregate_name'])
+            if available is not None and available >= self.parameters['size']:
+                return dict(newAggregate=False, aggregateName=self.parameters['aggregate_name'], numOfDisks=0)
+        if cache is not None:
+            response = cache.get(self.get_quote_key())
+            if response is not None:
+                return response
+        response, err, dummy = self.rest_api.send_request("POST", "%s/volumes/quote" % self.rest_api.api_root_path,
+                                                          None, quote, header=self.headers)
+        if err is not None:
+            self.module.fail_json(changed=False, msg="Error: unexpected response on quoting volume: %s, %s" % (str(err), str(response)))
+        response = dict(newAggregate=response['newAggregate'], aggregateName=response['aggregateName'], numOfDisks=response['numOfDisks'])
+        if cache is not None and not response['newAggregate'] and not response['numOfDisks']:
+            cache.set(self.get_quote_key(), response, self.parameters['quote_cache_ttl'])
+        return response
+
     def modify_volume(self, modify):
         vol = dict()
         if self.parameters['volume_protocol'] == 'nfs':
@@ -641,12 +806,16 @@ class NetAppCloudmanagerVolume(object):
             if len(unmodifiable) > 0:
                 self.module.fail_json(changed=False, msg="%s cannot be modified." % str(unmodifiable))
         if self.na_helper.changed and not self.module.check_mode:
-            if cd_action == 'create':
-                self.create_volume()
-            elif cd_action == 'delete':
-                self.delete_volume()
-            elif modify:
-                self.modify_volume(modify)
+            try:
+                if cd_action == 'create':
+                    self.create_volume()
+                elif cd_action == 'delete':
+                    self.delete_volume()
+                elif modify:
+                    self.modify_volume(modify)
+            finally:
+                # the volumes change, even if the operation fails midway
+                self.delete_cached_volume_index()
         self.module.exit_json(changed=self.na_helper.changed)
 
 
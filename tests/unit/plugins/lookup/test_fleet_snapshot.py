@@ -0,0 +1,71 @@
+# (c) 2022, NetApp, Inc
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+''' unit tests Cloudmanager Ansible lookup plugin: fleet_snapshot '''
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible.errors import AnsibleLookupError
+from ansible.plugins.loader import lookup_loader
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_columnar import FleetSnapshotWriter
+
+
+def lookup():
+    return lookup_loader.get('netapp.cloudmanager.fleet_snapshot')
+
+
+@pytest.fixture
+def snapshot(tmpdir):
+    path = str(tmpdir.join('fleet.snapshot'))
+    writer = FleetSnapshotWriter()
+    writer.add_working_environment('vsaWorkingEnvironments', 'we1', {'name': 'aws', 'cloudProviderName': 'Amazon'})
+    writer.add_aggregates('we1', [{'name': 'aggr1', 'totalCapacity': {'size': 10, 'unit': 'GB'}, 'usedCapacity': {'size': 9, 'unit': 'GB'}}])
+    writer.add_volumes('we1', [{'name': 'vol1', 'svmName': 'svm1', 'aggregateName': 'aggr1'}])
+    writer.write(path)
+    return path
+
+
+def test_volume(snapshot):
+    results = lookup().run(['volume'], path=snapshot, name='vol1')
+    assert [(volume['working_environment_id'], volume['svm_name']) for volume in results] == [('we1', 'svm1')]
+    assert lookup().run(['volume'], path=snapshot, name='vol1', svm_name='svm2') == []
+
+
+def test_aggregates_over(snapshot):
+    assert [aggregate['utilization'] for aggregate in lookup().run(['aggregates_over'], path=snapshot)] == [90.0]
+    assert lookup().run(['aggregates_over'], path=snapshot, threshold=95) == []
+
+
+def test_several_queries(snapshot):
+    assert len(lookup().run(['volume', 'aggregates_over'], path=snapshot, name='vol1')) == 2
+
+
+@pytest.mark.parametrize('terms, kwargs, msg', [
+    (['volume'], {}, 'Error: name is required for the volume query'),
+    (['volumes'], {}, 'Error: unknown fleet_snapshot query volumes, expecting volume or aggregates_over'),
+])
+def test_invalid_query(snapshot, terms, kwargs, msg):
+    with pytest.raises(AnsibleLookupError) as exc:
+        lookup().run(terms, path=snapshot, **kwargs)
+    assert str(exc.value) == msg
+
+
+def test_missing_file(tmpdir):
+    path = str(tmpdir.join('missing'))
+    with pytest.raises(AnsibleLookupError) as exc:
+        lookup().run(['volume'], path=path, name='vol1')
+    assert str(exc.value).startswith('Error: reading fleet snapshot %s: ' % path)
+
+
+def test_truncated_file(snapshot):
+    with open(snapshot, 'rb') as fh:
+        data = fh.read()
+    with open(snapshot, 'wb') as fh:
+        fh.write(data[:len(data) // 2])
+    with pytest.raises(AnsibleLookupError) as exc:
+        lookup().run(['volume'], path=snapshot, name='vol1')
+    assert str(exc.value).startswith('Error: reading fleet snapshot %s: ' % snapshot)
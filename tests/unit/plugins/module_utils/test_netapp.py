@@ -38,6 +38,7 @@ __metaclass__ = type
 import json
 import pytest
 import sys
+import time
 try:
     import requests.exceptions
     HAS_REQUESTS_EXC = True
@@ -48,6 +49,7 @@ from ansible.module_utils import basic
 from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_cache
 
 if (not netapp_utils.HAS_REQUESTS or not HAS_REQUESTS_EXC) and sys.version_info < (3, 5):
     pytestmark = pytest.mark.skip('skipping as missing required imports on 2.6 and 2.7')
@@ -503,3 +505,206 @@ def test_negative_wait_on_completion_timeout(mock_request, mock_sleep):
     rest_api.module.params['client_id'] = '123'
     error = rest_api.wait_on_completion('api', 'action', 'task', 2, 1)
     assert error == 'Taking too long for action to task or not properly setup'
+
+
+@patch('time.sleep')
+@patch('requests.request')
+def test_rate_limits_retry_on_429(mock_request, mock_sleep, tmpdir):
+    ''' a 429 reduces the rate, and the request is retried after Retry-After '''
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH, auth0 is not rate limited here
+        mockResponse(json_data={'message': 'too many requests'}, status_code=429, headers={'Retry-After': '2'}),
+        mockResponse(json_data={'key': 'value'}, status_code=200),
+    ]
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir)):
+        rest_api = create_restapi_object(mock_args(feature_flags={'rate_limits': {'cloudmanager': 10}}))
+        message, error, ocr = rest_api.get('/occm/api/working-environments', None)
+        state = rest_api.rate_limiter.store.get('cloudmanager')
+    assert message == {'key': 'value'}
+    assert error is None
+    # halved on 429, then increased by 5% of the limit on success
+    assert state['rate'] == 5.5
+    # the retry waited for Retry-After
+    assert any(call[0][0] >= 1.9 for call in mock_sleep.call_args_list)
+
+
+@patch('requests.request')
+def test_rate_limits_disabled_by_default(mock_request):
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'too many requests'}, status_code=429),
+    ]
+    rest_api = create_restapi_object(mock_args())
+    assert rest_api.rate_limiter is None
+    message, error, ocr = rest_api.get('/occm/api/working-environments', None)
+    assert error == '429'
+
+
+def test_rate_limits_invalid():
+    with pytest.raises(AnsibleFailJson) as exc:
+        create_restapi_object(mock_args(feature_flags={'rate_limits': {'cloudmanager': 'fast'}}))
+    assert exc.value.args[0]['msg'] == "Error: expected a dict of positive numbers for feature flag: rate_limits, found {'cloudmanager': 'fast'}"
+
+
+@patch('requests.request')
+def test_token_renewed_on_401(mock_request):
+    ''' the request is retried once with a new token '''
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'expired'}, status_code=401),
+        mockResponse(json_data={'access_token': 'new_token', 'token_type': 'token_type'}, status_code=200),  # OAUTH
+        mockResponse(json_data={'key': 'value'}, status_code=200),
+    ]
+    rest_api = create_restapi_object(mock_args())
+    message, error, ocr = rest_api.get('/occm/api/working-environments', None, header={'X-User-Token': 'token_type access_token'})
+    assert message == {'key': 'value'}
+    assert error is None
+    headers = mock_request.call_args_list[3][1]['headers']
+    assert headers['Authorization'] == 'token_type new_token'
+    assert headers['X-User-Token'] == 'token_type new_token'
+
+
+@patch('requests.request')
+def test_token_renewed_on_401_once(mock_request):
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'expired'}, status_code=401),
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'unauthorized'}, status_code=401),
+    ]
+    rest_api = create_restapi_object(mock_args())
+    message, error, ocr = rest_api.get('/occm/api/working-environments', None)
+    assert error == '401'
+    assert mock_request.call_count == 4
+
+
+@patch('requests.request')
+def test_token_renewal_error_on_401(mock_request):
+    ''' the renewal error is returned, rather than reported with fail_json, as requests may be sent from worker threads '''
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'expired'}, status_code=401),
+        mockResponse(json_data={'message': 'error message'}, status_code=400),  # OAUTH
+    ]
+    rest_api = create_restapi_object(mock_args())
+    message, error, ocr = rest_api.get('/occm/api/working-environments', None)
+    assert error.startswith('Error acquiring token: 400')
+    assert mock_request.call_count == 3
+    # the current token is kept, and the next request tries again
+    assert rest_api.token == TOKEN_DICT['access_token']
+    assert not rest_api.expired_tokens
+
+
+@patch('requests.request')
+def test_token_renewal_error_before_expiry(mock_request):
+    mock_request.side_effect = [
+        mockResponse(json_data=dict(TOKEN_DICT, expires_in=86400), status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'error message'}, status_code=400),  # OAUTH
+    ]
+    rest_api = create_restapi_object(mock_args())
+    rest_api.token_expires_at = time.time() + 10
+    message, error, ocr = rest_api.get('/occm/api/working-environments', None)
+    assert message is None
+    assert error.startswith('Error acquiring token: 400')
+    # the request is not sent
+    assert mock_request.call_count == 2
+
+
+@patch('requests.request')
+def test_token_renewed_before_expiry(mock_request):
+    token_dict = dict(TOKEN_DICT, expires_in=86400)
+    mock_request.side_effect = [
+        mockResponse(json_data=token_dict, status_code=200),  # OAUTH
+        mockResponse(json_data={'key': 'value'}, status_code=200),
+        mockResponse(json_data=dict(token_dict, access_token='new_token'), status_code=200),  # OAUTH
+        mockResponse(json_data={'key': 'value'}, status_code=200),
+    ]
+    rest_api = create_restapi_object(mock_args())
+    assert rest_api.token_expires_at > time.time() + 86000
+    rest_api.get('/occm/api/working-environments', None)
+    assert mock_request.call_count == 2
+    # the token expires within TOKEN_REFRESH_MARGIN
+    rest_api.token_expires_at = time.time() + 10
+    # a GCP token is not replaced
+    rest_api.get('/occm/api/working-environments', None, header={'Authorization': 'token_type gcp_token'})
+    assert mock_request.call_count == 4
+    assert rest_api.token == 'new_token'
+    headers = mock_request.call_args_list[3][1]['headers']
+    assert headers['Authorization'] == 'token_type gcp_token'
+
+
+@patch('requests.request')
+def test_trace_apis(mock_request, tmpdir):
+    ''' requests are traced as JSON lines, with secrets redacted '''
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'message': 'not found'}, status_code=404),
+    ]
+    trace_file = str(tmpdir.join('trace.log'))
+    rest_api = create_restapi_object(mock_args(feature_flags={'trace_apis': True, 'trace_headers': True, 'trace_file': trace_file}))
+    rest_api.get('/occm/api/working-environments', None)
+    rest_api.trace_sink.stop()
+    with open(trace_file) as fh:
+        records = [json.loads(line) for line in fh]
+    assert [record['level'] for record in records] == ['DEBUG', 'ERROR']
+    assert records[0]['request_body']['refresh_token'] == '********'
+    assert records[0]['response_body']['access_token'] == '********'
+    assert records[1]['url'] == 'https://cloudmanager.cloud.netapp.com/occm/api/working-environments'
+    assert records[1]['status_code'] == 404
+    assert records[1]['error'] == '404'
+    assert records[1]['request_headers']['Authorization'] == '********'
+    assert 'ABCDEFGS' not in open(trace_file).read()
+
+
+def test_trace_apis_invalid_flag():
+    with pytest.raises(AnsibleFailJson) as exc:
+        create_restapi_object(mock_args(feature_flags={'trace_apis': True, 'trace_sample_rate': 2}))
+    assert exc.value.args[0]['msg'] == "Error: expected a number between 0 and 1 for feature flag: trace_sample_rate, found 2"
+
+
+@patch('requests.request')
+def test_cassette_record_and_replay(mock_request, tmpdir):
+    ''' responses recorded from one run are replayed without sending requests '''
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data={'key': 'value'}, status_code=200, headers={'OnCloud-Request-Id': 'ocr_id'}),
+    ]
+    cassette_file = str(tmpdir.join('cassette.json'))
+    rest_api = create_restapi_object(mock_args(feature_flags={'cassette_mode': 'record', 'cassette_file': cassette_file}))
+    assert rest_api.get('/occm/api/working-environments', None) == ({'key': 'value'}, None, 'ocr_id')
+    assert mock_request.call_count == 2
+    assert 'ABCDEFGS' not in open(cassette_file).read()
+    feature_flags = {'cassette_mode': 'replay', 'cassette_file': cassette_file, 'cassette_time_scale': 0}
+    rest_api = create_restapi_object(mock_args(feature_flags=feature_flags))
+    assert rest_api.get('/occm/api/working-environments', None) == ({'key': 'value'}, None, 'ocr_id')
+    message, error, ocr = rest_api.get('/occm/api/unknown', None)
+    assert error == 'no recorded response for GET https://cloudmanager.cloud.netapp.com/occm/api/unknown'
+    assert mock_request.call_count == 2
+
+
+def test_cassette_invalid_flags(tmpdir):
+    with pytest.raises(AnsibleFailJson) as exc:
+        create_restapi_object(mock_args(feature_flags={'cassette_mode': 'replay'}))
+    assert exc.value.args[0]['msg'] == "Error: feature flag cassette_file is required with cassette_mode"
+    with pytest.raises(AnsibleFailJson) as exc:
+        create_restapi_object(mock_args(feature_flags={'cassette_mode': 'replay', 'cassette_file': str(tmpdir.join('missing'))}))
+    assert exc.value.args[0]['msg'].startswith("Error: cannot read cassette ")
+
+
+@patch('requests.request')
+def test_user_key(mock_request):
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+    ]
+    rest_api = create_restapi_object(mock_args())
+    assert rest_api.get_user_key().startswith('prod:')
+    assert 'ABCDEFGS' not in rest_api.get_user_key()
+    assert rest_api.we_snapshot is None
+    # no-op when the snapshot is disabled
+    rest_api.invalidate_working_environments()
+
+
+def test_working_environments_cache_ttl_invalid():
+    with pytest.raises(AnsibleFailJson) as exc:
+        create_restapi_object(mock_args(feature_flags={'working_environments_cache_ttl': 'long'}))
+    assert exc.value.args[0]['msg'] == "Error: expected a positive integer for feature flag: working_environments_cache_ttl, found 'long'"
@@ -0,0 +1,151 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_account.py
+
+    Provides accounts and agents for the current user, fetched once per run
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account import AccountContext
+
+
+class MockRestAPI(object):
+    def __init__(self, refresh_token='refresh_token'):
+        self.environment = 'prod'
+        self.refresh_token = refresh_token
+        self.sa_client_id = None
+
+    def get_user_key(self):
+        return '%s:%s' % (self.environment, self.sa_client_id or self.refresh_token)
+
+
+class MockHelper(object):
+    ''' record calls to the NetAppModule helpers used by AccountContext '''
+    def __init__(self, accounts=None, error=None):
+        self.accounts = accounts if accounts is not None else [{'accountPublicId': 'account-1'}, {'accountPublicId': 'account-2'}]
+        self.error = error
+        self.calls = []
+
+    def get_account_info(self, rest_api):
+        self.calls.append('get_account_info')
+        return (None, self.error) if self.error else (self.accounts, None)
+
+    def get_or_create_account(self, rest_api):
+        self.calls.append('get_or_create_account')
+        return (None, self.error) if self.error else (self.accounts[0]['accountPublicId'], None)
+
+    def get_occm_agents_by_account(self, rest_api, account_id):
+        self.calls.append(account_id)
+        agents = [{'name': 'a-%s' % account_id, 'agentId': 'id-%s' % account_id, 'provider': 'AWS', 'status': 'active'},
+                  {'name': 'b-%s' % account_id, 'agentId': 'id-b-%s' % account_id, 'provider': 'AWS', 'status': 'inactive'}]
+        return {'agents': agents}, None
+
+
+def test_accounts_fetched_once():
+    helper = MockHelper()
+    context = AccountContext(MockRestAPI(), helper)
+    assert context.get_account_id() == ('account-1', None)
+    assert context.get_account_info() == (helper.accounts, None)
+    assert context.get_or_create_account() == ('account-1', None)
+    assert helper.calls == ['get_account_info']
+
+
+def test_agents_fetched_once():
+    helper = MockHelper()
+    context = AccountContext(MockRestAPI(), helper)
+    agents, error = context.get_agents_info()
+    assert error is None
+    assert [agent['agentId'] for agent in agents['agents']] == ['id-account-1', 'id-b-account-1']
+    assert context.get_active_agents_info() == ([{'name': 'a-account-1', 'client_id': 'id-account-1', 'provider': 'AWS'}], None)
+    assert helper.calls == ['get_account_info', 'account-1']
+
+
+def test_agents_for_all_accounts():
+    helper = MockHelper()
+    context = AccountContext(MockRestAPI(), helper)
+    clients, error = context.get_active_agents_info(all_accounts=True)
+    assert error is None
+    assert clients == [{'name': 'a-account-1', 'client_id': 'id-account-1', 'provider': 'AWS', 'account_id': 'account-1'},
+                       {'name': 'a-account-2', 'client_id': 'id-account-2', 'provider': 'AWS', 'account_id': 'account-2'}]
+    assert sorted(helper.calls) == ['account-1', 'account-2', 'get_account_info']
+    agents, error = context.get_agents_info(all_accounts=True)
+    assert error is None
+    assert [(agent['agentId'], agent['accountId']) for agent in agents['agents']] == [
+        ('id-account-1', 'account-1'), ('id-b-account-1', 'account-1'), ('id-account-2', 'account-2'), ('id-b-account-2', 'account-2')]
+    # the agents remembered for each account are not modified
+    assert 'accountId' not in context.get_agents('account-1')[0]['agents'][0]
+
+
+def test_agents_for_all_accounts_with_one_account():
+    ''' the account is reported for each agent, even when the user has a single account '''
+    context = AccountContext(MockRestAPI(), MockHelper(accounts=[{'accountPublicId': 'account-1'}]))
+    agents, error = context.get_agents_info(all_accounts=True)
+    assert error is None
+    assert [agent['accountId'] for agent in agents['agents']] == ['account-1', 'account-1']
+    assert context.get_active_agents_info(all_accounts=True) == (
+        [{'name': 'a-account-1', 'client_id': 'id-account-1', 'provider': 'AWS', 'account_id': 'account-1'}], None)
+
+
+def test_agents_for_all_accounts_without_futures():
+    ''' without concurrent.futures, the accounts are fetched sequentially '''
+    helper = MockHelper()
+    context = AccountContext(MockRestAPI(), helper)
+    with patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account.HAS_FUTURES', False):
+        clients, error = context.get_active_agents_info(all_accounts=True)
+    assert error is None
+    assert [client['client_id'] for client in clients] == ['id-account-1', 'id-account-2']
+    assert helper.calls == ['get_account_info', 'account-1', 'account-2']
+
+
+def test_account_errors():
+    context = AccountContext(MockRestAPI(), MockHelper(error='500'))
+    assert context.get_account_id() == (None, '500')
+    assert context.get_active_agents_info() == (None, '500')
+    assert context.get_or_create_account() == (None, '500')
+    context = AccountContext(MockRestAPI(), MockHelper(accounts=[]))
+    assert context.get_account_id() == (None, 'Error: no account found - check credentials or provide account_id.')
+    assert context.get_agents_info(all_accounts=True) == (None, 'Error: no account found - check credentials or provide account_id.')
+
+
+def test_accounts_cached_across_runs(tmpdir):
+    helper = MockHelper()
+    context = AccountContext(MockRestAPI(), helper, cache_ttl=3600, cache_dir=str(tmpdir))
+    assert context.get_account_id() == ('account-1', None)
+    # a new run for the same user
+    context = AccountContext(MockRestAPI(), helper, cache_ttl=3600, cache_dir=str(tmpdir))
+    assert context.get_account_id() == ('account-1', None)
+    assert helper.calls == ['get_account_info']
+    # another user
+    context = AccountContext(MockRestAPI('other_token'), helper, cache_ttl=3600, cache_dir=str(tmpdir))
+    assert context.get_or_create_account() == ('account-1', None)
+    context = AccountContext(MockRestAPI('other_token'), helper, cache_ttl=3600, cache_dir=str(tmpdir))
+    assert context.get_or_create_account() == ('account-1', None)
+    assert helper.calls == ['get_account_info', 'get_or_create_account']
@@ -0,0 +1,158 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_cache.py
+
+    Provides a JSON file cache shared across tasks
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+import pytest
+
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache import FileCache, WorkingEnvironmentSnapshot
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return FileCache('test', cache_dir=str(tmpdir))
+
+
+def test_get_missing(cache):
+    assert cache.get('key') is None
+    assert cache.load() == {}
+
+
+def test_set_get(cache):
+    assert cache.set('key', {'a': 1}, 60)
+    assert cache.get('key') == {'a': 1}
+    # another instance sees the same data
+    assert FileCache('test', cache_dir=cache.cache_dir).get('key') == {'a': 1}
+
+
+def test_no_ttl(cache):
+    assert cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+
+
+@patch('time.time')
+def test_expired(mock_time, cache):
+    mock_time.return_value = 1000
+    cache.set('key', 'value', 10)
+    cache.set('key2', 'value2', 100)
+    mock_time.return_value = 1011
+    assert cache.get('key') is None
+    assert cache.get('key2') == 'value2'
+    # expired entries are dropped on the next write
+    cache.set('key3', 'value3', 10)
+    assert 'key' not in cache.load()
+
+
+def test_delete(cache):
+    cache.set('key', 'value')
+    cache.set('key2', 'value2')
+    assert cache.delete('key')
+    assert cache.get('key') is None
+    assert cache.get('key2') == 'value2'
+    assert cache.delete('unknown')
+    assert cache.delete()
+    assert cache.load() == {}
+
+
+def test_corrupted_file(cache):
+    cache.set('key', 'value')
+    with open(cache.path, 'w') as fh:
+        fh.write('{not json')
+    assert cache.get('key') is None
+    assert cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+
+
+def test_creates_directory(tmpdir):
+    cache_dir = os.path.join(str(tmpdir), 'sub')
+    cache = FileCache('test', cache_dir=cache_dir)
+    assert cache.set('key', 'value')
+    assert os.path.isdir(cache_dir)
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+
+def test_refuses_shared_directory(tmpdir):
+    cache_dir = os.path.join(str(tmpdir), 'shared')
+    os.mkdir(cache_dir)
+    os.chmod(cache_dir, 0o777)
+    with open(os.path.join(cache_dir, 'test.json'), 'w') as fh:
+        fh.write('{"key": {"value": "planted", "expires": null}}')
+    cache = FileCache('test', cache_dir=cache_dir)
+    assert cache.get('key') is None
+    assert not cache.set('key', 'value')
+
+
+def test_refuses_symlink(tmpdir):
+    target = os.path.join(str(tmpdir), 'target')
+    os.mkdir(target, 0o700)
+    cache_dir = os.path.join(str(tmpdir), 'link')
+    os.symlink(target, cache_dir)
+    assert not FileCache('test', cache_dir=cache_dir).set('key', 'value')
+    assert os.listdir(target) == []
+
+
+def test_refuses_directory_owned_by_another_user(cache):
+    with patch('os.getuid', return_value=os.getuid() + 1):
+        assert not cache.set('key', 'value')
+        assert cache.get('key') is None
+
+
+def test_save_error(cache):
+    assert not cache.save({'key': object()})
+
+
+def test_lock_is_reentrant(cache):
+    with cache.lock():
+        with cache.lock():
+            cache.set('key', 'value')
+        assert cache.get('key') == 'value'
+    assert cache._lock_fd is None
+
+
+def test_working_environment_snapshot(tmpdir):
+    snapshot = WorkingEnvironmentSnapshot('user1', 60, cache_dir=str(tmpdir))
+    other_user = WorkingEnvironmentSnapshot('user2', 60, cache_dir=str(tmpdir))
+    snapshot.set({'X-Agent-Id': 'agent1'}, 'list', ['we1'])
+    snapshot.set({'X-Agent-Id': 'agent2'}, 'list', ['we2'])
+    other_user.set({'X-Agent-Id': 'agent1'}, 'list', ['we3'])
+    assert snapshot.get({'X-Agent-Id': 'agent1'}, 'list') == ['we1']
+    assert snapshot.get({'X-Agent-Id': 'agent2'}, 'list') == ['we2']
+    assert snapshot.get(None, 'list') is None
+    # all the connectors for the user are invalidated, other users are not affected
+    assert snapshot.invalidate()
+    assert snapshot.get({'X-Agent-Id': 'agent1'}, 'list') is None
+    assert snapshot.get({'X-Agent-Id': 'agent2'}, 'list') is None
+    assert other_user.get({'X-Agent-Id': 'agent1'}, 'list') == ['we3']
@@ -0,0 +1,118 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" unit tests for module_utils netapp_capacity.py
+
+    Provides capacity rollups over aggregates and volumes, with NumPy or the array module
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+from array import array
+import pytest
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_capacity
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_capacity import CapacitySummary, CapacityTable, percentiles
+
+GB = 1024 ** 3
+
+
+def gb(size):
+    return {'size': size, 'unit': 'GB'}
+
+
+def aggregate(name, total, available, disk_type='gp3'):
+    return {'name': name, 'totalCapacity': gb(total), 'availableCapacity': gb(available), 'providerVolumes': [{'diskType': disk_type}]}
+
+
+def build(use_numpy):
+    summary = CapacitySummary(use_numpy)
+    summary.add_aggregates('we1', 'Amazon', [aggregate('aggr1', 100, 20), aggregate('aggr2', 100, 90, 'st1')])
+    summary.add_aggregates('we2', 'Azure', [aggregate('aggr1', 200, 100, None), {'name': 'no_capacity'}])
+    summary.add_aggregates('we3', 'Azure', None)
+    summary.add_volumes('we1', 'Amazon', [
+        {'name': 'vol1', 'svmName': 'svm1', 'size': gb(10), 'usedSize': gb(5), 'providerVolumeType': 'gp3'},
+        {'name': 'vol2', 'svmName': 'svm1', 'size': gb(10), 'usedSize': gb(8), 'providerVolumeType': 'gp3'},
+    ])
+    summary.add_volumes('we2', 'Azure', [{'name': 'vol1', 'svmName': 'svm2', 'size': {'size': 1, 'unit': 'TB'}}])
+    return summary.summary(2)
+
+
+def test_summary():
+    summary = build(use_numpy=False)
+    assert summary['backend'] == 'array'
+    aggregates = summary['aggregates']
+    assert aggregates['count'] == 3
+    assert aggregates['total_bytes'] == 400 * GB
+    assert aggregates['used_bytes'] == 190 * GB
+    assert aggregates['available_bytes'] == 210 * GB
+    # utilizations are 10, 50 and 80 percent
+    assert aggregates['utilization_percentiles'] == dict(p50=50.0, p90=74.0, p95=77.0, p99=79.4, p100=80.0)
+    assert aggregates['by_working_environment'] == dict(
+        we1=dict(count=2, total_bytes=200 * GB, used_bytes=90 * GB, available_bytes=110 * GB),
+        we2=dict(count=1, total_bytes=200 * GB, used_bytes=100 * GB, available_bytes=100 * GB))
+    assert aggregates['by_provider']['Azure']['count'] == 1
+    assert sorted(aggregates['by_tier']) == ['gp3', 'st1', 'unknown']
+    assert aggregates['top'] == [
+        dict(working_environment_id='we1', name='aggr1', total_bytes=100 * GB, used_bytes=80 * GB, utilization=80.0),
+        dict(working_environment_id='we2', name='aggr1', total_bytes=200 * GB, used_bytes=100 * GB, utilization=50.0)]
+    volumes = summary['volumes']
+    assert volumes['count'] == 3
+    assert volumes['total_bytes'] == 1044 * GB
+    assert volumes['by_tier']['gp3'] == dict(count=2, total_bytes=20 * GB, used_bytes=13 * GB, available_bytes=7 * GB)
+    # volumes are ranked by used size
+    assert [(volume['working_environment_id'], volume['name']) for volume in volumes['top']] == [('we1', 'vol2'), ('we1', 'vol1')]
+
+
+def test_numpy_matches_array():
+    pytest.importorskip('numpy')
+    summary = build(use_numpy=True)
+    assert summary.pop('backend') == 'numpy'
+    expected = build(use_numpy=False)
+    expected.pop('backend')
+    assert summary == expected
+
+
+def test_default_backend():
+    assert CapacityTable().use_numpy == netapp_capacity.HAS_NUMPY
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_empty(use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    summary = CapacitySummary(use_numpy).summary(10)
+    assert summary['aggregates']['count'] == 0
+    assert summary['aggregates']['utilization_percentiles']['p50'] is None
+    assert summary['aggregates']['by_provider'] == {}
+    assert summary['volumes']['top'] == []
+
+
+def test_percentiles_single_value():
+    assert percentiles(array('d', [42.0]), False) == dict(p50=42.0, p90=42.0, p95=42.0, p99=42.0, p100=42.0)
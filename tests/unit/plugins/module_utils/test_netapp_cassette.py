@@ -0,0 +1,99 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_cassette.py
+
+    Provides a record and replay transport for REST requests
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import json
+import pytest
+
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cassette import Cassette, CassetteError, CassetteResponse
+
+
+def record_requests(path):
+    cassette = Cassette(path, 'record')
+    url = 'https://host/occm/api/audit/activeTask/1'
+    cassette.record('POST', 'https://host/oauth/token', None, {'refresh_token': 'secret'}, None,
+                    CassetteResponse(200, {}, b'{"access_token": "token", "token_type": "Bearer"}'), None, 0.2)
+    cassette.record('GET', url, None, None, None, CassetteResponse(200, {'OnCloud-Request-Id': 'ocr', 'Server': 'x'}, b'{"status": 0}'), None, 2.0)
+    cassette.record('GET', url, None, None, None, CassetteResponse(200, {}, b'{"status": 1}'), None, 1.0)
+    cassette.record('GET', 'https://host/api', {'fields': 'name'}, None, None, None, 'Connection error', 0.5)
+    cassette.record('GET', 'https://host/api', None, None, None, CassetteResponse(404, {}, b'not found'), None, 0.1)
+
+
+def test_record(tmpdir):
+    path = str(tmpdir.join('cassette.json'))
+    record_requests(path)
+    with open(path) as fh:
+        records = [json.loads(line) for line in fh]
+    assert len(records) == 5
+    assert records[0]['request_body'] == {'refresh_token': '********'}
+    assert records[0]['json']['access_token'] == '********'
+    assert records[1]['headers'] == {'OnCloud-Request-Id': 'ocr'}
+    assert records[1]['elapsed'] == 2.0
+    assert records[3]['error'] == 'Connection error'
+    assert records[4]['content'] == 'not found'
+
+
+@patch('time.sleep')
+def test_replay(mock_sleep, tmpdir):
+    path = str(tmpdir.join('cassette.json'))
+    record_requests(path)
+    cassette = Cassette(path, 'replay', time_scale=0.5)
+    url = 'https://host/occm/api/audit/activeTask/1'
+    assert cassette.replay('POST', 'https://host/oauth/token', None).json() == {'access_token': '********', 'token_type': 'Bearer'}
+    response = cassette.replay('GET', url, None)
+    assert response.json() == {'status': 0}
+    assert response.headers == {'OnCloud-Request-Id': 'ocr'}
+    # the last response is repeated
+    assert cassette.replay('GET', url, None).json() == {'status': 1}
+    assert cassette.replay('GET', url, None).json() == {'status': 1}
+    assert [call[0][0] for call in mock_sleep.call_args_list] == [0.1, 1.0, 0.5, 0.5]
+    with pytest.raises(CassetteError) as exc:
+        cassette.replay('GET', 'https://host/api', {'fields': 'name'})
+    assert str(exc.value) == 'Connection error'
+    response = cassette.replay('GET', 'https://host/api', None)
+    assert response.status_code == 404
+    assert response.content == b'not found'
+    with pytest.raises(CassetteError) as exc:
+        cassette.replay('DELETE', 'https://host/api', None)
+    assert str(exc.value) == 'no recorded response for DELETE https://host/api'
+
+
+@patch('time.sleep')
+def test_replay_without_wait(mock_sleep, tmpdir):
+    path = str(tmpdir.join('cassette.json'))
+    record_requests(path)
+    cassette = Cassette(path, 'replay', time_scale=0)
+    cassette.replay('POST', 'https://host/oauth/token', None)
+    assert not mock_sleep.called
@@ -0,0 +1,180 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" unit tests for module_utils netapp_columnar.py
+
+    Provides a columnar snapshot of working environments, aggregates and volumes
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import json
+import struct
+import sys
+import pytest
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_columnar
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_columnar import FleetSnapshotReader, FleetSnapshotWriter
+
+GB = 1024 ** 3
+
+
+def gb(size):
+    return {'size': size, 'unit': 'GB'}
+
+
+def write_snapshot(path):
+    writer = FleetSnapshotWriter()
+    writer.add_working_environment('vsaWorkingEnvironments', 'we1', {'name': 'aws', 'cloudProviderName': 'Amazon', 'isHA': True, 'status': {'status': 'ON'}})
+    writer.add_working_environment('azureVsaWorkingEnvironments', 'we2', {'name': 'azure', 'cloudProviderName': 'Azure', 'status': 'OFF'})
+    writer.add_working_environment('fsxWorkingEnvironments', 'fs-1', {'name': 'fsx'}, provider='Amazon')
+    writer.add_aggregates('we1', [
+        {'name': 'aggr1', 'totalCapacity': gb(100), 'availableCapacity': gb(10), 'providerVolumes': [{'diskType': 'gp3'}]},
+        {'name': 'aggr2', 'totalCapacity': gb(100), 'usedCapacity': gb(85)},
+        {'name': 'unknown'},
+    ])
+    writer.add_aggregates('we2', [{'name': 'aggr1', 'totalCapacity': gb(100), 'usedCapacity': gb(50)}])
+    writer.add_volumes('we1', [{'name': 'vol1', 'svmName': 'svm1', 'aggregateName': 'aggr1', 'size': gb(10), 'usedSize': gb(1)}])
+    writer.add_volumes('we2', [{'name': 'vol1', 'svmName': 'svm2', 'providerVolumeType': 'Premium_LRS'}])
+    writer.add_volumes('fs-1', [{'name': 'volé', 'svmName': 'svm1'}])
+    return writer.write(path)
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join('fleet.snapshot'))
+    assert write_snapshot(path) == dict(working_environments=3, aggregates=4, volumes=3)
+    with FleetSnapshotReader(path) as reader:
+        assert reader.rows('volumes') == 3
+        assert reader.record('working_environments', 0) == dict(id='we1', name='aws', type='vsaWorkingEnvironments', provider='Amazon', status='ON',
+                                                                is_ha=True)
+        assert reader.record('working_environments', 2)['provider'] == 'Amazon'
+        assert reader.record('aggregates', 2) == dict(name='unknown', tier=None, total_bytes=None, used_bytes=None, working_environment_id='we1',
+                                                      working_environment_name='aws', working_environment_provider='Amazon')
+        # the string table is sorted, and searched without decoding it
+        strings = [reader.string(index) for index in range(reader.header['strings']['count'])]
+        assert strings == sorted(strings, key=lambda value: value.encode('utf-8'))
+        assert reader.find_string('svm2') == strings.index('svm2')
+        assert reader.find_string('missing') == -1
+
+
+def test_find_volumes(tmpdir):
+    path = str(tmpdir.join('fleet.snapshot'))
+    write_snapshot(path)
+    with FleetSnapshotReader(path) as reader:
+        assert [volume['working_environment_id'] for volume in reader.find_volumes('vol1')] == ['we1', 'we2']
+        assert reader.find_volumes('vol1', 'svm2') == [dict(svm_name='svm2', name='vol1', aggregate_name=None, tier='Premium_LRS', size_bytes=None,
+                                                            used_bytes=None, working_environment_id='we2', working_environment_name='azure',
+                                                            working_environment_provider='Azure')]
+        assert reader.find_volumes('vol1', 'svm3') == []
+        assert reader.find_volumes('volé')[0]['working_environment_name'] == 'fsx'
+        assert reader.find_volumes('missing') == []
+
+
+def test_find_aggregates_over(tmpdir):
+    path = str(tmpdir.join('fleet.snapshot'))
+    write_snapshot(path)
+    with FleetSnapshotReader(path) as reader:
+        aggregates = reader.find_aggregates_over(80)
+        assert [(aggregate['working_environment_id'], aggregate['name'], aggregate['utilization']) for aggregate in aggregates] == \
+            [('we1', 'aggr1', 90.0), ('we1', 'aggr2', 85.0)]
+        assert aggregates[0]['used_bytes'] == 90 * GB
+        assert len(reader.find_aggregates_over(0)) == 3
+
+
+def test_other_byte_order(tmpdir, monkeypatch):
+    ''' columns are copied and swapped when the file was written on a host with another byte order '''
+    path = str(tmpdir.join('fleet.snapshot'))
+    native = sys.byteorder
+    monkeypatch.setattr(netapp_columnar.sys, 'byteorder', 'big' if native == 'little' else 'little')
+    write_snapshot(path)
+    monkeypatch.setattr(netapp_columnar.sys, 'byteorder', native)
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    # swap the columns written in native order, as another host would have written them
+    with FleetSnapshotReader(path) as reader:
+        sections = [reader.header['strings']['offsets']] + [entry for table in reader.header['tables'].values() for entry in table['columns'].values()]
+    data = bytearray(data)
+    for entry in sections:
+        for start in range(entry['offset'], entry['offset'] + entry['length'], entry['itemsize']):
+            data[start:start + entry['itemsize']] = data[start:start + entry['itemsize']][::-1]
+    with open(path, 'wb') as fh:
+        fh.write(bytes(data))
+    with FleetSnapshotReader(path) as reader:
+        assert [volume['working_environment_id'] for volume in reader.find_volumes('vol1')] == ['we1', 'we2']
+        assert reader.find_aggregates_over(80)[0]['used_bytes'] == 90 * GB
+
+
+def test_without_memoryview_cast(tmpdir, monkeypatch):
+    ''' on python 2, memoryview.cast is not available, and columns are copied into arrays '''
+    path = str(tmpdir.join('fleet.snapshot'))
+    write_snapshot(path)
+    monkeypatch.setattr(netapp_columnar, 'HAS_MEMORYVIEW_CAST', False)
+    with FleetSnapshotReader(path) as reader:
+        assert isinstance(reader.columns['aggregates']['used_bytes'], netapp_columnar.array)
+        assert [volume['working_environment_id'] for volume in reader.find_volumes('vol1')] == ['we1', 'we2']
+        assert reader.find_aggregates_over(80)[0]['used_bytes'] == 90 * GB
+
+
+def test_not_a_snapshot(tmpdir):
+    path = str(tmpdir.join('fleet.snapshot'))
+    with open(path, 'w') as fh:
+        fh.write('{"working_environments": []}')
+    with pytest.raises(ValueError) as exc:
+        FleetSnapshotReader(path)
+    assert str(exc.value) == 'not a fleet snapshot: %s' % path
+
+
+@pytest.mark.parametrize('size', [4, 12, 100, -8])
+def test_truncated(tmpdir, size):
+    path = str(tmpdir.join('fleet.snapshot'))
+    write_snapshot(path)
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    with open(path, 'wb') as fh:
+        fh.write(data[:size])
+    with pytest.raises(ValueError) as exc:
+        FleetSnapshotReader(path)
+    assert str(exc.value) in ('truncated fleet snapshot: %s' % path, 'not a fleet snapshot: %s' % path)
+
+
+@pytest.mark.parametrize('header', [
+    {'version': 1},
+    {'version': 1, 'strings': {'offsets': 'x'}},
+    {'version': 1, 'strings': {'offsets': {'offset': 0, 'length': 12, 'type': 'i', 'itemsize': 4}, 'data': {'offset': 0, 'length': 0, 'type': 'b'},
+                               'count': 2}, 'byteorder': sys.byteorder, 'tables': {}},
+    [1],
+])
+def test_corrupted_header(tmpdir, header):
+    path = str(tmpdir.join('fleet.snapshot'))
+    encoded = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as fh:
+        fh.write(netapp_columnar.MAGIC + struct.pack('<II', len(encoded), 0) + encoded)
+    with pytest.raises(ValueError) as exc:
+        FleetSnapshotReader(path)
+    assert str(exc.value).startswith('corrupted fleet snapshot: %s' % path)
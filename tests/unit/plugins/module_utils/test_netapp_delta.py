@@ -0,0 +1,104 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_delta.py
+
+    Provides fingerprints of the previous run, to report changes only
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import json
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_delta import DeltaSnapshot, fingerprint
+
+
+def test_fingerprint_is_stable():
+    assert fingerprint({'a': 1, 'b': [1, 2]}) == fingerprint({'b': [1, 2], 'a': 1})
+    assert fingerprint({'a': 1}) != fingerprint({'a': 2})
+
+
+def test_diff(tmpdir):
+    path = str(tmpdir.join('snapshot'))
+    delta = DeltaSnapshot(path)
+    assert delta.baseline
+    assert delta.diff('wes', {'we1': {'v': 1}, 'we2': {'v': 2}}) == dict(added={'we1': {'v': 1}, 'we2': {'v': 2}}, changed={}, removed=[])
+    delta.save()
+    delta = DeltaSnapshot(path)
+    assert not delta.baseline
+    assert delta.diff('wes', {'we1': {'v': 1}, 'we2': {'v': 3}, 'we3': {'v': 4}}) == dict(added={'we3': {'v': 4}}, changed={'we2': {'v': 3}}, removed=[])
+    delta.save()
+    delta = DeltaSnapshot(path)
+    assert delta.diff('wes', {'we1': {'v': 1}}) == dict(added={}, changed={}, removed=['we2', 'we3'])
+    assert delta.counts == {'wes': dict(added=0, changed=0, removed=2, unchanged=1, kept=0)}
+
+
+def test_unchanged_parent(tmpdir):
+    path = str(tmpdir.join('snapshot'))
+    delta = DeltaSnapshot(path)
+    assert not delta.unchanged('aggregates', 'we1', {'name': 'we1'})
+    assert not delta.unchanged('aggregates', 'we2', {'name': 'we2'})
+    delta.diff('aggregates', {'we1': ['aggr1'], 'we2': ['aggr2']})
+    delta.save()
+    delta = DeltaSnapshot(path)
+    assert delta.unchanged('aggregates', 'we1', {'name': 'we1'})
+    assert not delta.unchanged('aggregates', 'we2', {'name': 'we2', 'status': 'OFF'})
+    # we1 is carried over, and not reported as removed
+    assert delta.diff('aggregates', {'we2': ['aggr2', 'aggr3']}) == dict(added={}, changed={'we2': ['aggr2', 'aggr3']}, removed=[])
+    assert delta.counts == {'aggregates': dict(added=0, changed=1, removed=0, unchanged=1, kept=0)}
+    delta.save()
+    assert DeltaSnapshot(path).unchanged('aggregates', 'we1', {'name': 'we1'})
+
+
+def test_keep(tmpdir):
+    path = str(tmpdir.join('snapshot'))
+    delta = DeltaSnapshot(path)
+    delta.unchanged('volumes', 'we1', {'name': 'we1'})
+    delta.unchanged('volumes', 'we2', {'name': 'we2'})
+    delta.diff('volumes', {'we1': ['vol1'], 'we2': ['vol2']})
+    delta.save()
+    delta = DeltaSnapshot(path)
+    assert not delta.unchanged('volumes', 'we1', {'name': 'we1', 'status': 'OFF'})
+    # fetching the volumes of we1 failed
+    delta.keep('volumes', 'we1')
+    delta.keep('volumes', 'we3')
+    assert delta.diff('volumes', {'we2': ['vol2']}) == dict(added={}, changed={}, removed=[])
+    assert delta.counts == {'volumes': dict(added=0, changed=0, removed=0, unchanged=1, kept=1)}
+    delta.save()
+    delta = DeltaSnapshot(path)
+    # the volumes are fetched again, and compared with the last successful fetch
+    assert not delta.unchanged('volumes', 'we1', {'name': 'we1', 'status': 'OFF'})
+    assert delta.diff('volumes', {'we1': ['vol1']}) == dict(added={}, changed={}, removed=['we2'])
+
+
+def test_invalid_snapshot(tmpdir):
+    path = tmpdir.join('snapshot')
+    path.write('not json')
+    assert DeltaSnapshot(str(path)).baseline
+    path.write(json.dumps({'version': 0, 'objects': {}}))
+    assert DeltaSnapshot(str(path)).baseline
@@ -0,0 +1,99 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_fetch.py
+
+    Provides named fetches, run once and shared by their consumers
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import threading
+import time
+import pytest
+
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_fetch import FetchGraph
+
+
+def test_shared_input_fetched_once():
+    calls = []
+    lock = threading.Lock()
+
+    def fetch(name, delay=0):
+        with lock:
+            calls.append(name)
+        time.sleep(delay)
+        return name
+
+    graph = FetchGraph(max_workers=4)
+    graph.add('working_environments', lambda: fetch('working_environments', 0.05))
+    for index in range(4):
+        graph.add('subset%d' % index, lambda index=index: (graph.get('working_environments'), index))
+    results = graph.run(['subset3', 'subset1', 'subset0', 'subset2'])
+    assert list(results) == ['subset3', 'subset1', 'subset0', 'subset2']
+    assert results['subset1'] == ('working_environments', 1)
+    assert calls == ['working_environments']
+    # results are kept for the run
+    assert graph.get('subset1') == ('working_environments', 1)
+    assert calls == ['working_environments']
+
+
+def test_sequential():
+    graph = FetchGraph(max_workers=1)
+    graph.add('a', lambda: threading.current_thread().name)
+    graph.add('b', lambda: threading.current_thread().name)
+    assert set(graph.run(['a', 'b']).values()) == set([threading.current_thread().name])
+
+
+def test_without_futures():
+    ''' without concurrent.futures, fetches run sequentially, and shared inputs are still fetched once '''
+    calls = []
+    graph = FetchGraph(max_workers=4)
+    graph.add('input', lambda: calls.append('input') or threading.current_thread().name)
+    graph.add('a', lambda: graph.get('input'))
+    graph.add('b', lambda: graph.get('input'))
+    with patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_fetch.HAS_FUTURES', False):
+        results = graph.run(['a', 'b'])
+    assert results == {'a': threading.current_thread().name, 'b': threading.current_thread().name}
+    assert calls == ['input']
+
+
+def test_error_reported_to_all_consumers():
+    def fail():
+        time.sleep(0.05)
+        raise KeyError('missing')
+
+    graph = FetchGraph()
+    graph.add('input', fail)
+    graph.add('a', lambda: graph.get('input'))
+    graph.add('b', lambda: graph.get('input'))
+    with pytest.raises(KeyError):
+        graph.run(['a', 'b'])
+    with pytest.raises(KeyError):
+        graph.get('b')
@@ -0,0 +1,85 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" unit tests for module_utils netapp_filter.py
+
+    Provides working environment selection on provider, status, HA, name, and tags
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import re
+import pytest
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_filter import WorkingEnvironmentFilter
+
+WE = {'name': 'prod-east', 'cloudProviderName': 'Azure', 'isHA': True, 'status': {'status': 'ON'},
+      'userTags': {'environment': 'production', 'owner': 'team1'}}
+
+
+@pytest.mark.parametrize('filters, expected', [
+    (None, True),
+    ({}, True),
+    (dict(provider=['azure', 'GCP']), True),
+    (dict(provider=['Amazon']), False),
+    (dict(status=['on']), True),
+    (dict(status=['OFF', 'FAILED']), False),
+    (dict(is_ha=True), True),
+    (dict(is_ha=False), False),
+    (dict(name_regex='^prod'), True),
+    (dict(name_regex='west$'), False),
+    (dict(tags={'environment': 'production'}), True),
+    (dict(tags={'owner': None, 'environment': ''}), True),
+    (dict(tags={'environment': 'test'}), False),
+    (dict(tags={'cost_center': None}), False),
+    (dict(provider=['Azure'], is_ha=True, name_regex='east', tags={'owner': 'team1'}), True),
+    (dict(provider=['Azure'], is_ha=False), False),
+])
+def test_match(filters, expected):
+    assert WorkingEnvironmentFilter(filters).match(WE) == expected
+
+
+def test_match_fsx():
+    ''' AWS FSx records have no cloudProviderName, and a list of tags '''
+    file_system = {'name': 'fsx', 'id': 'fs-1', 'status': {'status': 'ON', 'lifecycle': 'AVAILABLE'},
+                   'tags': [{'key': 'environment', 'value': 'production'}]}
+    we_filter = WorkingEnvironmentFilter(dict(provider=['amazon'], tags={'environment': 'production'}))
+    assert we_filter.match(file_system, provider='Amazon')
+    assert not we_filter.match(file_system)
+    assert not WorkingEnvironmentFilter(dict(is_ha=True)).match(file_system)
+
+
+def test_string_status():
+    assert WorkingEnvironmentFilter(dict(status=['off'])).match({'status': 'OFF'})
+    assert not WorkingEnvironmentFilter(dict(status=['off'])).match({'status': None})
+
+
+def test_invalid_regex():
+    with pytest.raises(re.error):
+        WorkingEnvironmentFilter(dict(name_regex='['))
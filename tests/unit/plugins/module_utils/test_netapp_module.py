@@ -37,6 +37,8 @@ __metaclass__ = type
 # import copy     # for deepcopy
 import json
 import sys
+import threading
+import time
 import pytest
 try:
     HAS_REQUESTS_EXC = True
@@ -47,6 +49,7 @@ from ansible.module_utils import basic
 from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_cache
 from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module import cmp as nm_cmp, NetAppModule
 if (not netapp_utils.HAS_REQUESTS or not HAS_REQUESTS_EXC) and sys.version_info < (3, 5):
     pytestmark = pytest.mark.skip('skipping as missing required imports on 2.6 and 2.7')
@@ -85,6 +88,8 @@ def mock_args(feature_flags=None, client_id=None):
     args = {
         'refresh_token': 'ABCDEFGS'
     }
+    if feature_flags is not None:
+        args['feature_flags'] = feature_flags
     return args
 
 
@@ -148,6 +153,68 @@ def test_get_working_environments_info(mock_request):
     assert helper.get_working_environments_info(rest_api, '') == ({'c': 'd'}, '500')
 
 
+@patch('requests.request')
+def test_get_working_environments_info_with_fields(mock_request):
+    json_data = {'vsaWorkingEnvironments': [{'name': 'bob', 'publicId': 'VsaWorkingEnvironment-abc', 'ontapClusterProperties': {'x': 'y'}}],
+                 'onPremWorkingEnvironments': []}
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data=json_data, status_code=200),
+    ]
+    helper = NetAppModule()
+    rest_api = create_restapi_object(mock_args())
+    expected = {'vsaWorkingEnvironments': [{'name': 'bob', 'publicId': 'VsaWorkingEnvironment-abc'}],
+                'onPremWorkingEnvironments': []}
+    assert helper.get_working_environments_info(rest_api, '', ['name', 'publicId']) == (expected, None)
+
+
+@patch('requests.request')
+def test_working_environments_snapshot(mock_request, tmpdir):
+    ''' with working_environments_cache_ttl, working environments are fetched once until invalidated '''
+    json_data = {'vsaWorkingEnvironments': [{'name': 'bob', 'publicId': 'VsaWorkingEnvironment-abc', 'cloudProviderName': 'Amazon'}],
+                 'onPremWorkingEnvironments': [], 'gcpVsaWorkingEnvironments': [], 'azureVsaWorkingEnvironments': []}
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data=json_data, status_code=200),
+        mockResponse(json_data={'publicId': 'VsaWorkingEnvironment-abc', 'svmName': 'svm'}, status_code=200),
+        mockResponse(json_data=[{'name': 'fsx', 'id': 'fs-1'}], status_code=200),
+        mockResponse(json_data=TOKEN_DICT, status_code=200),  # OAUTH
+        mockResponse(json_data=True, status_code=200),      # exists
+        mockResponse(json_data=json_data, status_code=200),
+    ]
+    headers = {'X-Agent-Id': 'agent1'}
+    helper = NetAppModule()
+    helper.parameters = {'working_environment_id': 'VsaWorkingEnvironment-abc', 'tenant_id': 'tenant', 'name': 'fsx'}
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir)):
+        rest_api = create_restapi_object(mock_args(feature_flags={'working_environments_cache_ttl': 60}))
+        assert helper.get_working_environments_info(rest_api, headers, ['name']) == \
+            ({'vsaWorkingEnvironments': [{'name': 'bob'}], 'onPremWorkingEnvironments': [], 'gcpVsaWorkingEnvironments': [],
+              'azureVsaWorkingEnvironments': []}, None)
+        # no exists check when the snapshot is fresh
+        we, error = helper.get_working_environment_details_by_name(rest_api, headers, 'bob', 'aws')
+        assert we['publicId'] == 'VsaWorkingEnvironment-abc'
+        assert mock_request.call_count == 2
+        for dummy in range(2):
+            assert helper.get_working_environment_details(rest_api, headers) == ({'publicId': 'VsaWorkingEnvironment-abc', 'svmName': 'svm'}, None)
+            assert helper.get_aws_fsx_details(rest_api, headers) == ({'name': 'fsx', 'id': 'fs-1'}, None)
+        assert mock_request.call_count == 4
+        # a new task, with a new object, uses the same snapshot
+        rest_api = create_restapi_object(mock_args(feature_flags={'working_environments_cache_ttl': 60}))
+        assert helper.get_working_environment_details_by_name(rest_api, headers, 'bob', 'aws')[1] is None
+        assert mock_request.call_count == 5
+        rest_api.invalidate_working_environments()
+        assert helper.get_working_environment_details_by_name(rest_api, headers, 'bob', 'aws')[1] is None
+        assert mock_request.call_count == 7
+
+
+def test_project_fields():
+    records = [{'name': 'vol1', 'size': {'size': 1, 'unit': 'GB'}, 'junk': 'x' * 100}, {'name': 'vol2'}]
+    assert NetAppModule.project_fields(records, ['name', 'size']) == [{'name': 'vol1', 'size': {'size': 1, 'unit': 'GB'}}, {'name': 'vol2'}]
+    assert NetAppModule.project_fields(records[0], ['name']) == {'name': 'vol1'}
+    assert NetAppModule.project_fields(records, None) is records
+    assert NetAppModule.project_fields(None, ['name']) is None
+
+
 def test_look_up_working_environment_by_name_in_list():
     we_list = [{'name': 'bob', 'b': 'b'}, {'name': 'chuck', 'c': 'c'}]
     helper = NetAppModule()
@@ -558,6 +625,120 @@ def test_delete_occm_agents(mock_request):
     assert helper.delete_occm_agents(rest_api, agents) == [(None, error)]
 
 
+def test_delete_occm_agents_concurrently():
+    ''' deletes are sent concurrently, results are reported in the order of agents '''
+    helper = NetAppModule()
+    in_flight = []
+    max_in_flight = []
+    lock = threading.Lock()
+
+    def delete_occm(rest_api, client_id):
+        with lock:
+            in_flight.append(client_id)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(client_id)
+        return (None, None) if client_id != 'a3' else ('not found', '404')
+
+    agents = [{'agentId': 'a%d' % index} for index in range(10)]
+    with patch.object(helper, 'delete_occm', side_effect=delete_occm):
+        results = helper.delete_occm_agents_concurrently(None, agents, max_workers=4)
+        assert [agent['agentId'] for agent, dummy, dummy in results] == ['a%d' % index for index in range(10)]
+        assert 1 < max(max_in_flight) <= 4
+        assert helper.delete_occm_agents(None, agents) == [('not found', '404')]
+
+
+def test_delete_occm_agents_without_futures():
+    ''' without concurrent.futures, agents are deleted sequentially, in the calling thread '''
+    helper = NetAppModule()
+    threads = []
+
+    def delete_occm(rest_api, client_id):
+        threads.append(threading.current_thread())
+        return None, None
+
+    agents = [{'agentId': 'a%d' % index} for index in range(3)]
+    with patch.object(helper, 'delete_occm', side_effect=delete_occm):
+        with patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.HAS_FUTURES', False):
+            results = helper.delete_occm_agents_concurrently(None, agents, max_workers=4)
+    assert [agent['agentId'] for agent, dummy, dummy in results] == ['a0', 'a1', 'a2']
+    assert threads == [threading.current_thread()] * 3
+
+
+@patch('requests.request')
+def test_delete_stale_occm_agents(mock_request):
+    agents = {'agents': [
+        {'agentId': 'a1', 'name': 'conn-1', 'provider': 'AWS', 'status': 'failed'},
+        {'agentId': 'a2', 'name': 'conn-2', 'provider': 'AWS', 'status': 'active'},
+        {'agentId': 'a3', 'name': 'conn-3', 'provider': 'GCP', 'status': 'failed'},
+        {'agentId': 'a4', 'name': 'other', 'provider': 'AWS', 'status': 'failed'},
+        {'agentId': 'a5', 'name': 'conn-5', 'provider': 'AWS', 'status': 'pending'},
+        {'agentId': 'a6', 'name': 'conn-6', 'provider': 'AWS', 'status': 'deploying'},
+        {'agentId': 'a7', 'name': 'conn-7', 'provider': 'AWS'},
+    ]}
+    mock_request.side_effect = [
+        mockResponse(json_data=TOKEN_DICT, status_code=200),    # OAUTH
+        mockResponse(json_data=agents, status_code=200),
+        mockResponse(json_data={'result': 'any'}, status_code=200),    # a1
+        mockResponse(json_data=agents, status_code=200),
+        mockResponse(json_data={'c': 'd'}, status_code=500),
+    ]
+    helper = NetAppModule()
+    helper.parameters['account_id'] = 'account_id'
+    rest_api = create_restapi_object(mock_args())
+    assert helper.delete_stale_occm_agents(rest_api, 'account_id', 'conn-*', 'AWS') == (['a1'], {}, None)
+    assert helper.delete_stale_occm_agents(rest_api, 'account_id', 'conn-*', 'GCP', check_mode=True) == (['a3'], {}, None)
+    assert helper.delete_stale_occm_agents(rest_api, 'account_id', 'conn-*', 'AWS') == (None, None, '500')
+    assert mock_request.call_count == 5
+
+
+class MockAccounts:
+    ''' only supports looking up an account '''
+    def __init__(self, account_id, error=None):
+        self.account_id = account_id
+        self.error = error
+        self.calls = 0
+
+    def get_account_id(self):
+        self.calls += 1
+        return self.account_id, self.error
+
+
+def test_cleanup_stale_agents():
+    agents = {'agents': [
+        {'agentId': 'a1', 'name': 'conn-1', 'provider': 'AWS', 'status': 'failed'},
+        {'agentId': 'a2', 'name': 'conn-2', 'provider': 'AWS', 'status': 'inactive'},
+    ]}
+    helper = NetAppModule()
+    helper.parameters = {'stale_agents_pattern': 'conn-*'}
+    accounts = MockAccounts('account-1')
+    with patch.object(helper, 'get_occm_agents_by_account', return_value=(agents, None)) as get_agents:
+        with patch.object(helper, 'delete_occm', side_effect=lambda rest_api, client_id: ('not found', '404') if client_id == 'a2' else (None, None)):
+            assert helper.cleanup_stale_agents(None, accounts, 'AWS', check_mode=True) == ({'changed': True, 'stale_agents': ['a1', 'a2']}, None)
+            assert helper.cleanup_stale_agents(None, accounts, 'AWS') == (
+                {'changed': True, 'stale_agents': ['a1', 'a2']}, 'Error: deleting 1 of 2 stale OCCM agent(s): a2: 404: not found')
+            assert helper.cleanup_stale_agents(None, accounts, 'GCP') == ({'changed': False, 'stale_agents': []}, None)
+    assert [call[0][1] for call in get_agents.call_args_list] == ['account-1'] * 3
+    # account_id is used as is
+    helper.parameters['account_id'] = 'account-2'
+    with patch.object(helper, 'get_occm_agents_by_account', return_value=(None, 'intentional error')) as get_agents:
+        assert helper.cleanup_stale_agents(None, accounts, 'AWS') == ({}, 'Error: getting OCCM agents: intentional error')
+    assert get_agents.call_args[0][1] == 'account-2'
+    assert accounts.calls == 3
+
+
+def test_cleanup_stale_agents_without_account():
+    ''' the account is only looked up, never created '''
+    helper = NetAppModule()
+    helper.parameters = {'stale_agents_pattern': 'conn-*'}
+    with patch.object(helper, 'get_or_create_account') as get_or_create_account:
+        with patch.object(helper, 'get_occm_agents_by_account') as get_agents:
+            assert helper.cleanup_stale_agents(None, MockAccounts(None, 'no account'), 'AWS') == ({}, 'Error: failed to get account: no account.')
+    assert not get_or_create_account.called
+    assert not get_agents.called
+
+
 @patch('requests.request')
 def test_get_tenant(mock_request):
     tenants = [{'publicId': 'a1'},
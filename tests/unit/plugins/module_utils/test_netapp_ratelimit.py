@@ -0,0 +1,117 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_ratelimit.py
+
+    Provides a token bucket per host, shared across processes
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_ratelimit import RateLimiter
+
+
+class Clock(object):
+    ''' fake time, sleep advances the clock '''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with patch('time.time', clock.time), patch('time.sleep', clock.sleep):
+        yield clock
+
+
+def test_get_key(tmpdir):
+    limiter = RateLimiter({'cloudmanager': 10, 'staging.cloudmanager': 5, 'auth0': 2}, str(tmpdir))
+    assert limiter.get_key('cloudmanager.cloud.netapp.com') == 'cloudmanager'
+    assert limiter.get_key('staging.cloudmanager.cloud.netapp.com') == 'staging.cloudmanager'
+    assert limiter.get_key('netapp-cloud-account.auth0.com') == 'auth0'
+    assert limiter.get_key('compute.googleapis.com') is None
+
+
+def test_acquire_burst_then_rate(tmpdir, clock):
+    limiter = RateLimiter({'cloudmanager': 2}, str(tmpdir))
+    # a burst of one second worth of requests
+    assert limiter.acquire('cloudmanager.cloud.netapp.com') == 0
+    assert limiter.acquire('cloudmanager.cloud.netapp.com') == 0
+    # then one request every 0.5 second
+    assert limiter.acquire('cloudmanager.cloud.netapp.com') == pytest.approx(0.5)
+    assert limiter.acquire('cloudmanager.cloud.netapp.com') == pytest.approx(0.5)
+    # hosts that are not configured are not limited
+    assert limiter.acquire('compute.googleapis.com') == 0
+
+
+def test_shared_between_instances(tmpdir, clock):
+    ''' two processes share the same state file '''
+    first = RateLimiter({'cloudmanager': 1}, str(tmpdir))
+    second = RateLimiter({'cloudmanager': 1}, str(tmpdir))
+    assert first.acquire('cloudmanager.cloud.netapp.com') == 0
+    # the token was reserved by the first one, even though no time has passed
+    assert second.acquire('cloudmanager.cloud.netapp.com') == pytest.approx(1.0)
+
+
+def test_feedback(tmpdir, clock):
+    limiter = RateLimiter({'cloudmanager': 10}, str(tmpdir))
+    host = 'cloudmanager.cloud.netapp.com'
+    limiter.feedback(host, 429, '3')
+    state = limiter.store.get('cloudmanager')
+    assert state['rate'] == 5
+    assert state['blocked_until'] == clock.now + 3
+    # all requests wait for Retry-After
+    assert limiter.acquire(host) == pytest.approx(3)
+    limiter.feedback(host, 429)
+    limiter.feedback(host, 429)
+    limiter.feedback(host, 429)
+    # the rate does not go below 10% of the limit
+    assert limiter.store.get('cloudmanager')['rate'] == 1
+    limiter.feedback(host, 200)
+    assert limiter.store.get('cloudmanager')['rate'] == 1.5
+    for dummy in range(20):
+        limiter.feedback(host, 200)
+    assert limiter.store.get('cloudmanager')['rate'] == 10
+
+
+def test_limit_change_resets_state(tmpdir, clock):
+    RateLimiter({'cloudmanager': 10}, str(tmpdir)).feedback('cloudmanager.cloud.netapp.com', 429)
+    limiter = RateLimiter({'cloudmanager': 20}, str(tmpdir))
+    assert limiter.acquire('cloudmanager.cloud.netapp.com') == 0
+    assert limiter.store.get('cloudmanager')['rate'] == 20
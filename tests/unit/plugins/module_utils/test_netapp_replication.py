@@ -0,0 +1,108 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_replication.py
+
+    Provides compact snapmirror records and fleet statistics
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+import pytest
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_replication import \
+    normalize_relationship, ReplicationSummary, to_bytes, to_seconds
+
+
+@pytest.mark.parametrize('value, expected', [
+    (90, 90),
+    ({'size': 2, 'unit': 'minutes'}, 120),
+    ({'length': 1, 'unit': 'HOURS'}, 3600),
+    ('PT1H30M5S', 5405),
+    ('P1DT1H', 90000),
+    ('P', None),
+    ('soon', None),
+    ({'size': 1, 'unit': 'fortnight'}, None),
+    (None, None),
+    (True, None),
+])
+def test_to_seconds(value, expected):
+    assert to_seconds(value) == expected
+
+
+def test_to_bytes():
+    assert to_bytes({'size': 2, 'unit': 'KB'}) == 2048
+    assert to_bytes(10) == 10
+    assert to_bytes({'size': 2, 'unit': 'parsecs'}) is None
+
+
+def relationship(volume, lag, policy='MirrorAllSnapshots', state='snapmirrored', **kwargs):
+    record = dict(source=dict(workingEnvironmentId='we1', svmName='svm1', volumeName=volume),
+                  destination=dict(workingEnvironmentId='we2', svmName='svm2', volumeName=volume + '_copy'),
+                  mirrorState=state, status='idle', policy=policy, lagTime=lag,
+                  lastTransferInfo=dict(transferSize={'size': 1, 'unit': 'MB'}, transferDuration={'size': 10, 'unit': 'seconds'}))
+    record.update(kwargs)
+    return record
+
+
+def test_normalize_relationship():
+    assert normalize_relationship(relationship('vol1', {'size': 1, 'unit': 'hours'})) == dict(
+        source_working_environment_id='we1', source_svm_name='svm1', source_volume_name='vol1',
+        destination_working_environment_id='we2', destination_svm_name='svm2', destination_volume_name='vol1_copy',
+        mirror_state='snapmirrored', status='idle', policy='MirrorAllSnapshots', schedule=None, lag_seconds=3600,
+        last_transfer_bytes=1024 ** 2, last_transfer_seconds=10, last_transfer_error=None, healthy=True, unhealthy_reason=None)
+    assert not normalize_relationship(relationship('vol1', None, state='broken-off'))['healthy']
+    assert not normalize_relationship(relationship('vol1', 10, healthy=False))['healthy']
+
+
+def test_summary():
+    summary = ReplicationSummary(lag_threshold=3600)
+    for record in [relationship('vol1', 60), relationship('vol2', 7200, policy='Vault'), relationship('vol3', None, state='uninitialized'),
+                   relationship('vol4', 4000, healthy=False, unhealthyReason='transfer failed')]:
+        summary.add(normalize_relationship(record))
+    result = summary.summary()
+    assert result['total'] == 4
+    assert result['unhealthy'] == 2
+    assert result['lagging'] == 2
+    assert result['unknown_lag'] == 1
+    assert result['max_lag_seconds'] == 7200
+    assert result['max_lag_relationship']['source_volume_name'] == 'vol2'
+    assert result['mean_lag_seconds'] == (60 + 7200 + 4000) / 3
+    assert result['last_transfer_bytes'] == 4 * 1024 ** 2
+    assert result['mirror_states'] == {'snapmirrored': 3, 'uninitialized': 1}
+    assert result['policies'] == {
+        'MirrorAllSnapshots': dict(count=3, unhealthy=2, lagging=1, max_lag_seconds=4000),
+        'Vault': dict(count=1, unhealthy=0, lagging=1, max_lag_seconds=7200),
+    }
+
+
+def test_empty_summary():
+    result = ReplicationSummary().summary()
+    assert result['total'] == 0
+    assert result['max_lag_seconds'] is None
+    assert result['mean_lag_seconds'] is None
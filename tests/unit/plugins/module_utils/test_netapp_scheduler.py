@@ -0,0 +1,130 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_scheduler.py
+
+    Runs operations concurrently, with mutual exclusion per key
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import threading
+import time
+import pytest
+
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_scheduler import KeyedScheduler
+
+
+class Tracker(object):
+    ''' record how many operations run at the same time, globally and per key '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.total = 0
+        self.max_total = 0
+        self.order = []
+
+    def operation(self, key, value, delay=0.02):
+        with self.lock:
+            self.running[key] = self.running.get(key, 0) + 1
+            self.max_running[key] = max(self.max_running.get(key, 0), self.running[key])
+            self.total += 1
+            self.max_total = max(self.max_total, self.total)
+        time.sleep(delay)
+        with self.lock:
+            self.running[key] -= 1
+            self.total -= 1
+            self.order.append((key, value))
+        return value
+
+
+def test_mutual_exclusion_per_key():
+    tracker = Tracker()
+    with KeyedScheduler(max_workers=4) as scheduler:
+        futures = [scheduler.submit(key, tracker.operation, key, index) for index in range(4) for key in ('we1', 'we2')]
+    assert [future.result() for future in futures] == [index for index in range(4) for key in ('we1', 'we2')]
+    assert tracker.max_running == {'we1': 1, 'we2': 1}
+    assert tracker.max_total == 2
+    # operations for a key run in submission order
+    assert [value for key, value in tracker.order if key == 'we1'] == [0, 1, 2, 3]
+
+
+def test_max_per_key_and_global_limit():
+    tracker = Tracker()
+    with KeyedScheduler(max_workers=3, max_per_key=2) as scheduler:
+        futures = [scheduler.submit(key, tracker.operation, key, index) for index in range(6) for key in ('we1', 'we2')]
+    assert len([future.result() for future in futures]) == 12
+    assert tracker.max_running['we1'] <= 2
+    assert tracker.max_running['we2'] <= 2
+    assert tracker.max_total == 3
+
+
+def test_queued_operations_do_not_hold_threads():
+    ''' operations waiting for a busy key do not prevent other keys from running '''
+    tracker = Tracker()
+    with KeyedScheduler(max_workers=2) as scheduler:
+        blocked = [scheduler.submit('we1', tracker.operation, 'we1', index, 0.05) for index in range(4)]
+        other = scheduler.submit('we2', tracker.operation, 'we2', 0, 0)
+        assert other.result(timeout=1) == 0
+        assert not all(future.done() for future in blocked)
+
+
+def test_no_key():
+    tracker = Tracker()
+    with KeyedScheduler(max_workers=4) as scheduler:
+        futures = [scheduler.submit(None, tracker.operation, None, index) for index in range(4)]
+    assert [future.result() for future in futures] == [0, 1, 2, 3]
+    assert tracker.max_total == 4
+
+
+def test_exception_releases_key():
+    def fail():
+        raise ValueError('failed')
+    with KeyedScheduler(max_workers=2) as scheduler:
+        first = scheduler.submit('we1', fail)
+        second = scheduler.submit('we1', lambda: 'ok')
+    with pytest.raises(ValueError, match='failed'):
+        first.result()
+    assert second.result() == 'ok'
+    assert scheduler.running == {}
+    assert scheduler.queues == {}
+
+
+def test_system_exit_is_set_on_future():
+    def exit_module():
+        raise SystemExit(1)
+    with KeyedScheduler(max_workers=2) as scheduler:
+        first = scheduler.submit('we1', exit_module)
+        second = scheduler.submit('we1', lambda: 'ok')
+    with pytest.raises(SystemExit):
+        first.result(5)
+    assert second.result(5) == 'ok'
+    assert scheduler.running == {}
@@ -0,0 +1,145 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+""" unit tests for module_utils netapp_snapmirror.py
+
+    Provides helpers shared by the snapmirror modules
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_cache
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_snapmirror import build_quote_request, find_snapmirror, \
+    index_replication_status, InterclusterLifs
+
+SOURCE_VOLUME = dict(name='vol1', svmName='svm_source', size={'size': 10, 'unit': 'GB'}, snapshotPolicy='default', deduplication=True,
+                     thinProvisioning=True, compression=False, aggregateName='aggr1', providerVolumeType='gp3')
+AGGREGATE = {'name': 'aggr1', 'providerVolumes': [{'diskType': 'gp3', 'iops': 3000, 'throughput': 125}]}
+LIFS = {'interClusterLifs': [{'address': '10.0.0.1'}], 'peerInterClusterLifs': [{'address': '10.0.0.2'}]}
+
+
+class MockRestAPI(object):
+    def __init__(self, error=None, user='user'):
+        self.error = error
+        self.user = user
+        self.calls = 0
+
+    def get_user_key(self):
+        return 'prod:%s' % self.user
+
+    def send_request(self, method, api, params, json=None, header=None):
+        self.calls += 1
+        if self.error is not None:
+            return 'response', self.error, None
+        return LIFS, None, None
+
+
+def test_find_snapmirror():
+    index = index_replication_status([
+        {'destination': {'volumeName': 'vol1', 'svmName': 'svm1', 'workingEnvironmentId': 'we1'}},
+        {'destination': {'volumeName': 'vol1', 'svmName': 'svm2', 'workingEnvironmentId': 'we2'}},
+    ])
+    assert find_snapmirror(index, 'we2', None, 'vol1')['destination']['svmName'] == 'svm2'
+    assert find_snapmirror(index, None, 'svm1', 'vol1')['destination']['workingEnvironmentId'] == 'we1'
+    assert find_snapmirror(index, 'we3', None, 'vol1') is None
+    assert find_snapmirror(index, 'we1', None, 'vol2') is None
+    assert index_replication_status(None) == {}
+
+
+def test_index_replication_status():
+    ''' volumes with the same name on different SVMs or working environments have their own entry '''
+    relationships = [
+        {'destination': {'volumeName': 'vol1', 'svmName': 'svm1', 'workingEnvironmentId': 'we1'}},
+        {'destination': {'volumeName': 'vol1', 'svmName': 'svm2', 'workingEnvironmentId': 'we1'}},
+        {'destination': {'volumeName': 'vol1', 'svmName': 'svm1', 'workingEnvironmentId': 'we2'}},
+        {'destination': {'volumeName': 'vol2'}},
+    ]
+    index = index_replication_status(relationships)
+    assert sorted(index, key=str) == [('we1', 'svm1', 'vol1'), ('we1', 'svm2', 'vol1'), ('we2', 'svm1', 'vol1'), (None, None, 'vol2')]
+    assert find_snapmirror(index, 'we1', 'svm2', 'vol1') is relationships[1]
+    assert find_snapmirror(index, 'we2', 'svm1', 'vol1') is relationships[2]
+    assert find_snapmirror(index, 'we2', 'svm2', 'vol1') is None
+    # a relationship that does not report its working environment or SVM matches any
+    assert find_snapmirror(index, 'we1', 'svm1', 'vol2') is relationships[3]
+
+
+def test_build_quote_request():
+    source_we = {'publicId': 'we1', 'workingEnvironmentType': 'VSA'}
+    dest_we = {'publicId': 'we2', 'workingEnvironmentType': 'VSA'}
+    quote = build_quote_request(source_we, dest_we, SOURCE_VOLUME, AGGREGATE, 'vol1_copy', 'svm_dest', 'S3')
+    assert quote['name'] == 'vol1_copy'
+    assert quote['svmName'] == 'svm_dest'
+    assert quote['workingEnvironmentId'] == 'we2'
+    assert quote['iops'] == 3000
+    assert quote['throughput'] == 125
+    assert quote['capacityTier'] == 'S3'
+    assert quote['providerVolumeType'] == 'gp3'
+    quote = build_quote_request(dict(source_we, workingEnvironmentType='ON_PREM'), dest_we, SOURCE_VOLUME, None, 'vol1_copy', 'svm_dest',
+                                provider_volume_type='st1')
+    assert 'iops' not in quote
+    assert 'capacityTier' not in quote
+    assert quote['providerVolumeType'] == 'st1'
+
+
+def test_interclusterlifs_cached(tmpdir):
+    rest_api = MockRestAPI()
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir)):
+        lifs = InterclusterLifs(rest_api, {'X-Agent-Id': 'client1'}, 60)
+        assert lifs.get('we1', 'we2') == (LIFS, None)
+        assert lifs.get('we1', 'we2') == (LIFS, None)
+        assert rest_api.calls == 1
+        lifs.delete('we1', 'we2')
+        assert lifs.get('we1', 'we2') == (LIFS, None)
+        assert rest_api.calls == 2
+
+
+def test_interclusterlifs_cached_per_user_and_connector(tmpdir):
+    ''' LIFs cached for a user or a connector are not reused for another one '''
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir)):
+        InterclusterLifs(MockRestAPI(), {'X-Agent-Id': 'client1'}, 60).get('we1', 'we2')
+        for user, client_id in (('other', 'client1'), ('user', 'client2')):
+            rest_api = MockRestAPI(user=user)
+            assert InterclusterLifs(rest_api, {'X-Agent-Id': client_id}, 60).get('we1', 'we2') == (LIFS, None)
+            assert rest_api.calls == 1
+
+
+def test_interclusterlifs_no_cache(tmpdir):
+    rest_api = MockRestAPI()
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir)):
+        lifs = InterclusterLifs(rest_api, {'X-Agent-Id': 'client1'}, 0)
+        lifs.get('we1', 'we2')
+        lifs.get('we1', 'we2')
+        lifs.delete('we1', 'we2')
+        assert rest_api.calls == 2
+        assert tmpdir.listdir() == []
+
+
+def test_interclusterlifs_error(tmpdir):
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir)):
+        assert InterclusterLifs(MockRestAPI('400'), {'X-Agent-Id': 'client1'}, 60).get('we1', 'we2') == (None, 'Error getting interclusterlifs 400: response.')
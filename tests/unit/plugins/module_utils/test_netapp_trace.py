@@ -0,0 +1,156 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Copyright (c) 2022, NetApp Ansible Team <ng-ansibleteam@netapp.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" unit tests for module_utils netapp_trace.py
+
+    Provides a JSON lines trace of REST requests
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import pytest
+
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_trace
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_trace import format_body, get_trace_sink, redact
+
+
+class mockResponse:
+    def __init__(self, content, headers=None):
+        self.content = content
+        self.headers = headers or {}
+
+
+def read_records(path):
+    with open(path) as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_redact():
+    value = {'name': 'we', 'svmPassword': 'secret', 'nested': [{'refresh_token': 'abc', 'size': 1}], 'clientSecret': None}
+    assert redact(value) == {'name': 'we', 'svmPassword': '********', 'nested': [{'refresh_token': '********', 'size': 1}], 'clientSecret': None}
+    # the original is not modified
+    assert value['svmPassword'] == 'secret'
+
+
+def test_format_body():
+    assert format_body(b'{"access_token": "abc"}', 100) == {'access_token': '********'}
+    assert format_body(b'not json', 100) == 'not json'
+    assert format_body('x' * 20, 10) == 'xxxxxxxxxx...<truncated 10 characters>'
+    assert format_body({'key': 'x' * 20}, 10) == '{"key": "x...<truncated 21 characters>'
+    assert format_body({'key': 'x' * 20}, 0) == {'key': 'x' * 20}
+
+
+def test_trace(tmpdir):
+    path = str(tmpdir.join('trace.log'))
+    sink = get_trace_sink(path, include_headers=True)
+    assert get_trace_sink(path) is sink
+    sink.trace('POST', 'https://host/api', {'filter': 'all'}, {'password': 'pwd'}, None, {'Authorization': 'Bearer abc'},
+               mockResponse(b'{"id": 1}', {'OnCloud-Request-Id': 'ocr'}), 200, None, 0.25, 'ocr')
+    sink.stop()
+    records = read_records(path)
+    assert len(records) == 1
+    record = records[0]
+    assert record['method'] == 'POST'
+    assert record['elapsed_ms'] == 250
+    assert record['request_body'] == {'password': '********'}
+    assert record['request_headers'] == {'Authorization': '********'}
+    assert record['response_body'] == {'id': 1}
+    assert record['on_cloud_request_id'] == 'ocr'
+    assert 'pid' in record and 'time' in record
+    # stopped sinks are not reused
+    assert get_trace_sink(path) is not sink
+    get_trace_sink(path).stop()
+
+
+def test_trace_sampling(tmpdir):
+    path = str(tmpdir.join('trace.log'))
+    sink = get_trace_sink(path, sample_rate=0.5)
+    with patch.object(netapp_trace.random, 'random', side_effect=[0.9, 0.1]):
+        sink.trace('GET', 'https://host/api', None, None, None, {}, mockResponse(b'{}'), 200, None, 0.1)
+        sink.trace('GET', 'https://host/api', None, None, None, {}, mockResponse(b'{}'), 200, None, 0.1)
+        # errors are always recorded, without drawing
+        sink.trace('GET', 'https://host/api', None, None, None, {}, None, None, 'Connection error', 0.1)
+    sink.stop()
+    records = read_records(path)
+    assert [record['error'] for record in records] == [None, 'Connection error']
+    assert 'request_headers' not in records[0]
+
+
+def test_trace_rotation(tmpdir):
+    path = str(tmpdir.join('trace.log'))
+    sink = get_trace_sink(path, max_bytes=1000, backup_count=2, body_limit=100)
+    for __ in range(50):
+        sink.trace('GET', 'https://host/api', None, None, None, {}, mockResponse(b'x' * 1000), 200, None, 0.1)
+    sink.stop()
+    assert sorted(os.listdir(str(tmpdir))) == ['trace.log', 'trace.log.1', 'trace.log.2', 'trace.log.lock']
+    for name in os.listdir(str(tmpdir)):
+        assert os.path.getsize(str(tmpdir.join(name))) < 1000
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or not netapp_trace.HAS_FCNTL, reason='requires fork and flock')
+def test_trace_rotation_shared_by_processes(tmpdir):
+    ''' several processes write and rotate the same file, records are not lost or interleaved '''
+    path = str(tmpdir.join('trace.log'))
+    pids = []
+    for index in range(4):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                sink = netapp_trace.TraceSink(path, max_bytes=2000, backup_count=100, body_limit=100)
+                for count in range(50):
+                    sink.trace('GET', 'https://host/api/%d/%d' % (index, count), None, None, None, {}, mockResponse(b'x' * 100), 200, None, 0.1)
+                sink.stop()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        assert os.waitpid(pid, 0)[1] == 0
+    urls = []
+    for name in os.listdir(str(tmpdir)):
+        if name != 'trace.log.lock':
+            assert os.path.getsize(str(tmpdir.join(name))) < 2000
+            urls.extend(record['url'] for record in read_records(str(tmpdir.join(name))))
+    assert sorted(urls) == sorted('https://host/api/%d/%d' % (index, count) for index in range(4) for count in range(50))
+
+
+def test_trace_append_without_rotation(tmpdir):
+    path = str(tmpdir.join('trace.log'))
+    with open(path, 'w') as fh:
+        fh.write('{"message": "previous run"}\n')
+    sink = get_trace_sink(path, max_bytes=0, body_limit=100)
+    for __ in range(50):
+        sink.trace('GET', 'https://host/api', None, None, None, {}, mockResponse(b'x' * 1000), 200, None, 0.1)
+    sink.stop()
+    assert sorted(os.listdir(str(tmpdir))) == ['trace.log', 'trace.log.lock']
+    records = read_records(path)
+    assert len(records) == 51
+    assert records[0] == {'message': 'previous run'}
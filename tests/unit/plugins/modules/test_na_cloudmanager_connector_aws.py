@@ -8,8 +8,11 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 import json
+import shutil
 import sys
+import tempfile
 import pytest
+import yaml
 
 HAS_BOTOCORE = True
 try:
@@ -21,9 +24,10 @@ from ansible.module_utils import basic
 from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat import unittest
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache as netapp_cache
 
 from ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_connector_aws \
-    import NetAppCloudManagerConnectorAWS as my_module, IMPORT_EXCEPTION, main as my_main
+    import NetAppCloudManagerConnectorAWS as my_module, IMPORT_EXCEPTION, EXAMPLES, main as my_main
 
 if IMPORT_EXCEPTION is not None and sys.version_info < (3, 5):
     pytestmark = pytest.mark.skip('skipping as missing required imports on 2.6 and 2.7: %s' % IMPORT_EXCEPTION)
@@ -65,6 +69,12 @@ class TestMyModule(unittest.TestCase):
                                                  fail_json=fail_json)
         self.mock_module_helper.start()
         self.addCleanup(self.mock_module_helper.stop)
+        # keep the AMI cache local to each test
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mock_cache_dir = patch.object(netapp_cache, 'CACHE_DIR', cache_dir)
+        self.mock_cache_dir.start()
+        self.addCleanup(self.mock_cache_dir.stop)
 
     def set_default_args_pass_check(self):
         return dict({
@@ -662,16 +672,164 @@ class TestMyModule(unittest.TestCase):
         msg = "Note: modifying an existing connector is not supported at this time."
         assert msg == exc.value.args[0]['modify']
 
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('boto3.client')
+    def test_get_ami_paginated(self, get_boto3_client, get_token):
+        ''' latest image is found across pages '''
+        args = self.set_args_create_cloudmanager_connector_aws()
+        args.pop('ami')
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        get_boto3_client.return_value = EC2(images=[[{'CreationDate': '2022-01-02', 'ImageId': 'ami-2'}],
+                                                    [{'CreationDate': '2022-01-03', 'ImageId': 'ami-3'},
+                                                     {'CreationDate': '2022-01-01', 'ImageId': 'ami-1'}]])
+        my_obj = my_module()
+        assert my_obj.get_ami() == 'ami-3'
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('boto3.client')
+    def test_get_ami_cached(self, get_boto3_client, get_token):
+        ''' second lookup is served from the cache, unless a refresh is forced '''
+        args = self.set_args_create_cloudmanager_connector_aws()
+        args.pop('ami')
+        args['ami_cache_ttl'] = 3600
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        ec2 = EC2(images=[[{'CreationDate': '2022-01-02', 'ImageId': 'ami-2'}]])
+        get_boto3_client.return_value = ec2
+        my_obj = my_module()
+        assert my_obj.get_ami() == 'ami-2'
+        ec2.images = [[{'CreationDate': '2022-01-03', 'ImageId': 'ami-3'}]]
+        assert my_obj.get_ami() == 'ami-2'
+        assert ec2.describe_images_count == 1
+        my_obj.parameters['ami_cache_refresh'] = True
+        assert my_obj.get_ami() == 'ami-3'
+        my_obj.parameters['ami_cache_refresh'] = False
+        assert my_obj.get_ami() == 'ami-3'
+        # cache is per region
+        my_obj.parameters['region'] = 'us-east-1'
+        ec2.images = [[{'CreationDate': '2022-01-04', 'ImageId': 'ami-4'}]]
+        assert my_obj.get_ami() == 'ami-4'
+        assert ec2.describe_images_count == 3
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('boto3.client')
+    def test_get_ami_no_cache(self, get_boto3_client, get_token):
+        ''' cache is disabled by default '''
+        args = self.set_args_create_cloudmanager_connector_aws()
+        args.pop('ami')
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        ec2 = EC2(images=[[{'CreationDate': '2022-01-02', 'ImageId': 'ami-2'}]])
+        get_boto3_client.return_value = ec2
+        my_obj = my_module()
+        assert my_obj.get_ami() == 'ami-2'
+        assert my_obj.get_ami() == 'ami-2'
+        assert ec2.describe_images_count == 2
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('boto3.client')
+    def test_get_ami_not_found(self, get_boto3_client, get_token):
+        args = self.set_args_create_cloudmanager_connector_aws()
+        args.pop('ami')
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        get_boto3_client.return_value = EC2(images=[[]])
+        my_obj = my_module()
+        with pytest.raises(AnsibleFailJson) as exc:
+            my_obj.get_ami()
+        assert 'Error: no image found matching' in exc.value.args[0]['msg']
+
+    STALE_AGENTS = {'agents': [
+        {'agentId': 'a1', 'name': 'Dummyname-1', 'provider': 'AWS', 'status': 'failed'},
+        {'agentId': 'a2', 'name': 'Dummyname-2', 'provider': 'AWS', 'status': 'active'},
+        {'agentId': 'a3', 'name': 'Dummyname-3', 'provider': 'GCP', 'status': 'failed'},
+        {'agentId': 'a4', 'name': 'other', 'provider': 'AWS', 'status': 'inactive'},
+        {'agentId': 'a5', 'name': 'Dummyname-5', 'provider': 'AWS', 'status': 'inactive'},
+    ]}
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.delete_occm')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_occm_agents_by_account')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    def test_cleanup_stale_agents(self, get_token, get_occm_agents_by_account, delete_occm):
+        args = self.set_args_delete_cloudmanager_connector_aws()
+        args['stale_agents_pattern'] = 'Dummyname-*'
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        get_occm_agents_by_account.return_value = self.STALE_AGENTS, None
+        delete_occm.return_value = None, None
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_main()
+        assert exc.value.args[0]['changed']
+        assert exc.value.args[0]['stale_agents'] == ['a1', 'a5']
+        assert sorted(call[0][1] for call in delete_occm.call_args_list) == ['a1', 'a5']
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.delete_occm')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_occm_agents_by_account')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    def test_cleanup_stale_agents_errors(self, get_token, get_occm_agents_by_account, delete_occm):
+        args = self.set_args_delete_cloudmanager_connector_aws()
+        args['stale_agents_pattern'] = 'Dummyname-*'
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        get_occm_agents_by_account.return_value = self.STALE_AGENTS, None
+        delete_occm.side_effect = lambda rest_api, client_id: ('not found', '404') if client_id == 'a5' else (None, None)
+        with pytest.raises(AnsibleFailJson) as exc:
+            my_main()
+        assert exc.value.args[0]['msg'] == 'Error: deleting 1 of 2 stale OCCM agent(s): a5: 404: not found'
+        assert exc.value.args[0]['changed']
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.delete_occm')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_occm_agents_by_account')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    def test_cleanup_stale_agents_check_mode(self, get_token, get_occm_agents_by_account, delete_occm):
+        args = self.set_args_delete_cloudmanager_connector_aws()
+        args['stale_agents_pattern'] = 'Dummyname-*'
+        args['_ansible_check_mode'] = True
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        get_occm_agents_by_account.return_value = self.STALE_AGENTS, None
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_main()
+        assert exc.value.args[0]['changed']
+        assert exc.value.args[0]['stale_agents'] == ['a1', 'a5']
+        assert not delete_occm.called
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account.AccountContext.get_or_create_account')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_account.AccountContext.get_account_id')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.delete_occm')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_occm_agents_by_account')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    def test_cleanup_stale_agents_example(self, get_token, get_occm_agents_by_account, delete_occm, get_account_id, get_or_create_account):
+        ''' the documented cleanup task is accepted as is, the account is looked up but not created '''
+        task = [task for task in yaml.safe_load(EXAMPLES) if task['name'] == 'Delete the agents left behind by failed deployments'][0]
+        set_module_args(task['netapp.cloudmanager.na_cloudmanager_connector_aws'])
+        get_token.return_value = 'test', 'test'
+        get_account_id.return_value = 'account-test', None
+        get_occm_agents_by_account.return_value = {'agents': [
+            {'agentId': 'a1', 'name': 'ansible-1', 'provider': 'AWS', 'status': 'failed'},
+            {'agentId': 'a2', 'name': 'ansible', 'provider': 'AWS', 'status': 'failed'},
+        ]}, None
+        delete_occm.return_value = None, None
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_main()
+        assert exc.value.args[0]['stale_agents'] == ['a1']
+        assert get_occm_agents_by_account.call_args[0][1] == 'account-test'
+        assert not get_or_create_account.called
+
 
 class EC2:
-    def __init__(self, get_instances=None, create_instance=True, raise_exc=False):
+    def __init__(self, get_instances=None, create_instance=True, raise_exc=False, images=None):
         ''' list of instances as dictionaries:
             name, state are optional, and used to build an instance
             reservation is optional and defaults to 'default'
+            images is a list of pages, and enables pagination for describe_images
         '''
         self.get_instances = get_instances if get_instances is not None else []
         self.create_instance = create_instance if create_instance is not None else []
         self.raise_exc = raise_exc
+        self.images = images
+        self.describe_images_count = 0
 
     def describe_instances(self, Filters=None, InstanceIds=None):
         ''' return a list of reservations, each reservation is a list of instances
@@ -688,6 +846,18 @@ class EC2:
                            {'CreationDate': 'xxxxx', 'ImageId': 'image_id'},
                            {'CreationDate': 'zzzzz', 'ImageId': 'image_id'}]}
 
+    def can_paginate(self, operation_name):
+        return operation_name == 'describe_images' and self.images is not None
+
+    def get_paginator(self, operation_name):
+        return self
+
+    def paginate(self, Filters=None, Owners=None):
+        ''' AMI, one page at a time '''
+        self.describe_images_count += 1
+        for page in self.images:
+            yield {'Images': page}
+
     def describe_subnets(self, SubnetIds=None):
         ''' subnets '''
         return {'Subnets': [{'VpcId': 'vpc_id'}]}
@@ -176,3 +176,58 @@ def test_delete_cloudmanager_connector_azure_pass(get_delete_api, delete_azure_o
         my_obj.apply()
     print('Info: test_delete_cloudmanager_connector_azure: %s' % repr(exc.value))
     assert exc.value.args[0]['changed']
+
+
+STALE_AGENTS = {'agents': [
+    {'agentId': 'a1', 'name': 'Dummyname-1', 'provider': 'AZURE', 'status': 'failed'},
+    {'agentId': 'a2', 'name': 'Dummyname-2', 'provider': 'AZURE', 'status': 'active'},
+    {'agentId': 'a3', 'name': 'Dummyname-3', 'provider': 'AWS', 'status': 'failed'},
+    {'agentId': 'a4', 'name': 'Dummyname-4', 'provider': 'AZURE', 'status': 'inactive'},
+]}
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_occm_agents_by_account')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.delete_occm')
+@patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_connector_azure.NetAppCloudManagerConnectorAzure.get_deploy_azure_vm')
+def test_cleanup_stale_agents(get_deploy_azure_vm, delete_occm, get_occm_agents_by_account, get_token, patch_ansible):
+    args = set_args_delete_cloudmanager_connector_azure()
+    # client_id is not required in cleanup mode
+    del args['client_id']
+    args['stale_agents_pattern'] = 'Dummyname-*'
+    set_module_args(args)
+    get_token.return_value = 'test', 'test'
+    get_occm_agents_by_account.return_value = STALE_AGENTS, None
+    delete_occm.return_value = None, None
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    assert exc.value.args[0]['changed']
+    assert exc.value.args[0]['stale_agents'] == ['a1', 'a4']
+    assert sorted(call[0][1] for call in delete_occm.call_args_list) == ['a1', 'a4']
+    assert get_occm_agents_by_account.call_args[0][1] == 'account-test'
+    assert not get_deploy_azure_vm.called
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_occm_agents_by_account')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.delete_occm')
+def test_cleanup_stale_agents_errors(delete_occm, get_occm_agents_by_account, get_token, patch_ansible):
+    args = set_args_delete_cloudmanager_connector_azure()
+    args['stale_agents_pattern'] = 'Dummyname-*'
+    set_module_args(args)
+    get_token.return_value = 'test', 'test'
+    get_occm_agents_by_account.return_value = STALE_AGENTS, None
+    delete_occm.side_effect = lambda rest_api, client_id: ('not found', '404') if client_id == 'a4' else (None, None)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module().apply()
+    assert exc.value.args[0]['msg'] == 'Error: deleting 1 of 2 stale OCCM agent(s): a4: 404: not found'
+    assert exc.value.args[0]['changed']
+
+
+def test_client_id_or_stale_agents_pattern_required(patch_ansible):
+    args = set_args_delete_cloudmanager_connector_azure()
+    del args['client_id']
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert 'client_id' in exc.value.args[0]['msg']
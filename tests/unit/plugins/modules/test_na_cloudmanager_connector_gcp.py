@@ -8,6 +8,7 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import datetime
 import json
 import sys
 import pytest
@@ -16,6 +17,7 @@ from ansible.module_utils import basic
 from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_cache as netapp_cache
 from ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_connector_gcp \
     import NetAppCloudManagerConnectorGCP as my_module, HAS_GCP_COLLECTION
 
@@ -396,3 +398,88 @@ def test_delete_idempotent(mock_request, get_gcp_token, patch_ansible):
 #     print(exc)
 #     assert not exc.value.args[0]['changed']
 #     assert exc.value.args[0]['client_id'] == SRR['get_agents'][0][0]['agentId']
+
+
+class MockCredentials():
+    ''' mock for google.oauth2 credentials, count how many times a token is requested '''
+    refresh_count = 0
+
+    def __init__(self):
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        MockCredentials.refresh_count += 1
+        self.token = 'gcp_token_%d' % MockCredentials.refresh_count
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+@pytest.fixture(name='gcp_key_file')
+def fixture_gcp_key_file(tmpdir):
+    key_file = tmpdir.join('key.json')
+    key_file.write(json.dumps({'client_email': 'sa@project.iam.gserviceaccount.com', 'private_key_id': 'key_id'}))
+    with patch.object(netapp_cache, 'CACHE_DIR', str(tmpdir.join('cache'))):
+        yield str(key_file)
+
+
+@patch('google.oauth2.service_account.Credentials.from_service_account_file')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+def test_get_gcp_token_is_cached(get_token, from_file, gcp_key_file, patch_ansible):
+    args = set_args_create_cloudmanager_connector_gcp()
+    args['service_account_path'] = gcp_key_file
+    args['gcp_token_cache'] = True
+    set_module_args(args)
+    get_token.return_value = 'bearer', 'test'
+    from_file.side_effect = lambda path, scopes: MockCredentials()
+    MockCredentials.refresh_count = 0
+    my_obj = my_module()
+    # token is not acquired until needed
+    assert my_obj.rest_api.gcp_token is None
+    assert MockCredentials.refresh_count == 0
+    assert my_obj.set_gcp_token() == 'gcp_token_1'
+    # a new task reuses the cached token
+    my_obj = my_module()
+    assert my_obj.set_gcp_token() == 'gcp_token_1'
+    assert MockCredentials.refresh_count == 1
+
+
+@patch('google.oauth2.service_account.Credentials.from_service_account_file')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+def test_get_gcp_token_cache_disabled(get_token, from_file, gcp_key_file, patch_ansible):
+    args = set_args_create_cloudmanager_connector_gcp()
+    args['service_account_path'] = gcp_key_file
+    set_module_args(args)
+    get_token.return_value = 'bearer', 'test'
+    from_file.side_effect = lambda path, scopes: MockCredentials()
+    MockCredentials.refresh_count = 0
+    my_obj = my_module()
+    assert my_obj.get_gcp_token() == ('gcp_token_1', None)
+    assert my_obj.get_gcp_token() == ('gcp_token_2', None)
+
+
+@patch('google.oauth2.service_account.Credentials.from_service_account_file')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+def test_get_gcp_token_expired(get_token, from_file, gcp_key_file, patch_ansible):
+    args = set_args_create_cloudmanager_connector_gcp()
+    args['service_account_path'] = gcp_key_file
+    set_module_args(args)
+    get_token.return_value = 'bearer', 'test'
+    from_file.side_effect = lambda path, scopes: MockCredentials()
+    MockCredentials.refresh_count = 0
+    my_obj = my_module()
+    assert my_obj.get_gcp_token() == ('gcp_token_1', None)
+    with patch('time.time') as mock_time:
+        mock_time.return_value = 4000000000
+        assert my_obj.get_gcp_token() == ('gcp_token_2', None)
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+def test_get_gcp_token_missing_file(get_token, gcp_key_file, patch_ansible):
+    args = set_args_create_cloudmanager_connector_gcp()
+    args['service_account_path'] = gcp_key_file + '.missing'
+    set_module_args(args)
+    get_token.return_value = 'bearer', 'test'
+    my_obj = my_module()
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_obj.set_gcp_token()
+    assert 'Error getting gcp token: ' in exc.value.args[0]['msg']
@@ -7,14 +7,18 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import gzip
 import json
 import sys
+import threading
+import time
 import pytest
 
 from ansible.module_utils import basic
 from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_columnar import FleetSnapshotReader
 from ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_info \
     import NetAppCloudmanagerInfo as my_module
 
@@ -589,3 +593,727 @@ def test_get_accounts_info(accounts_info, get_token, patch_ansible):
         my_obj.apply()
     print('Info: test_create_cloudmanager_info: %s' % repr(exc.value))
     assert not exc.value.args[0]['changed']
+
+
+WORKING_ENVIRONMENTS = {
+    "azureVsaWorkingEnvironments": [
+        {"name": "az%d" % index, "cloudProviderName": "Azure", "isHA": False, "publicId": "VsaWorkingEnvironment-az%d" % index}
+        for index in range(10)
+    ],
+    "gcpVsaWorkingEnvironments": [],
+    "onPremWorkingEnvironments": [],
+    "vsaWorkingEnvironments": [
+        {"name": "aws%d" % index, "cloudProviderName": "Amazon", "isHA": False, "publicId": "VsaWorkingEnvironment-aws%d" % index}
+        for index in range(10)
+    ]
+}
+
+
+def test_invalid_shard_index(patch_ansible):
+    args = dict(set_args_get_accounts_info())
+    args['shard_count'] = 2
+    args['shard_index'] = 2
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert exc.value.args[0]['msg'] == 'Error: shard_index must be between 0 and 1, found 2'
+
+
+def test_invalid_shard_count(patch_ansible):
+    args = dict(set_args_get_accounts_info())
+    args['shard_count'] = 0
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert exc.value.args[0]['msg'] == 'Error: shard_count must be at least 1, found 0'
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_shards_partition_working_environments(send_request, get_token, patch_ansible):
+    ''' each working environment is reported by exactly one shard, and aggregates are only fetched for this shard '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    we_ids = []
+    aggr_we_ids = []
+    for shard_index in range(3):
+        args = dict(set_args_get_cloudmanager_working_environments_info())
+        args['gather_subsets'] = ['working_environments_info', 'aggregates_info']
+        args['shard_count'] = 3
+        args['shard_index'] = shard_index
+        set_module_args(args)
+        my_obj = my_module()
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_obj.apply()
+        info = exc.value.args[0]['info']
+        assert exc.value.args[0]['shard'] == {'index': shard_index, 'count': 3}
+        # like the other helpers, working_environments_info returns a (response, error) tuple
+        shard_we_ids = [we['publicId'] for wes in info['working_environments_info'][0].values() for we in wes]
+        assert all(my_obj.in_shard(we) for wes in WORKING_ENVIRONMENTS.values() for we in wes if we['publicId'] in shard_we_ids)
+        we_ids.extend(shard_we_ids)
+        aggr_we_ids.extend(we_id for aggrs in info['aggregates_info'].values() for we_id in aggrs)
+    all_we_ids = [we['publicId'] for wes in WORKING_ENVIRONMENTS.values() for we in wes]
+    assert sorted(we_ids) == sorted(all_we_ids)
+    assert sorted(aggr_we_ids) == sorted(all_we_ids)
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_accounts_info')
+def test_tenant_subsets_only_in_first_shard(accounts_info, get_token, patch_ansible):
+    get_token.return_value = 'token_type', 'token'
+    accounts_info.return_value = {'awsAccounts': []}, None
+    for shard_index in range(2):
+        args = dict(set_args_get_accounts_info())
+        args['shard_count'] = 2
+        args['shard_index'] = shard_index
+        set_module_args(args)
+        my_obj = my_module()
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_obj.apply()
+        assert ('accounts_info' in exc.value.args[0]['info']) == (shard_index == 0)
+    assert accounts_info.call_count == 1
+
+
+def read_jsonl(path, compressed):
+    with (gzip.open(path, 'rb') if compressed else open(path, 'rb')) as fh:
+        return [json.loads(line.decode('utf-8')) for line in fh]
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_output_file(send_request, get_token, compressed, tmpdir, patch_ansible):
+    ''' records are written to a JSON Lines file, only a summary is returned '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    path = str(tmpdir.join('info.jsonl'))
+    args = dict(set_args_get_cloudmanager_working_environments_info())
+    args['gather_subsets'] = ['working_environments_info', 'aggregates_info', 'accounts_info']
+    args['output_file'] = path
+    args['output_compress'] = compressed
+    set_module_args(args)
+    my_obj = my_module()
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_obj.apply()
+    result = exc.value.args[0]
+    assert 'info' not in result
+    assert result['changed']
+    assert result['output'] == {
+        'path': path,
+        'compressed': compressed,
+        'records': {'working_environments_info': 20, 'aggregates_info': 20, 'accounts_info': 1}
+    }
+    records = read_jsonl(path, compressed)
+    assert len(records) == 41
+    assert records[0]['subset'] == 'working_environments_info'
+    assert records[0]['working_environment_id'] == records[0]['record']['publicId']
+    aggregates = [record for record in records if record['subset'] == 'aggregates_info']
+    assert aggregates[0]['working_environment_type'] == 'azureVsaWorkingEnvironments'
+    assert aggregates[0]['record'] == [{'name': '/occm/api/azure/vsa/aggregates/VsaWorkingEnvironment-az0'}]
+    assert records[-1] == {'subset': 'accounts_info', 'record': [[{'name': '/occm/api/accounts'}], None]}
+    assert [str(name) for name in tmpdir.listdir()] == [path]
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_output_file_check_mode(send_request, get_token, tmpdir, patch_ansible):
+    ''' records are counted, but the file is not written '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    args = dict(set_args_get_cloudmanager_working_environments_info())
+    args['gather_subsets'] = ['working_environments_info', 'accounts_info']
+    args['output_file'] = str(tmpdir.join('info.jsonl'))
+    args['_ansible_check_mode'] = True
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    result = exc.value.args[0]
+    assert result['changed']
+    assert result['output']['records'] == {'working_environments_info': 20, 'accounts_info': 1}
+    assert tmpdir.listdir() == []
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_output_file_error(send_request, get_token, tmpdir, patch_ansible):
+    get_token.return_value = 'token_type', 'token'
+    send_request.return_value = {}, None, None
+    args = dict(set_args_get_accounts_info())
+    args['output_file'] = str(tmpdir.join('missing_dir', 'info.jsonl'))
+    set_module_args(args)
+    my_obj = my_module()
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_obj.apply()
+    assert 'Error: writing to %s' % args['output_file'] in exc.value.args[0]['msg']
+
+
+@pytest.mark.parametrize('output_file', [False, True])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_subset_error_reported_from_main_thread(send_request, get_token, output_file, tmpdir, patch_ansible):
+    ''' subsets run in worker threads, which return their errors, fail_json is only called once, from the main thread '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else \
+        (None, 'server error', None) if 'aggregates' in api else ([{'name': api}], None, None)
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['aggregates_info', 'volumes_info', 'capacity_summary']
+    if output_file:
+        args['output_file'] = str(tmpdir.join('info.jsonl'))
+    set_module_args(args)
+    threads = []
+
+    def record_thread(*args, **kwargs):
+        threads.append(threading.current_thread())
+        fail_json(*args, **kwargs)
+
+    with patch.object(basic.AnsibleModule, 'fail_json', side_effect=record_thread):
+        with pytest.raises(AnsibleFailJson) as exc:
+            my_module().apply()
+    assert exc.value.args[0]['msg'] == 'Error: Failed to get aggregate list: server error'
+    assert threads == [threading.current_thread()]
+    assert tmpdir.listdir() == []
+
+
+@pytest.mark.parametrize('all_accounts', [False, True])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_agents_share_account_lookup(send_request, get_token, all_accounts, patch_ansible):
+    ''' the account and the agents are only fetched once for account_info, agents_info and active_agents_info '''
+    get_token.return_value = 'token_type', 'token'
+    accounts = [{'accountPublicId': 'account-1'}, {'accountPublicId': 'account-2'}]
+
+    def get(method, api, params=None, **kwargs):
+        if api == '/tenancy/account':
+            return accounts, None, None
+        agent_id = 'agent-%s' % params['account_id']
+        return {'agents': [{'name': agent_id, 'agentId': agent_id, 'provider': 'AWS', 'status': 'active'}]}, None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['account_info', 'agents_info', 'active_agents_info']
+    args['all_accounts'] = all_accounts
+    set_module_args(args)
+    my_obj = my_module()
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_obj.apply()
+    info = exc.value.args[0]['info']
+    agent_ids = ['agent-account-1', 'agent-account-2'] if all_accounts else ['agent-account-1']
+    assert info['account_info'] == (accounts, None)
+    assert [agent['agentId'] for agent in info['agents_info'][0]['agents']] == agent_ids
+    assert [agent['client_id'] for agent in info['active_agents_info'][0]] == agent_ids
+    if all_accounts:
+        assert [agent['accountId'] for agent in info['agents_info'][0]['agents']] == ['account-1', 'account-2']
+        assert [agent['account_id'] for agent in info['active_agents_info'][0]] == ['account-1', 'account-2']
+    else:
+        assert 'accountId' not in info['agents_info'][0]['agents'][0]
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert apis.count('/tenancy/account') == 1
+    assert apis.count('/agents-mgmt/agent') == len(agent_ids)
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_all_subsets_share_inputs(send_request, get_token, patch_ansible):
+    ''' with gather_subsets all, the working environments, the account and the agents are fetched once '''
+    get_token.return_value = 'token_type', 'token'
+    lock = threading.Lock()
+    threads = set()
+
+    def get(method, api, params=None, **kwargs):
+        with lock:
+            threads.add(threading.current_thread().name)
+        time.sleep(0.01)
+        if api == '/occm/api/working-environments':
+            return WORKING_ENVIRONMENTS, None, None
+        if api == '/tenancy/account':
+            return [{'accountPublicId': 'account-1'}], None, None
+        if api == '/agents-mgmt/agent':
+            return {'agents': [{'name': 'agent', 'agentId': 'agent', 'provider': 'AWS', 'status': 'active'}]}, None, None
+        return [{'name': api}], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['all']
+    set_module_args(args)
+    my_obj = my_module()
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_obj.apply()
+    info = exc.value.args[0]['info']
+    assert list(info) == [func for func in my_obj.methods if func not in my_obj.opt_in_subsets]
+    assert info['working_environments_info'] == (WORKING_ENVIRONMENTS, None)
+    assert len(info['aggregates_info']['vsaWorkingEnvironments']) == 10
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert apis.count('/occm/api/working-environments') == 1
+    assert apis.count('/tenancy/account') == 1
+    assert apis.count('/agents-mgmt/agent') == 1
+    assert len(threads) > 1
+
+
+@pytest.mark.parametrize('gather_subsets', [['all'], ['all', 'volumes_info'], ['all', 'snapmirror_info'], ['all', 'capacity_summary']])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+def test_all_excludes_opt_in_subsets(get_token, gather_subsets, patch_ansible):
+    ''' subsets sending a request per working environment are only collected when requested by name '''
+    get_token.return_value = 'token_type', 'token'
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = gather_subsets
+    set_module_args(args)
+    subsets = my_module().get_subsets()
+    assert 'aggregates_info' in subsets
+    for func in ('volumes_info', 'snapmirror_info', 'capacity_summary'):
+        assert (func in subsets) == (func in gather_subsets)
+
+
+def test_invalid_max_concurrent_subsets(patch_ansible):
+    args = dict(set_args_get_accounts_info())
+    args['max_concurrent_subsets'] = 0
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert exc.value.args[0]['msg'] == 'Error: max_concurrent_subsets must be at least 1, found 0'
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_since_snapshot(send_request, get_token, tmpdir, patch_ansible):
+    ''' only changes are reported, and aggregates are only fetched for working environments that changed '''
+    get_token.return_value = 'token_type', 'token'
+    working_environments = json.loads(json.dumps(WORKING_ENVIRONMENTS))
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (working_environments, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    args = dict(set_args_get_cloudmanager_working_environments_info())
+    args['gather_subsets'] = ['working_environments_info', 'aggregates_info', 'accounts_info']
+    args['since_snapshot'] = str(tmpdir.join('info.snapshot'))
+
+    def run():
+        send_request.reset_mock()
+        set_module_args(args)
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_module().apply()
+        return exc.value.args[0], [call[1]['api'] for call in send_request.call_args_list]
+
+    args['_ansible_check_mode'] = True
+    result, apis = run()
+    assert result['changed']
+    assert result['delta']['baseline']
+    # the snapshot is not written in check mode
+    assert tmpdir.listdir() == []
+    del args['_ansible_check_mode']
+    result, apis = run()
+    assert result['changed']
+    assert result['delta']['baseline']
+    assert result['delta']['counts']['working_environments_info'] == dict(added=20, changed=0, removed=0, unchanged=0, kept=0)
+    assert len(result['info']['aggregates_info']['added']) == 20
+    assert len(apis) == 22
+
+    # one working environment is modified, another one is deleted
+    working_environments['vsaWorkingEnvironments'][0]['status'] = 'OFF'
+    deleted = working_environments['vsaWorkingEnvironments'].pop()
+    result, apis = run()
+    info = result['info']
+    assert not result['delta']['baseline']
+    assert list(info['working_environments_info']['changed']) == ['VsaWorkingEnvironment-aws0']
+    assert info['working_environments_info']['removed'] == [deleted['publicId']]
+    assert info['working_environments_info']['added'] == {}
+    assert info['aggregates_info'] == dict(added={}, changed={}, removed=[deleted['publicId']])
+    assert info['accounts_info'] == dict(added={}, changed={}, removed=[])
+    assert result['delta']['counts']['aggregates_info'] == dict(added=0, changed=0, removed=1, unchanged=19, kept=0)
+    # only the modified working environment is fetched again, subsets run concurrently so the order may vary
+    assert sorted(apis) == ['/occm/api/accounts', '/occm/api/vsa/aggregates?workingEnvironmentId=VsaWorkingEnvironment-aws0',
+                            '/occm/api/working-environments']
+
+
+@patch('ansible.module_utils.basic.AnsibleModule.warn')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_since_snapshot_fetch_error(send_request, get_token, warn, tmpdir, patch_ansible):
+    ''' a working environment whose volumes cannot be fetched is neither removed now, nor added on the next run '''
+    get_token.return_value = 'token_type', 'token'
+    working_environments = json.loads(json.dumps(WORKING_ENVIRONMENTS))
+    failing = set()
+
+    def get(method, api, params=None, **kwargs):
+        if api == '/occm/api/working-environments':
+            return working_environments, None, None
+        if api.split('=')[-1] in failing:
+            return None, 'timeout', None
+        return [{'name': 'vol1'}], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_cloudmanager_working_environments_info())
+    args['gather_subsets'] = ['volumes_info']
+    args['since_snapshot'] = str(tmpdir.join('info.snapshot'))
+
+    def run():
+        set_module_args(args)
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_module().apply()
+        return exc.value.args[0]
+
+    run()
+    working_environments['vsaWorkingEnvironments'][0]['status'] = 'OFF'
+    failing.add('VsaWorkingEnvironment-aws0')
+    result = run()
+    assert result['info']['volumes_info'] == dict(added={}, changed={}, removed=[])
+    assert result['delta']['counts']['volumes_info'] == dict(added=0, changed=0, removed=0, unchanged=19, kept=1)
+    failing.clear()
+    result = run()
+    assert result['info']['volumes_info'] == dict(added={}, changed={}, removed=[])
+    assert result['delta']['counts']['volumes_info'] == dict(added=0, changed=0, removed=0, unchanged=20, kept=0)
+
+
+def test_since_snapshot_and_output_file(tmpdir, patch_ansible):
+    args = dict(set_args_get_accounts_info())
+    args['since_snapshot'] = str(tmpdir.join('info.snapshot'))
+    args['output_file'] = str(tmpdir.join('info.jsonl'))
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert exc.value.args[0]['msg'] == 'parameters are mutually exclusive: output_file|since_snapshot'
+
+
+@patch('ansible.module_utils.basic.AnsibleModule.warn')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_volumes_info(send_request, get_token, warn, patch_ansible):
+    ''' volumes are fetched concurrently for each working environment, including FSx, using the provider API root path '''
+    get_token.return_value = 'token_type', 'token'
+
+    def get(method, api, params=None, **kwargs):
+        if api == '/occm/api/working-environments':
+            return WORKING_ENVIRONMENTS, None, None
+        if api == '/fsx-ontap/working-environments/account-1':
+            return [{'name': 'fsx', 'id': 'fs-1'}], None, None
+        if api.endswith('VsaWorkingEnvironment-az3'):
+            return None, 'timeout', None
+        return [{'name': api, 'svmName': 'svm', 'size': {'size': 1, 'unit': 'GB'}}], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['volumes_info']
+    args['tenant_id'] = 'account-1'
+    args['volumes_fields'] = ['name', 'svmName']
+    args['volumes_timeout'] = 5
+    set_module_args(args)
+    my_obj = my_module()
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_obj.apply()
+    info = exc.value.args[0]['info']['volumes_info']
+    assert sorted(info) == ['azureVsaWorkingEnvironments', 'fsxWorkingEnvironments', 'gcpVsaWorkingEnvironments',
+                            'onPremWorkingEnvironments', 'vsaWorkingEnvironments']
+    assert info['fsxWorkingEnvironments'] == {'fs-1': [{'name': '/occm/api/fsx/volumes?fileSystemId=fs-1', 'svmName': 'svm'}]}
+    assert info['vsaWorkingEnvironments']['VsaWorkingEnvironment-aws1'] == [
+        {'name': '/occm/api/vsa/volumes?workingEnvironmentId=VsaWorkingEnvironment-aws1', 'svmName': 'svm'}]
+    assert info['azureVsaWorkingEnvironments']['VsaWorkingEnvironment-az1'] == [
+        {'name': '/occm/api/azure/vsa/volumes?workingEnvironmentId=VsaWorkingEnvironment-az1', 'svmName': 'svm'}]
+    # the working environment in error is skipped
+    assert len(info['azureVsaWorkingEnvironments']) == 9
+    warn.assert_called_once_with('Failed to get volumes_info for working environment VsaWorkingEnvironment-az3: timeout')
+    assert all(call[1]['timeout'] == 5 for call in send_request.call_args_list if 'volumes' in call[1]['api'])
+
+
+@pytest.mark.parametrize('with_relationships', [True, False])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_snapmirror_info(send_request, get_token, with_relationships, patch_ansible):
+    ''' replication status is fetched for each working environment, each relationship is only reported once '''
+    get_token.return_value = 'token_type', 'token'
+
+    def get(method, api, params=None, **kwargs):
+        if api == '/occm/api/working-environments':
+            return WORKING_ENVIRONMENTS, None, None
+        we_id = api.split('/')[-1]
+        index = int(we_id[-1])
+        if not we_id.startswith('VsaWorkingEnvironment-aws') or index % 2:
+            return [], None, None
+        # the relationship is reported for its source and its destination
+        relationship = dict(source=dict(workingEnvironmentId=we_id, svmName='svm', volumeName='vol'),
+                            destination=dict(workingEnvironmentId='VsaWorkingEnvironment-aws%d' % (index + 1), svmName='svm', volumeName='vol'),
+                            mirrorState='snapmirrored', policy='MirrorAllSnapshots', lagTime={'size': index, 'unit': 'hours'})
+        return [relationship, dict(relationship, source=dict(workingEnvironmentId='other'))], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['snapmirror_info']
+    args['snapmirror_lag_threshold'] = 3 * 3600
+    args['snapmirror_relationships'] = with_relationships
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    info = exc.value.args[0]['info']['snapmirror_info']
+    assert info['summary']['total'] == 5
+    # lag times are 0, 2, 4, 6, and 8 hours
+    assert info['summary']['lagging'] == 3
+    assert info['summary']['max_lag_seconds'] == 8 * 3600
+    assert info['summary']['policies'] == {'MirrorAllSnapshots': dict(count=5, unhealthy=0, lagging=3, max_lag_seconds=8 * 3600)}
+    if with_relationships:
+        assert [relationship['source_working_environment_id'] for relationship in info['relationships']] == \
+            ['VsaWorkingEnvironment-aws%d' % index for index in range(0, 10, 2)]
+    else:
+        assert 'relationships' not in info
+    assert len([call for call in send_request.call_args_list if 'replication/status' in call[1]['api']]) == 20
+
+
+@pytest.mark.parametrize('all_connectors', [False, True])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_multiple_connectors(send_request, get_token, all_connectors, patch_ansible):
+    ''' each connector reports its own working environments, which are queried through that connector '''
+    get_token.return_value = 'token_type', 'token'
+
+    def get(method, api, params=None, header=None, **kwargs):
+        connector = (header or {}).get('X-Agent-Id')
+        if api == '/tenancy/account':
+            return [{'accountPublicId': 'account-1'}], None, None
+        if api == '/agents-mgmt/agent':
+            return {'agents': [{'name': name, 'agentId': name, 'provider': 'AWS', 'status': status}
+                               for name, status in (('east', 'active'), ('west', 'active'), ('down', 'failed'))]}, None, None
+        if api == '/occm/api/working-environments':
+            return dict(vsaWorkingEnvironments=[{'name': connector, 'cloudProviderName': 'Amazon', 'isHA': False, 'publicId': 'we-%s' % connector}],
+                        azureVsaWorkingEnvironments=[]), None, None
+        return [{'name': api, 'connector': connector}], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['working_environments_info', 'aggregates_info']
+    if all_connectors:
+        del args['client_id']
+        args['all_connectors'] = True
+    else:
+        args['client_id'] = ['east', 'westclients', 'east']
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    result = exc.value.args[0]
+    assert result['connectors'] == {'eastclients': ['we-eastclients'], 'westclients': ['we-westclients']}
+    working_environments, error = result['info']['working_environments_info']
+    assert error is None
+    assert [we['publicId'] for we in working_environments['vsaWorkingEnvironments']] == ['we-eastclients', 'we-westclients']
+    assert working_environments['azureVsaWorkingEnvironments'] == []
+    aggregates = result['info']['aggregates_info']['vsaWorkingEnvironments']
+    assert aggregates['we-eastclients'][0]['connector'] == 'eastclients'
+    assert aggregates['we-westclients'][0]['connector'] == 'westclients'
+    # a single token is used for all connectors
+    assert get_token.call_count == 1
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert apis.count('/occm/api/working-environments') == 2
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_multiple_connectors_error(send_request, get_token, patch_ansible):
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, header=None, **kwargs: \
+        (None, 'unreachable', None) if header['X-Agent-Id'] == 'westclients' else (WORKING_ENVIRONMENTS, None, None)
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['aggregates_info']
+    args['client_id'] = ['east', 'west']
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module().apply()
+    assert exc.value.args[0]['msg'] == 'Error: Failed to get working environments: connector westclients: unreachable'
+
+
+@pytest.mark.parametrize('all_connectors', [False, True])
+def test_client_id_or_all_connectors(all_connectors, patch_ansible):
+    args = dict(set_args_get_accounts_info())
+    if not all_connectors:
+        del args['client_id']
+    args['all_connectors'] = all_connectors
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert exc.value.args[0]['msg'] == 'Error: exactly one of client_id or all_connectors is required'
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_filters_and_fields(send_request, get_token, patch_ansible):
+    ''' excluded working environments are not reported, and their aggregates are not fetched '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['working_environments_info', 'aggregates_info']
+    args['filters'] = dict(provider=['amazon'], name_regex='aws[0-2]$')
+    args['fields'] = ['name']
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    info = exc.value.args[0]['info']
+    working_environments, error = info['working_environments_info']
+    assert error is None
+    assert working_environments['vsaWorkingEnvironments'] == [
+        {'name': 'aws%d' % index, 'publicId': 'VsaWorkingEnvironment-aws%d' % index} for index in range(3)]
+    assert working_environments['azureVsaWorkingEnvironments'] == []
+    assert sorted(info['aggregates_info']['vsaWorkingEnvironments']) == ['VsaWorkingEnvironment-aws%d' % index for index in range(3)]
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert len(apis) == 4
+
+
+def test_invalid_filters(patch_ansible):
+    args = dict(set_args_get_accounts_info())
+    args['filters'] = dict(name_regex='[')
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module()
+    assert exc.value.args[0]['msg'].startswith('Error: invalid name_regex in filters: ')
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_capacity_summary(send_request, get_token, patch_ansible):
+    ''' aggregates and volumes are fetched once, and shared with aggregates_info '''
+    get_token.return_value = 'token_type', 'token'
+    gb = 1024 ** 3
+
+    def get(method, api, params=None, **kwargs):
+        if api == '/occm/api/working-environments':
+            return WORKING_ENVIRONMENTS, None, None
+        index = int(api[-1])
+        if 'aggregates' in api:
+            return [{'name': 'aggr1', 'totalCapacity': {'size': 100, 'unit': 'GB'}, 'usedCapacity': {'size': index * 10, 'unit': 'GB'},
+                     'providerVolumes': [{'diskType': 'gp3'}]}], None, None
+        return [{'name': 'vol1', 'svmName': 'svm', 'size': {'size': 10, 'unit': 'GB'}, 'usedSize': {'size': index, 'unit': 'GB'}}], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['capacity_summary', 'aggregates_info']
+    args['volumes_fields'] = ['name']
+    args['capacity_top'] = 3
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    info = exc.value.args[0]['info']
+    assert len(info['aggregates_info']['vsaWorkingEnvironments']) == 10
+    summary = info['capacity_summary']
+    assert summary['aggregates']['count'] == 20
+    assert summary['aggregates']['by_provider']['Amazon'] == dict(count=10, total_bytes=1000 * gb, used_bytes=450 * gb, available_bytes=550 * gb)
+    assert summary['aggregates']['utilization_percentiles']['p100'] == 90.0
+    assert [aggregate['working_environment_id'] for aggregate in summary['aggregates']['top']] == \
+        ['VsaWorkingEnvironment-az9', 'VsaWorkingEnvironment-aws9', 'VsaWorkingEnvironment-az8']
+    # volumes_fields does not apply to the volumes used for the summary
+    assert summary['volumes']['used_bytes'] == 90 * gb
+    assert summary['volumes']['by_tier'] == {'unknown': dict(count=20, total_bytes=200 * gb, used_bytes=90 * gb, available_bytes=110 * gb)}
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert len([api for api in apis if 'aggregates' in api]) == 20
+    assert len([api for api in apis if 'volumes' in api]) == 20
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_fleet_snapshot(send_request, get_token, tmpdir, patch_ansible):
+    ''' aggregates and volumes are fetched once, and shared with volumes_info '''
+    get_token.return_value = 'token_type', 'token'
+
+    def get(method, api, params=None, **kwargs):
+        if api == '/occm/api/working-environments':
+            return WORKING_ENVIRONMENTS, None, None
+        if 'aggregates' in api:
+            return [{'name': 'aggr1', 'totalCapacity': {'size': 100, 'unit': 'GB'}, 'usedCapacity': {'size': int(api[-1]) * 10, 'unit': 'GB'}}], None, None
+        return [{'name': 'vol_%s' % api.split('-')[-1], 'svmName': 'svm'}], None, None
+
+    send_request.side_effect = get
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['volumes_info']
+    args['fleet_snapshot'] = str(tmpdir.join('fleet.snapshot'))
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    result = exc.value.args[0]
+    assert len(result['info']['volumes_info']['vsaWorkingEnvironments']) == 10
+    assert result['changed']
+    assert result['fleet_snapshot'] == dict(path=args['fleet_snapshot'], rows=dict(working_environments=20, aggregates=20, volumes=20))
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert len([api for api in apis if 'volumes' in api]) == 20
+    with FleetSnapshotReader(args['fleet_snapshot']) as reader:
+        assert reader.find_volumes('vol_aws3')[0]['working_environment_id'] == 'VsaWorkingEnvironment-aws3'
+        assert [aggregate['working_environment_id'] for aggregate in reader.find_aggregates_over(80)] == \
+            ['VsaWorkingEnvironment-az9', 'VsaWorkingEnvironment-aws9']
+
+
+@pytest.mark.parametrize('gather_subsets', [['aggregates_info', 'capacity_summary'], ['capacity_summary', 'aggregates_info']])
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_output_file_shares_aggregates(send_request, get_token, gather_subsets, tmpdir, patch_ansible):
+    ''' aggregates written to output_file are fetched once, and shared with capacity_summary and fleet_snapshot '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = gather_subsets
+    args['output_file'] = str(tmpdir.join('info.jsonl'))
+    args['fleet_snapshot'] = str(tmpdir.join('fleet.snapshot'))
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    result = exc.value.args[0]
+    assert result['output']['records'] == {'aggregates_info': 20, 'capacity_summary': 1}
+    assert result['fleet_snapshot']['rows'] == dict(working_environments=20, aggregates=20, volumes=20)
+    apis = [call[1]['api'] for call in send_request.call_args_list]
+    assert len([api for api in apis if 'aggregates' in api]) == 20
+    assert len([api for api in apis if 'volumes' in api]) == 20
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_since_snapshot_capacity_summary(send_request, get_token, tmpdir, patch_ansible):
+    ''' aggregates fetched for the working environments that changed are reused, only the other ones are fetched for capacity_summary '''
+    get_token.return_value = 'token_type', 'token'
+    working_environments = json.loads(json.dumps(WORKING_ENVIRONMENTS))
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (working_environments, None, None) if api == '/occm/api/working-environments' else ([{'name': api}], None, None)
+    args = dict(set_args_get_accounts_info())
+    args['gather_subsets'] = ['aggregates_info', 'capacity_summary']
+    args['since_snapshot'] = str(tmpdir.join('info.snapshot'))
+
+    def run():
+        send_request.reset_mock()
+        set_module_args(args)
+        with pytest.raises(AnsibleExitJson) as exc:
+            my_module().apply()
+        return exc.value.args[0], [call[1]['api'] for call in send_request.call_args_list]
+
+    result, apis = run()
+    assert len([api for api in apis if 'aggregates' in api]) == 20
+    working_environments['vsaWorkingEnvironments'][0]['status'] = 'OFF'
+    result, apis = run()
+    assert list(result['info']['aggregates_info']['changed']) == []
+    aggregates_apis = [api for api in apis if 'aggregates' in api]
+    assert len(aggregates_apis) == 20
+    assert len(set(aggregates_apis)) == 20
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_fleet_snapshot_check_mode(send_request, get_token, tmpdir, patch_ansible):
+    ''' rows are counted, but the file is not written '''
+    get_token.return_value = 'token_type', 'token'
+    send_request.side_effect = lambda method, api, **kwargs: \
+        (WORKING_ENVIRONMENTS, None, None) if api == '/occm/api/working-environments' else ([{'name': 'object'}], None, None)
+    args = dict(set_args_get_accounts_info())
+    args['fleet_snapshot'] = str(tmpdir.join('fleet.snapshot'))
+    args['_ansible_check_mode'] = True
+    set_module_args(args)
+    with pytest.raises(AnsibleExitJson) as exc:
+        my_module().apply()
+    result = exc.value.args[0]
+    assert result['changed']
+    assert result['fleet_snapshot'] == dict(path=args['fleet_snapshot'], rows=dict(working_environments=20, aggregates=20, volumes=20))
+    assert tmpdir.listdir() == []
+
+
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+@patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+def test_fleet_snapshot_error(send_request, get_token, tmpdir, patch_ansible):
+    get_token.return_value = 'token_type', 'token'
+    send_request.return_value = {}, None, None
+    args = dict(set_args_get_accounts_info())
+    args['fleet_snapshot'] = str(tmpdir.join('missing', 'fleet.snapshot'))
+    set_module_args(args)
+    with pytest.raises(AnsibleFailJson) as exc:
+        my_module().apply()
+    assert exc.value.args[0]['msg'].startswith('Error: writing to %s: ' % args['fleet_snapshot'])
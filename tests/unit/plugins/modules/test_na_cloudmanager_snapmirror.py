@@ -8,7 +8,9 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 import json
+import shutil
 import sys
+import tempfile
 import pytest
 
 from ansible.module_utils import basic
@@ -16,6 +18,7 @@ from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat import unittest
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_cache
 from ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror \
     import NetAppCloudmanagerSnapmirror as my_module
 
@@ -59,6 +62,11 @@ class TestMyModule(unittest.TestCase):
                                                  fail_json=fail_json)
         self.mock_module_helper.start()
         self.addCleanup(self.mock_module_helper.stop)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mock_cache_dir = patch.object(netapp_cache, 'CACHE_DIR', cache_dir)
+        self.mock_cache_dir.start()
+        self.addCleanup(self.mock_cache_dir.stop)
 
     def set_default_args_pass_check(self):
         return dict({
@@ -155,6 +163,39 @@ class TestMyModule(unittest.TestCase):
         print('Info: test_create_cloudmanager_snapmirror_create_pass: %s' % repr(exc.value))
         assert exc.value.args[0]['changed']
 
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_working_environment_detail_for_snapmirror')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.wait_on_completion')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror.NetAppCloudmanagerSnapmirror.get_snapmirror')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror.NetAppCloudmanagerSnapmirror.build_quote_request')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror.NetAppCloudmanagerSnapmirror.quote_volume')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror.NetAppCloudmanagerSnapmirror.get_volumes')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_create_task_failure_invalidates_interclusterlifs(self, send_request, get_volumes, quote_volume, build_quote_request,
+                                                              get_snapmirror, wait_on_completion, get_working_environment_detail_for_snapmirror, get_token):
+        ''' a failed create task may be due to stale LIFs, they are fetched again by the next task '''
+        args = self.set_args_create_cloudmanager_snapmirror()
+        args['intercluster_lifs_cache_ttl'] = 3600
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        interclusterlifs_resp = {'interClusterLifs': [{'address': '10.10.10.10'}], 'peerInterClusterLifs': [{'address': '10.10.10.11'}]}
+        get_working_environment_detail_for_snapmirror.return_value = \
+            {'publicId': 'test1', 'workingEnvironmentType': 'AMAZON'}, {'publicId': 'test2', 'workingEnvironmentType': 'AMAZON', 'svmName': 'svm'}, None
+        send_request.side_effect = lambda method, api, *args, **kwargs: \
+            (interclusterlifs_resp, None, None) if 'intercluster-lifs' in api else ({'id': 'abcdefg12345'}, None, 'task1')
+        wait_on_completion.return_value = 'Failed to create snapmirror, error: peering failed'
+        get_snapmirror.return_value = None
+        get_volumes.return_value = [{'name': 'source', 'svmName': 'source_svm', 'providerVolumeType': 'abc'}]
+        build_quote_request.return_value = {'name': 'test'}
+        quote_volume.return_value = {'numOfDisks': 10, 'aggregateName': 'aggr1'}
+
+        with pytest.raises(AnsibleFailJson) as exc:
+            my_module().apply()
+        assert exc.value.args[0]['msg'] == 'Failed to create snapmirror, error: peering failed'
+        send_request.reset_mock()
+        assert my_module().get_interclusterlifs('test1', 'test2') == interclusterlifs_resp
+        assert send_request.call_count == 1
+
     @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
     @patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror.NetAppCloudmanagerSnapmirror.get_snapmirror')
     @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
@@ -174,3 +215,62 @@ class TestMyModule(unittest.TestCase):
             my_obj.apply()
         print('Info: test_delete_cloudmanager_snapmirror_delete_pass: %s' % repr(exc.value))
         assert exc.value.args[0]['changed']
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp_module.NetAppModule.get_working_environment_detail_for_snapmirror')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_get_snapmirror_matches_svm_and_working_environment(self, send_request, get_working_environment_detail_for_snapmirror, get_token):
+        set_module_args(self.set_args_create_cloudmanager_snapmirror())
+        get_token.return_value = 'test', 'test'
+        my_obj = my_module()
+        source_we_info = {'publicId': 'test1', 'workingEnvironmentType': 'AMAZON'}
+        dest_we_info = {'publicId': 'test2', 'workingEnvironmentType': 'AMAZON', 'svmName': 'dest_svm', 'cloudProviderName': 'Amazon'}
+        get_working_environment_detail_for_snapmirror.return_value = source_we_info, dest_we_info, None
+        status = [
+            {'destination': {'volumeName': 'dest', 'svmName': 'other_svm', 'workingEnvironmentId': 'test2'}},
+            {'destination': {'volumeName': 'dest', 'svmName': 'dest_svm', 'workingEnvironmentId': 'test3'}},
+            {'destination': {'volumeName': 'other', 'svmName': 'dest_svm', 'workingEnvironmentId': 'test2'}},
+        ]
+        send_request.return_value = status, None, None
+        assert my_obj.get_snapmirror() is None
+        status.append({'destination': {'volumeName': 'dest', 'svmName': 'dest_svm', 'workingEnvironmentId': 'test2'}})
+        assert my_obj.get_snapmirror() == {
+            'source_working_environment_id': 'test1',
+            'destination_svm_name': 'dest_svm',
+            'destination_working_environment_id': 'test2',
+            'cloud_provider_name': 'Amazon'}
+        # the working environments are only looked up once
+        assert get_working_environment_detail_for_snapmirror.call_count == 1
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_get_interclusterlifs_cached(self, send_request, get_token):
+        args = self.set_args_create_cloudmanager_snapmirror()
+        args['intercluster_lifs_cache_ttl'] = 3600
+        set_module_args(args)
+        get_token.return_value = 'test', 'test'
+        interclusterlifs_resp = {'interClusterLifs': [{'address': '10.10.10.10'}], 'peerInterClusterLifs': [{'address': '10.10.10.11'}]}
+        send_request.return_value = interclusterlifs_resp, None, None
+        assert my_module().get_interclusterlifs('test1', 'test2') == interclusterlifs_resp
+        # a second task between the same clusters uses the cache
+        assert my_module().get_interclusterlifs('test1', 'test2') == interclusterlifs_resp
+        assert send_request.call_count == 1
+        # a different pair is not cached
+        assert my_module().get_interclusterlifs('test2', 'test1') == interclusterlifs_resp
+        assert send_request.call_count == 2
+        my_obj = my_module()
+        my_obj.delete_cached_interclusterlifs('test1', 'test2')
+        assert my_obj.get_interclusterlifs('test1', 'test2') == interclusterlifs_resp
+        assert send_request.call_count == 3
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_get_interclusterlifs_no_cache(self, send_request, get_token):
+        ''' the cache is disabled by default '''
+        set_module_args(self.set_args_create_cloudmanager_snapmirror())
+        get_token.return_value = 'test', 'test'
+        send_request.return_value = {'interClusterLifs': [], 'peerInterClusterLifs': []}, None, None
+        my_obj = my_module()
+        my_obj.get_interclusterlifs('test1', 'test2')
+        my_obj.get_interclusterlifs('test1', 'test2')
+        assert send_request.call_count == 2
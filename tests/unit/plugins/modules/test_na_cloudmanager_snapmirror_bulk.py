@@ -0,0 +1,308 @@
+# (c) 2022, NetApp, Inc
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+''' unit tests Cloudmanager Ansible module: na_cloudmanager_snapmirror_bulk '''
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import pytest
+
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+from ansible_collections.netapp.cloudmanager.tests.unit.compat import unittest
+from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
+import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_cache
+from ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror_bulk \
+    import NetAppCloudmanagerSnapmirrorBulk as my_module, TaskPoller
+
+if not netapp_utils.HAS_REQUESTS and sys.version_info < (3, 5):
+    pytestmark = pytest.mark.skip('skipping as missing required imports on 2.6 and 2.7')
+
+
+def set_module_args(args):
+    '''prepare arguments so that they will be picked up during module creation'''
+    args = json.dumps({'ANSIBLE_MODULE_ARGS': args})
+    basic._ANSIBLE_ARGS = to_bytes(args)  # pylint: disable=protected-access
+
+
+class AnsibleExitJson(Exception):
+    '''Exception class to be raised by module.exit_json and caught by the test case'''
+
+
+class AnsibleFailJson(Exception):
+    '''Exception class to be raised by module.fail_json and caught by the test case'''
+
+
+def exit_json(*args, **kwargs):  # pylint: disable=unused-argument
+    '''function to patch over exit_json; package return data into an exception'''
+    if 'changed' not in kwargs:
+        kwargs['changed'] = False
+    raise AnsibleExitJson(kwargs)
+
+
+def fail_json(*args, **kwargs):  # pylint: disable=unused-argument
+    '''function to patch over fail_json; package return data into an exception'''
+    kwargs['failed'] = True
+    raise AnsibleFailJson(kwargs)
+
+
+WORKING_ENVIRONMENTS = {
+    'vsaWorkingEnvironments': [
+        {'name': 'source', 'publicId': 'VsaWorkingEnvironment-src', 'cloudProviderName': 'Amazon', 'isHA': False,
+         'svmName': 'svm_source', 'workingEnvironmentType': 'VSA'},
+        {'name': 'dest1', 'publicId': 'VsaWorkingEnvironment-dst1', 'cloudProviderName': 'Amazon', 'isHA': False,
+         'svmName': 'svm_dest1', 'workingEnvironmentType': 'VSA'},
+        {'name': 'dest2', 'publicId': 'VsaWorkingEnvironment-dst2', 'cloudProviderName': 'Amazon', 'isHA': False,
+         'svmName': 'svm_dest2', 'workingEnvironmentType': 'VSA'},
+    ],
+    'onPremWorkingEnvironments': [],
+}
+
+SOURCE_VOLUMES = [
+    dict(name='vol%d' % index, svmName='svm_source', size={'size': 10, 'unit': 'GB'}, snapshotPolicy='default', deduplication=True,
+         thinProvisioning=True, compression=False, aggregateName='aggr1', providerVolumeType='gp3')
+    for index in range(4)
+]
+
+STATUS = [
+    {'destination': {'volumeName': 'vol0_copy', 'svmName': 'svm_dest1', 'workingEnvironmentId': 'VsaWorkingEnvironment-dst1'}},
+]
+
+
+class MockCloudManager(object):
+    ''' route requests by method and path, and record them '''
+
+    def __init__(self, create_delay=0, create_error=None, task_error=None):
+        self.calls = []
+        self.task_error = task_error
+        self.lock = threading.Lock()
+        self.create_delay = create_delay
+        self.create_error = create_error
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.tasks = 0
+
+    def count(self, method, path):
+        return len([call for call in self.calls if call[0] == method and path in call[1]])
+
+    def send_request(self, method, api, params, json=None, data=None, header=None, authorized=True, timeout=None):
+        with self.lock:
+            self.calls.append((method, api, json))
+        if method == 'GET' and api == '/occm/api/working-environments':
+            return WORKING_ENVIRONMENTS, None, None
+        if method == 'GET' and api.startswith('/occm/api/replication/status/'):
+            return STATUS, None, None
+        if method == 'GET' and api.startswith('/occm/api/replication/intercluster-lifs'):
+            return {'interClusterLifs': [{'address': '10.0.0.1'}], 'peerInterClusterLifs': [{'address': '10.0.0.2'}]}, None, None
+        if method == 'GET' and '/volumes?' in api:
+            return SOURCE_VOLUMES, None, None
+        if method == 'GET' and '/aggregates' in api:
+            return [{'name': 'aggr1', 'providerVolumes': [{'diskType': 'gp3', 'iops': 3000, 'throughput': 125}]}], None, None
+        if method == 'GET' and api.startswith('/occm/api/audit/activeTask/'):
+            if self.task_error is not None and api.endswith(self.task_error):
+                return {'status': -1, 'error': 'peering failed'}, None, None
+            return {'status': 1, 'error': None}, None, None
+        if method == 'POST' and api.endswith('/volumes/quote'):
+            return {'numOfDisks': 1, 'aggregateName': 'aggr1'}, None, self.new_task()
+        if method == 'POST' and api.startswith('/occm/api/replication/'):
+            if self.create_error is not None:
+                return 'error', self.create_error, None
+            dest = json['replicationRequest']['destinationWorkingEnvironmentId']
+            with self.lock:
+                self.in_flight[dest] = self.in_flight.get(dest, 0) + 1
+                self.max_in_flight[dest] = max(self.max_in_flight.get(dest, 0), self.in_flight[dest])
+            time.sleep(self.create_delay)
+            with self.lock:
+                self.in_flight[dest] -= 1
+            return None, None, self.new_task()
+        if method == 'DELETE':
+            return None, None, None
+        return None, 'unexpected request: %s %s' % (method, api), None
+
+    def new_task(self):
+        with self.lock:
+            self.tasks += 1
+            return 'task-%d' % self.tasks
+
+
+class TestMyModule(unittest.TestCase):
+    ''' a group of related Unit Tests '''
+
+    def setUp(self):
+        self.mock_module_helper = patch.multiple(basic.AnsibleModule,
+                                                 exit_json=exit_json,
+                                                 fail_json=fail_json)
+        self.mock_module_helper.start()
+        self.addCleanup(self.mock_module_helper.stop)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mock_cache_dir = patch.object(netapp_cache, 'CACHE_DIR', cache_dir)
+        self.mock_cache_dir.start()
+        self.addCleanup(self.mock_cache_dir.stop)
+        self.mock_get_token = patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token',
+                                    return_value=('test', 'test'))
+        self.mock_get_token.start()
+        self.addCleanup(self.mock_get_token.stop)
+
+    def run_module(self, args, cloud_manager, exception=AnsibleExitJson):
+        set_module_args(args)
+        with patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request',
+                   side_effect=cloud_manager.send_request):
+            with pytest.raises(exception) as exc:
+                my_module().apply()
+        return exc.value.args[0]
+
+    @staticmethod
+    def relationships(count, state='present', dest='dest1'):
+        return [dict(state=state, source_working_environment_name='source', destination_working_environment_name=dest,
+                     source_volume_name='vol%d' % index, destination_volume_name='vol%d_copy' % index)
+                for index in range(count)]
+
+    def default_args(self, relationships):
+        return dict(relationships=relationships, client_id='client_id', refresh_token='refresh_token', wait_interval=0)
+
+    def test_module_fail_when_required_args_missing(self):
+        ''' required arguments are reported as errors '''
+        with pytest.raises(AnsibleFailJson) as exc:
+            set_module_args({})
+            my_module()
+        print('Info: %s' % exc.value.args[0]['msg'])
+
+    def test_create_fetches_once_per_group(self):
+        cloud_manager = MockCloudManager()
+        result = self.run_module(self.default_args(self.relationships(4)), cloud_manager)
+        assert result['changed']
+        assert [entry['action'] for entry in result['relationships']] == [None, 'create', 'create', 'create']
+        assert all(entry['error'] is None for entry in result['relationships'])
+        assert cloud_manager.count('GET', '/occm/api/working-environments') == 1
+        assert cloud_manager.count('GET', '/occm/api/replication/status/') == 1
+        assert cloud_manager.count('GET', '/occm/api/replication/intercluster-lifs') == 1
+        assert cloud_manager.count('GET', '/volumes?') == 1
+        assert cloud_manager.count('GET', '/aggregates') == 1
+        assert cloud_manager.count('POST', '/volumes/quote') == 3
+        assert cloud_manager.count('POST', '/occm/api/replication/vsa') == 3
+        create = [call[2] for call in cloud_manager.calls if call[0] == 'POST' and call[1] == '/occm/api/replication/vsa'][0]
+        assert create['replicationVolume']['destinationSvmName'] == 'svm_dest1'
+        assert create['replicationVolume']['destinationCapacityTier'] == 'S3'
+        assert create['replicationVolume']['iops'] == 3000
+        assert create['replicationRequest']['sourceInterclusterLifIps'] == ['10.0.0.1']
+        assert create['replicationRequest']['maxTransferRate'] == 100000
+
+    def test_create_check_mode(self):
+        cloud_manager = MockCloudManager()
+        args = self.default_args(self.relationships(2))
+        args['_ansible_check_mode'] = True
+        result = self.run_module(args, cloud_manager)
+        assert result['changed']
+        assert [entry['action'] for entry in result['relationships']] == [None, 'create']
+        assert cloud_manager.count('POST', '/') == 0
+
+    def test_idempotent(self):
+        cloud_manager = MockCloudManager()
+        result = self.run_module(self.default_args(self.relationships(1)), cloud_manager)
+        assert not result['changed']
+        # volumes and aggregates are only needed to create a relationship
+        assert cloud_manager.count('GET', '/volumes?') == 0
+
+    def test_delete(self):
+        cloud_manager = MockCloudManager()
+        result = self.run_module(self.default_args(self.relationships(2, state='absent')), cloud_manager)
+        assert result['changed']
+        assert [entry['action'] for entry in result['relationships']] == ['delete', None]
+        assert cloud_manager.count('DELETE', '/occm/api/replication/VsaWorkingEnvironment-dst1/svm_dest1/vol0_copy') == 1
+
+    def test_concurrency_per_destination(self):
+        cloud_manager = MockCloudManager(create_delay=0.05)
+        relationships = self.relationships(4) + self.relationships(4, dest='dest2')
+        args = self.default_args(relationships)
+        args['max_concurrent_per_destination'] = 2
+        result = self.run_module(args, cloud_manager)
+        assert result['changed']
+        assert cloud_manager.count('POST', '/occm/api/replication/vsa') == 7
+        assert cloud_manager.count('GET', '/occm/api/replication/intercluster-lifs') == 2
+        assert cloud_manager.max_in_flight['VsaWorkingEnvironment-dst1'] <= 2
+        assert cloud_manager.max_in_flight['VsaWorkingEnvironment-dst2'] <= 2
+
+    def test_create_error(self):
+        cloud_manager = MockCloudManager(create_error='400')
+        result = self.run_module(self.default_args(self.relationships(3)), cloud_manager, AnsibleFailJson)
+        assert result['msg'].startswith('Error: 2 of 2 snapmirror operations failed: Error creating snapmirror relationship 400')
+        assert not result['changed']
+        assert result['relationships'][0]['error'] is None
+        assert result['relationships'][1]['error'] == 'Error creating snapmirror relationship 400: error.'
+
+    def test_create_task_error_invalidates_interclusterlifs(self):
+        # task-1 is the quote, task-2 the create
+        cloud_manager = MockCloudManager(task_error='task-2')
+        args = self.default_args(self.relationships(2))
+        args['intercluster_lifs_cache_ttl'] = 3600
+        result = self.run_module(args, cloud_manager, AnsibleFailJson)
+        assert result['relationships'][1]['error'] == 'Failed to create snapmirror, error: peering failed'
+        self.run_module(args, cloud_manager, AnsibleExitJson)
+        assert cloud_manager.count('GET', '/occm/api/replication/intercluster-lifs') == 2
+
+    def test_interclusterlifs_cache(self):
+        ''' the LIFs are only cached across runs when intercluster_lifs_cache_ttl is set '''
+        cloud_manager = MockCloudManager()
+        args = self.default_args(self.relationships(2))
+        self.run_module(args, cloud_manager)
+        self.run_module(args, cloud_manager)
+        assert cloud_manager.count('GET', '/occm/api/replication/intercluster-lifs') == 2
+        args['intercluster_lifs_cache_ttl'] = 3600
+        self.run_module(args, cloud_manager)
+        self.run_module(args, cloud_manager)
+        assert cloud_manager.count('GET', '/occm/api/replication/intercluster-lifs') == 3
+
+    def test_working_environment_not_found(self):
+        cloud_manager = MockCloudManager()
+        relationships = self.relationships(1, dest='unknown')
+        result = self.run_module(self.default_args(relationships), cloud_manager, AnsibleFailJson)
+        assert result['msg'] == 'Error: cannot find destination working environment unknown'
+
+    def test_invalid_concurrency(self):
+        args = self.default_args(self.relationships(1))
+        args['max_concurrent_per_destination'] = 0
+        result = self.run_module(args, MockCloudManager(), AnsibleFailJson)
+        assert result['msg'] == 'Error: max_concurrent_per_destination must be at least 1, found 0'
+
+    def test_missing_futures(self):
+        with patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_snapmirror_bulk.HAS_FUTURES', False):
+            result = self.run_module(self.default_args(self.relationships(1)), MockCloudManager(), AnsibleFailJson)
+        assert 'futures' in result['msg']
+
+    def test_poll_error_releases_workers(self):
+        cloud_manager = MockCloudManager()
+        with patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.check_task_status',
+                   side_effect=KeyError('status')):
+            with pytest.raises(KeyError):
+                self.run_module(self.default_args(self.relationships(2)), cloud_manager)
+
+
+class TestTaskPoller(unittest.TestCase):
+    ''' workers waiting on the poller are always released '''
+
+    def test_wait_timeout(self):
+        poller = TaskPoller(None, 0)
+        assert poller.wait('task-1', 'snapmirror', 'create', interval=0.01) == 'Taking too long for snapmirror to create or not properly setup'
+        assert poller.pending == {}
+
+    def test_cancel(self):
+        poller = TaskPoller(None, 60)
+        results = []
+        worker = threading.Thread(target=lambda: results.append(poller.wait('task-1', 'snapmirror', 'create')))
+        worker.start()
+        while not poller.pending:
+            time.sleep(0.01)
+        poller.cancel('Error: cancelled')
+        worker.join(5)
+        assert results == ['Error: cancelled']
+        assert poller.pending == {}
@@ -6,7 +6,9 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 import json
+import shutil
 import sys
+import tempfile
 import pytest
 
 from ansible.module_utils import basic
@@ -14,6 +16,7 @@ from ansible.module_utils._text import to_bytes
 from ansible_collections.netapp.cloudmanager.tests.unit.compat import unittest
 from ansible_collections.netapp.cloudmanager.tests.unit.compat.mock import patch
 import ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp as netapp_utils
+from ansible_collections.netapp.cloudmanager.plugins.module_utils import netapp_cache
 from ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_volume \
     import NetAppCloudmanagerVolume as my_module
 
@@ -66,6 +69,11 @@ class TestMyModule(unittest.TestCase):
                                                  fail_json=fail_json)
         self.mock_module_helper.start()
         self.addCleanup(self.mock_module_helper.stop)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mock_cache_dir = patch.object(netapp_cache, 'CACHE_DIR', cache_dir)
+        self.mock_cache_dir.start()
+        self.addCleanup(self.mock_cache_dir.stop)
 
     def set_default_args_pass_check(self):
         return dict({
@@ -214,3 +222,113 @@ class TestMyModule(unittest.TestCase):
         with pytest.raises(AnsibleExitJson) as exc:
             obj.apply()
         assert exc.value.args[0]['changed']
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_get_volume_filtered_by_name(self, send_request, get_token):
+        set_module_args(self.set_default_args_pass_check())
+        volume = dict(name='testvol', deduplication=True, thinProvisioning=True, compression=False, size={'size': 10, 'unit': 'GB'},
+                      tieringPolicy='auto', svmName='svm_justinaws', uuid='not projected')
+        send_request.side_effect = [
+            ({'publicId': 'id', 'svmName': 'svm_name', 'cloudProviderName': "aws", 'isHA': False}, None, None),
+            ([volume], None, None),
+        ]
+        get_token.return_value = ("type", "token")
+        obj = my_module()
+        obj.rest_api.api_root_path = "test_root_path"
+        assert obj.get_volume() == {'name': 'testvol', 'enable_deduplication': True, 'enable_thin_provisioning': True,
+                                    'enable_compression': False, 'size': 10, 'size_unit': 'GB', 'tiering_policy': 'auto'}
+        assert send_request.call_args[0][1] == 'test_root_path/volumes?workingEnvironmentId=id&name=testvol'
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.modules.na_cloudmanager_volume.NetAppCloudmanagerVolume.delete_volume')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_fsx_volume_index(self, send_request, get_token, delete):
+        args = self.set_default_args_pass_check()
+        args['volume_index_cache_ttl'] = 60
+        args['state'] = 'absent'
+        set_module_args(args)
+        volumes = [dict(name=name, deduplication=True, thinProvisioning=True, compression=False, size={'size': 10, 'unit': 'GB'}, tieringPolicy='auto')
+                   for name in ('vol0', 'vol1', 'vol2', 'testvol')]
+        send_request.side_effect = [
+            ({'publicId': 'id', 'svmName': 'svm_name', 'cloudProviderName': "aws", 'isHA': False}, None, None),
+            (volumes, None, None),
+            (volumes[:3], None, None),
+        ]
+        get_token.return_value = ("type", "token")
+        obj = my_module()
+        obj.rest_api.api_root_path = "/occm/api/fsx"
+        obj.is_fsx = True
+        obj.parameters['working_environment_id'] = 'fs-1'
+        # the index is built once, and shared across tasks
+        assert obj.get_volume()['name'] == 'testvol'
+        assert send_request.call_args[0][1] == '/occm/api/fsx/volumes?fileSystemId=fs-1'
+        assert obj.get_volume()['name'] == 'testvol'
+        assert send_request.call_count == 2
+        with pytest.raises(AnsibleExitJson) as exc:
+            obj.apply()
+        assert exc.value.args[0]['changed']
+        assert send_request.call_count == 2
+        assert delete.call_count == 1
+        # the index is rebuilt after the volume is deleted
+        assert obj.get_volume() is None
+        assert send_request.call_count == 3
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.wait_on_completion')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_create_volume_reuses_quote(self, send_request, get_token, wait_on_completion):
+        args = self.set_default_args_pass_check()
+        args['quote_cache_ttl'] = 60
+        set_module_args(args)
+        send_request.side_effect = [
+            ({'publicId': 'id', 'svmName': 'svm_name', 'cloudProviderName': "Amazon", 'isHA': False}, None, None),
+            ({'newAggregate': False, 'aggregateName': 'aggr1', 'numOfDisks': 0}, None, None),
+            (None, None, 'task-1'),
+            (None, None, 'task-2'),
+        ]
+        get_token.return_value = ("type", "token")
+        wait_on_completion.return_value = None
+        obj = my_module()
+        obj.create_volume()
+        # a volume of a similar size reuses the quote
+        obj.parameters['size'] = 15
+        obj.create_volume()
+        calls = [(call[0][0], call[0][1]) for call in send_request.call_args_list[1:]]
+        assert calls == [('POST', '/occm/api/vsa/volumes/quote'),
+                         ('POST', '/occm/api/vsa/volumes?createAggregateIfNotFound=True'),
+                         ('POST', '/occm/api/vsa/volumes?createAggregateIfNotFound=True')]
+        assert send_request.call_args[0][3]['aggregateName'] == 'aggr1'
+        assert send_request.call_args[0][3]['maxNumOfDisksApprovedToAdd'] == 0
+
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.wait_on_completion')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.get_token')
+    @patch('ansible_collections.netapp.cloudmanager.plugins.module_utils.netapp.CloudManagerRestAPI.send_request')
+    def test_create_volume_skips_quote(self, send_request, get_token, wait_on_completion):
+        args = self.set_default_args_pass_check()
+        args['quote_cache_ttl'] = 60
+        args['aggregate_name'] = 'aggr1'
+        args['size'] = 300
+        set_module_args(args)
+        aggregates = [{'name': 'aggr1', 'availableCapacity': {'size': 0.5, 'unit': 'TB'}},
+                      {'name': 'aggr2', 'availableCapacity': {'size': 10, 'unit': 'GB'}}]
+        send_request.side_effect = [
+            ({'publicId': 'id', 'svmName': 'svm_name', 'cloudProviderName': "Amazon", 'isHA': False}, None, None),
+            (aggregates, None, None),
+            (None, None, 'task-1'),
+            ({'newAggregate': False, 'aggregateName': 'aggr1', 'numOfDisks': 1}, None, None),
+            (None, None, 'task-2'),
+        ]
+        get_token.return_value = ("type", "token")
+        wait_on_completion.return_value = None
+        obj = my_module()
+        obj.create_volume()
+        # 512 - 300 GB are left, the second volume is quoted
+        obj.create_volume()
+        calls = [(call[0][0], call[0][1]) for call in send_request.call_args_list[1:]]
+        assert calls == [('GET', '/occm/api/vsa/aggregates?workingEnvironmentId=id'),
+                         ('POST', '/occm/api/vsa/volumes?createAggregateIfNotFound=False'),
+                         ('POST', '/occm/api/vsa/volumes/quote'),
+                         ('POST', '/occm/api/vsa/volumes?createAggregateIfNotFound=False')]
+        assert send_request.call_args_list[2][0][3]['maxNumOfDisksApprovedToAdd'] == 0
+        assert send_request.call_args[0][3]['maxNumOfDisksApprovedToAdd'] == 1